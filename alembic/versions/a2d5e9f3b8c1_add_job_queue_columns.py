@@ -0,0 +1,39 @@
+"""add job queue columns to bot runs
+
+Revision ID: a2d5e9f3b8c1
+Revises: f1c4d8e2a7b9
+Create Date: 2026-10-19 18:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a2d5e9f3b8c1"
+down_revision: Union[str, Sequence[str], None] = "f1c4d8e2a7b9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("ai_bot_runs", sa.Column("job_type", sa.String(length=50), nullable=True))
+    op.add_column("ai_bot_runs", sa.Column("job_args", sa.JSON(), nullable=True))
+    op.add_column("ai_bot_runs", sa.Column("lease_owner", sa.String(length=100), nullable=True))
+    op.add_column("ai_bot_runs", sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("ai_bot_runs", sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("ai_bot_runs", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.create_index(op.f("ix_bot_runs_job_type"), "ai_bot_runs", ["job_type"], unique=False)
+    op.create_index(op.f("ix_bot_runs_lease_expires_at"), "ai_bot_runs", ["lease_expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_bot_runs_lease_expires_at"), table_name="ai_bot_runs")
+    op.drop_index(op.f("ix_bot_runs_job_type"), table_name="ai_bot_runs")
+    op.drop_column("ai_bot_runs", "attempts")
+    op.drop_column("ai_bot_runs", "heartbeat_at")
+    op.drop_column("ai_bot_runs", "lease_expires_at")
+    op.drop_column("ai_bot_runs", "lease_owner")
+    op.drop_column("ai_bot_runs", "job_args")
+    op.drop_column("ai_bot_runs", "job_type")
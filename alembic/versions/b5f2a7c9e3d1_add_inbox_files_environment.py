@@ -0,0 +1,28 @@
+"""add environment to inbox files manifest
+
+Revision ID: b5f2a7c9e3d1
+Revises: d8b3f5a1c6e2
+Create Date: 2026-10-19 23:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b5f2a7c9e3d1"
+down_revision: Union[str, Sequence[str], None] = "d8b3f5a1c6e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows keep NULL: their outcomes no longer skip files in either environment
+    op.add_column("ai_bot_inbox_files", sa.Column("environment", sa.String(length=20), nullable=True))
+    op.create_index(op.f("ix_ai_bot_inbox_files_environment"), "ai_bot_inbox_files", ["environment"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_ai_bot_inbox_files_environment"), table_name="ai_bot_inbox_files")
+    op.drop_column("ai_bot_inbox_files", "environment")
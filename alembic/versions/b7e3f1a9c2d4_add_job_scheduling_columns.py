@@ -0,0 +1,31 @@
+"""add job scheduling columns to bot runs
+
+Revision ID: b7e3f1a9c2d4
+Revises: a2d5e9f3b8c1
+Create Date: 2026-10-19 19:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e3f1a9c2d4"
+down_revision: Union[str, Sequence[str], None] = "a2d5e9f3b8c1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("ai_bot_runs", sa.Column("priority", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("ai_bot_runs", sa.Column("queued_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("ai_bot_runs", sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_bot_runs_status_priority", "ai_bot_runs", ["status", "priority", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_bot_runs_status_priority", table_name="ai_bot_runs")
+    op.drop_column("ai_bot_runs", "claimed_at")
+    op.drop_column("ai_bot_runs", "queued_at")
+    op.drop_column("ai_bot_runs", "priority")
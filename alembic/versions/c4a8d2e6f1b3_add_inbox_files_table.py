@@ -0,0 +1,49 @@
+"""add inbox files manifest table
+
+Revision ID: c4a8d2e6f1b3
+Revises: b7e3f1a9c2d4
+Create Date: 2026-10-19 20:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4a8d2e6f1b3"
+down_revision: Union[str, Sequence[str], None] = "b7e3f1a9c2d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ai_bot_inbox_files",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("folder", sa.String(length=500), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("mtime", sa.Float(), nullable=False),
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("last_outcome", sa.String(length=50), nullable=False, server_default="new"),
+        sa.Column("voucher_id", sa.String(length=255), nullable=True),
+        sa.Column("runid", sa.String(length=255), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("first_seen_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("folder", "filename", name="uq_inbox_files_folder_filename"),
+    )
+    op.create_index(op.f("ix_ai_bot_inbox_files_id"), "ai_bot_inbox_files", ["id"], unique=False)
+    op.create_index(op.f("ix_ai_bot_inbox_files_folder"), "ai_bot_inbox_files", ["folder"], unique=False)
+    op.create_index(op.f("ix_ai_bot_inbox_files_sha256"), "ai_bot_inbox_files", ["sha256"], unique=False)
+    op.create_index(op.f("ix_ai_bot_inbox_files_last_outcome"), "ai_bot_inbox_files", ["last_outcome"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_ai_bot_inbox_files_last_outcome"), table_name="ai_bot_inbox_files")
+    op.drop_index(op.f("ix_ai_bot_inbox_files_sha256"), table_name="ai_bot_inbox_files")
+    op.drop_index(op.f("ix_ai_bot_inbox_files_folder"), table_name="ai_bot_inbox_files")
+    op.drop_index(op.f("ix_ai_bot_inbox_files_id"), table_name="ai_bot_inbox_files")
+    op.drop_table("ai_bot_inbox_files")
@@ -0,0 +1,48 @@
+"""add llm usage table
+
+Revision ID: c4e1f7a9d2b3
+Revises: 8d98ecb422cf
+Create Date: 2026-10-19 09:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e1f7a9d2b3"
+down_revision: Union[str, Sequence[str], None] = "8d98ecb422cf"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ai_bot_llm_usage",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("runid", sa.String(length=100), nullable=True),
+        sa.Column("filename", sa.String(length=255), nullable=True),
+        sa.Column("stage", sa.String(length=100), nullable=True),
+        sa.Column("model", sa.String(length=100), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("image_tokens", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total_tokens", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("latency_ms", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("cost_usd", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_ai_bot_llm_usage_id"), "ai_bot_llm_usage", ["id"], unique=False)
+    op.create_index(op.f("ix_ai_bot_llm_usage_runid"), "ai_bot_llm_usage", ["runid"], unique=False)
+    op.create_index(op.f("ix_ai_bot_llm_usage_filename"), "ai_bot_llm_usage", ["filename"], unique=False)
+    op.create_index(op.f("ix_ai_bot_llm_usage_stage"), "ai_bot_llm_usage", ["stage"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_ai_bot_llm_usage_stage"), table_name="ai_bot_llm_usage")
+    op.drop_index(op.f("ix_ai_bot_llm_usage_filename"), table_name="ai_bot_llm_usage")
+    op.drop_index(op.f("ix_ai_bot_llm_usage_runid"), table_name="ai_bot_llm_usage")
+    op.drop_index(op.f("ix_ai_bot_llm_usage_id"), table_name="ai_bot_llm_usage")
+    op.drop_table("ai_bot_llm_usage")
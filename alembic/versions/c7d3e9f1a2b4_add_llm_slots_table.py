@@ -0,0 +1,37 @@
+"""add LLM slots table
+
+Revision ID: c7d3e9f1a2b4
+Revises: b5f2a7c9e3d1
+Create Date: 2026-10-20 09:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c7d3e9f1a2b4"
+down_revision: Union[str, Sequence[str], None] = "b5f2a7c9e3d1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ai_bot_llm_slots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=50), nullable=False),
+        sa.Column("owner", sa.String(length=255), nullable=False),
+        sa.Column("acquired_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_ai_bot_llm_slots_id"), "ai_bot_llm_slots", ["id"], unique=False)
+    op.create_index(op.f("ix_ai_bot_llm_slots_lease_expires_at"), "ai_bot_llm_slots", ["lease_expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_ai_bot_llm_slots_lease_expires_at"), table_name="ai_bot_llm_slots")
+    op.drop_index(op.f("ix_ai_bot_llm_slots_id"), table_name="ai_bot_llm_slots")
+    op.drop_table("ai_bot_llm_slots")
@@ -0,0 +1,28 @@
+"""add cached_tokens to llm usage
+
+Revision ID: d7a2b8c3e4f5
+Revises: c4e1f7a9d2b3
+Create Date: 2026-10-19 11:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7a2b8c3e4f5"
+down_revision: Union[str, Sequence[str], None] = "c4e1f7a9d2b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "ai_bot_llm_usage",
+        sa.Column("cached_tokens", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("ai_bot_llm_usage", "cached_tokens")
@@ -0,0 +1,48 @@
+"""add entered invoices ledger table
+
+Revision ID: d8b3f5a1c6e2
+Revises: c4a8d2e6f1b3
+Create Date: 2026-10-19 22:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d8b3f5a1c6e2"
+down_revision: Union[str, Sequence[str], None] = "c4a8d2e6f1b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ai_bot_entered_invoices",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("environment", sa.String(length=20), nullable=False),
+        sa.Column("vendor", sa.String(length=100), nullable=False),
+        sa.Column("invoice_number", sa.String(length=255), nullable=False),
+        sa.Column("amount_cents", sa.BigInteger(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="claimed"),
+        sa.Column("voucher_id", sa.String(length=255), nullable=True),
+        sa.Column("runid", sa.String(length=255), nullable=True),
+        sa.Column("filename", sa.String(length=255), nullable=True),
+        sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("entered_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "environment", "vendor", "invoice_number", "amount_cents", name="uq_entered_invoices_key"
+        ),
+    )
+    op.create_index(op.f("ix_ai_bot_entered_invoices_id"), "ai_bot_entered_invoices", ["id"], unique=False)
+    op.create_index(op.f("ix_ai_bot_entered_invoices_status"), "ai_bot_entered_invoices", ["status"], unique=False)
+    op.create_index(op.f("ix_ai_bot_entered_invoices_runid"), "ai_bot_entered_invoices", ["runid"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_ai_bot_entered_invoices_runid"), table_name="ai_bot_entered_invoices")
+    op.drop_index(op.f("ix_ai_bot_entered_invoices_status"), table_name="ai_bot_entered_invoices")
+    op.drop_index(op.f("ix_ai_bot_entered_invoices_id"), table_name="ai_bot_entered_invoices")
+    op.drop_table("ai_bot_entered_invoices")
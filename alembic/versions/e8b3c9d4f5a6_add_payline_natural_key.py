@@ -0,0 +1,46 @@
+"""add natural key constraint to payline items
+
+Revision ID: e8b3c9d4f5a6
+Revises: d7a2b8c3e4f5
+Create Date: 2026-10-19 14:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e8b3c9d4f5a6"
+down_revision: Union[str, Sequence[str], None] = "d7a2b8c3e4f5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NATURAL_KEY = ["tab_name", "emplid", "empl_rcd", "ern_ded_code", "amount"]
+
+
+def upgrade() -> None:
+    # Drop duplicates left by earlier runs. Keep the row that records an entry
+    # (processed, then tested, then error) over a "new" one, which would be
+    # offered for entry again; the oldest row among equals.
+    op.execute(
+        sa.text(
+            "DELETE FROM ai_bot_payline_items WHERE id IN ("
+            " SELECT id FROM ("
+            "  SELECT id, ROW_NUMBER() OVER ("
+            f"   PARTITION BY {', '.join(NATURAL_KEY)}"
+            "   ORDER BY CASE status"
+            "    WHEN 'processed' THEN 0 WHEN 'tested' THEN 1 WHEN 'new' THEN 3 ELSE 2"
+            "   END, id"
+            "  ) AS keep_rank"
+            "  FROM ai_bot_payline_items"
+            " ) AS ranked"
+            " WHERE keep_rank > 1"
+            ")"
+        )
+    )
+    op.create_unique_constraint("uq_payline_items_natural_key", "ai_bot_payline_items", NATURAL_KEY)
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_payline_items_natural_key", "ai_bot_payline_items", type_="unique")
@@ -0,0 +1,59 @@
+"""add run summaries table
+
+Revision ID: f1c4d8e2a7b9
+Revises: e8b3c9d4f5a6
+Create Date: 2026-10-19 16:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f1c4d8e2a7b9"
+down_revision: Union[str, Sequence[str], None] = "e8b3c9d4f5a6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same buckets as app.services.run_summary.status_bucket
+BACKFILL = """
+INSERT INTO ai_bot_run_summaries (runid, processed, success, duplicate, failure, review_blocked)
+SELECT runid,
+       COUNT(*),
+       SUM(CASE WHEN status LIKE '%Review reason%' THEN 0 WHEN status LIKE 'success%' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN status LIKE '%Review reason%' THEN 0 WHEN status LIKE 'duplicate%' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN status LIKE '%Review reason%' THEN 0
+                WHEN status LIKE 'failure%' OR status LIKE 'error%' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN status LIKE '%Review reason%' THEN 1 ELSE 0 END)
+FROM (
+    SELECT runid, status FROM ai_bot_process_log WHERE runid IS NOT NULL
+    UNION ALL
+    SELECT runid, status FROM ai_bot_direct_deposit_process_log WHERE runid IS NOT NULL
+) AS logs
+GROUP BY runid
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ai_bot_run_summaries",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("runid", sa.String(length=255), nullable=False),
+        sa.Column("processed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("success", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("duplicate", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("failure", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("review_blocked", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_ai_bot_run_summaries_id"), "ai_bot_run_summaries", ["id"], unique=False)
+    op.create_index(op.f("ix_ai_bot_run_summaries_runid"), "ai_bot_run_summaries", ["runid"], unique=True)
+    op.execute(sa.text(BACKFILL))
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_ai_bot_run_summaries_runid"), table_name="ai_bot_run_summaries")
+    op.drop_index(op.f("ix_ai_bot_run_summaries_id"), table_name="ai_bot_run_summaries")
+    op.drop_table("ai_bot_run_summaries")
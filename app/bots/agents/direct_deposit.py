@@ -5,7 +5,10 @@ from dotenv import load_dotenv
 from pathlib import Path
 from app.schemas import DirectDepositExtractResult
 from app.bots.tools.extract_pdf import extract_pdf_contents
+from app.bots.agents.prompt_layout import PromptLayout
 from app.services.langfuse import langfuse_handler
+from app.services.llm_backend import invoke_agent
+from app.services.usage import usage_handler, usage_context
 
 load_dotenv()
 
@@ -54,26 +57,26 @@ async def run_direct_deposit_extraction(direct_deposit_path: str | Path, extra_i
 
         print(f"📄 Processing: {direct_deposit_path}")
         input = {"messages": [{"role": "user", "content": str(direct_deposit_path)}]}
-        # Build an agent, optionally appending extra instructions
-        if extra_instructions:
-            merged_instructions = system_prompt + "\n\nAdditional instructions:\n" + extra_instructions
-            agent = create_agent(
-                name=name,
-                system_prompt=merged_instructions,
-                tools=tools,
-                model=model,
-                response_format=response_format,
-            )
-        else:
-            agent = create_agent(
-                name=name,
-                system_prompt=system_prompt,
-                tools=tools,
-                model=model,
-                response_format=response_format,
-            )
+        # Static prompt first, extra instructions after, document via the tool call
+        layout = PromptLayout(system_prompt, extra_instructions, vendor_heading="Additional instructions")
+        agent = create_agent(
+            name=name,
+            system_prompt=layout.system_prompt(),
+            tools=tools,
+            model=layout.chat_model("direct_deposit_extract", model=model),
+            response_format=response_format,
+        )
 
-        result = agent.invoke(input, config={"callbacks": [langfuse_handler]})
+        with usage_context(stage="direct_deposit_extract"):
+            result = invoke_agent(
+                name,
+                agent,
+                input,
+                schema=response_format,
+                prompt=layout.system_prompt(),
+                config={"callbacks": [langfuse_handler, usage_handler]},
+                files=[direct_deposit_path],
+            )
         print("✅ Extraction result:")
         print(result['structured_response'])
         return result
@@ -5,7 +5,10 @@ from dotenv import load_dotenv
 from pathlib import Path
 from app.schemas import ExtractedInvoiceData
 from app.bots.tools.extract_pdf import extract_pdf_contents
+from app.bots.agents.prompt_layout import PromptLayout
 from app.services.langfuse import langfuse_handler
+from app.services.llm_backend import invoke_agent
+from app.services.usage import usage_handler, usage_context
 
 load_dotenv()
 
@@ -51,26 +54,26 @@ async def run_invoice_extraction(invoice_path: str | Path, extra_instructions: s
 
         print(f"📄 Processing: {invoice_path}")
         input = {"messages": [{"role": "user", "content": str(invoice_path)}]}
-        # Build an agent, optionally appending extra instructions
-        if extra_instructions:
-            merged_instructions = system_prompt + "\n\nAdditional instructions:\n" + extra_instructions
-            agent = create_agent(
-                name=name,
-                system_prompt=merged_instructions,
-                tools=tools,
-                model=model,
-                response_format=response_format,
-            )
-        else:
-            agent = create_agent(
-                name=name,
-                system_prompt=system_prompt,
-                tools=tools,
-                model=model,
-                response_format=response_format,
-            )
+        # Static prompt first, extra instructions after, document via the tool call
+        layout = PromptLayout(system_prompt, extra_instructions, vendor_heading="Additional instructions")
+        agent = create_agent(
+            name=name,
+            system_prompt=layout.system_prompt(),
+            tools=tools,
+            model=layout.chat_model("invoice_extract", model=model),
+            response_format=response_format,
+        )
 
-        result = agent.invoke(input, config={"callbacks": [langfuse_handler]})
+        with usage_context(stage="invoice_extract"):
+            result = invoke_agent(
+                name,
+                agent,
+                input,
+                schema=response_format,
+                prompt=layout.system_prompt(),
+                config={"callbacks": [langfuse_handler, usage_handler]},
+                files=[invoice_path],
+            )
         print("✅ Extraction result:")
         print(result['structured_response'])
         return result
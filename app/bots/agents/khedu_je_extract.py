@@ -1,10 +1,13 @@
 from agents import Agent, Runner
 from pydantic import ValidationError
 import asyncio
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 from app.schemas import KheduJournalExtractedData
 from app.bots.tools.extract_pdf import extract_pdf_contents
+from app.services.llm_backend import run_agent
+from app.services.usage import record_agents_run
 
 load_dotenv()
 
@@ -70,7 +73,16 @@ async def run_journal_extraction(invoice_path: str | Path, extra_instructions: s
             agent = journal_extract_agent
 
         #with trace("Extracting invoice fields"):
-        result = await Runner.run(agent, str(invoice_path))
+        started = time.perf_counter()
+        result = await run_agent(
+            agent.name,
+            lambda: Runner.run(agent, str(invoice_path)),
+            schema=agent.output_type,
+            prompt=agent.instructions,
+            agent_input=str(invoice_path),
+            files=[invoice_path],
+        )
+        record_agents_run(result, model=agent.model, stage="journal_extract", started=started)
         print("✅ Extraction result:")
         print(result)
         return result
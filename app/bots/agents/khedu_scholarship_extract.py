@@ -5,7 +5,10 @@ from dotenv import load_dotenv
 from pathlib import Path
 from app.schemas import ScholarshipExtractedCheckAuthorization
 from app.bots.tools.extract_pdf import extract_pdf_contents
+from app.bots.agents.prompt_layout import PromptLayout
 from app.services.langfuse import langfuse_handler
+from app.services.llm_backend import invoke_agent
+from app.services.usage import usage_handler, usage_context
 
 load_dotenv()
 
@@ -48,25 +51,26 @@ async def run_scholarship_extraction(invoice_path: str | Path, extra_instruction
         print(f"[INFO] Processing: {invoice_path}")
         input_payload = {"messages": [{"role": "user", "content": str(invoice_path)}]}
 
-        if extra_instructions:
-            merged_instructions = system_prompt + "\n\nAdditional instructions:\n" + extra_instructions
-            agent = create_agent(
-                name=name,
-                system_prompt=merged_instructions,
-                tools=tools,
-                model=model,
-                response_format=response_format,
-            )
-        else:
-            agent = create_agent(
-                name=name,
-                system_prompt=system_prompt,
-                tools=tools,
-                model=model,
-                response_format=response_format,
-            )
+        # Static prompt first, extra instructions after, document via the tool call
+        layout = PromptLayout(system_prompt, extra_instructions, vendor_heading="Additional instructions")
+        agent = create_agent(
+            name=name,
+            system_prompt=layout.system_prompt(),
+            tools=tools,
+            model=layout.chat_model("scholarship_extract", model=model),
+            response_format=response_format,
+        )
 
-        result = agent.invoke(input_payload, config={"callbacks": [langfuse_handler]})
+        with usage_context(stage="scholarship_extract"):
+            result = invoke_agent(
+                name,
+                agent,
+                input_payload,
+                schema=response_format,
+                prompt=layout.system_prompt(),
+                config={"callbacks": [langfuse_handler, usage_handler]},
+                files=[invoice_path],
+            )
         print("[INFO] Extraction result:")
         structured_response = result.get("structured_response", result)
         print(structured_response)
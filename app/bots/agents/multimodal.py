@@ -1,27 +1,54 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Type, List
+from typing import Callable, Type, List, TypeVar
 import base64
+import math
+import threading
 import fitz  # PyMuPDF
 from pydantic import BaseModel
 from PIL import Image
 import io
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
 from langfuse import observe
 
+from app.bots.agents.prompt_layout import PromptLayout
+from app.services.langfuse import langfuse_handler
+from app.services.llm_backend import structured_call
+from app.services.usage import usage_context, usage_handler
+
 
 # Load dotenv if needed and get openAI API key from env
 from dotenv import load_dotenv
 load_dotenv()
 import os
 
+T = TypeVar("T")
+
+# Document modes:
+# - image:  legacy behaviour, always attach a rendered page image.
+# - text:   send the text layer / OCR text only (image only if no text at all).
+# - hybrid: text only for native-text PDFs, image + OCR text for scans;
+#           text-only attempts escalate to the image when validation fails
+#           or confidence is low.
+DOCUMENT_MODES = ("image", "text", "hybrid")
+DEFAULT_DOCUMENT_MODE = os.getenv("DOCUMENT_MODE", "hybrid").lower()
+MIN_TEXT_ONLY_CONFIDENCE = 0.6
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".tiff", ".bmp"}
+
 
-def _pdf_to_images(pdf_path: str, dpi: int = 180) -> List[Image.Image]:
-    """Render all pages of a PDF to PIL images."""
+def document_mode_for(stage: str) -> str:
+    """Per-stage override via DOCUMENT_MODE_<STAGE> (e.g. DOCUMENT_MODE_PO_IDENTIFIER=image)."""
+    return os.getenv(f"DOCUMENT_MODE_{stage.upper()}", DEFAULT_DOCUMENT_MODE).lower()
+
+
+def _pdf_to_images(pdf_path: str, dpi: int = 180, max_pages: int | None = None) -> List[Image.Image]:
+    """Render pages of a PDF (all, or the first max_pages) to PIL images."""
     doc = fitz.open(pdf_path)
     images = []
-    for page in doc:
+    for index, page in enumerate(doc):
+        if max_pages is not None and index >= max_pages:
+            break
         zoom = dpi / 72.0
         mat = fitz.Matrix(zoom, zoom)
         pix = page.get_pixmap(matrix=mat, alpha=False)
@@ -40,54 +67,293 @@ def _image_to_base64(image: Image.Image) -> str:
     image.save(buf, format="JPEG", quality=85)
     return base64.b64encode(buf.getvalue()).decode("utf-8")
 
+
+def _first_page_b64(file_path: str) -> str:
+    """Render the first page (or the image itself) as the JPEG sent to vision models."""
+    path = Path(file_path)
+    ext = path.suffix.lower()
+    if ext == ".pdf":
+        images = _pdf_to_images(str(path), max_pages=1)
+    elif ext in IMAGE_SUFFIXES:
+        images = [Image.open(path)]
+    else:
+        raise ValueError(f"Unsupported file: {file_path}")
+    return _image_to_base64(images[0])
+
+
+def _preview_b64(file_path: str) -> str:
+    """Size-capped preview used by the agent stages (PO identifier, line mapper)."""
+    from app.bots.tools.extract_pdf import extract_pdf_contents
+
+    contents = extract_pdf_contents.invoke(
+        {"input": file_path, "include_preview_on_ocr": True, "ocr_if_empty": False}
+    )
+    return _result_field(contents, "image_base64")
+
+
+def _result_field(contents, field: str):
+    if isinstance(contents, dict):
+        return contents.get(field) or ""
+    return getattr(contents, field, "") or ""
+
+
+# ---------- TOKEN ESTIMATES ----------
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Approximate OpenAI high-detail image cost: fit within 2048x2048, scale the
+    short side to 768, then 85 base tokens + 170 per 512px tile.
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def estimate_document_image_tokens(file_path: str, dpi: int = 180) -> int:
+    """Estimate image tokens for the first page without rendering it."""
+    path = Path(file_path)
+    ext = path.suffix.lower()
+    try:
+        if ext == ".pdf":
+            with fitz.open(str(path)) as doc:
+                if len(doc) == 0:
+                    return 0
+                rect = doc[0].rect
+                zoom = dpi / 72.0
+                return estimate_image_tokens(int(rect.width * zoom), int(rect.height * zoom))
+        if ext in IMAGE_SUFFIXES:
+            with Image.open(path) as img:
+                return estimate_image_tokens(*img.size)
+    except Exception:
+        return 0
+    return 0
+
+
+def estimate_b64_image_tokens(image_b64: str) -> int:
+    """Estimate image tokens for an encoded JPEG/PNG payload (header read only)."""
+    if not image_b64:
+        return 0
+    if image_b64.startswith("data:image"):
+        image_b64 = image_b64.split(",", 1)[-1]
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(image_b64))) as img:
+            return estimate_image_tokens(*img.size)
+    except Exception:
+        return 0
+
+
+# ---------- DOCUMENT MODE STATS ----------
+
+class DocumentModeStats:
+    """
+    Thread-safe per-stage counters for text-only vs image calls and the image
+    tokens avoided by sending text only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, dict[str, int]] = {}
+
+    def record(self, stage: str, *, sent_image: bool, escalated: bool = False, image_tokens: int = 0) -> None:
+        with self._lock:
+            counters = self._stages.setdefault(
+                stage,
+                {"calls": 0, "text_only": 0, "image": 0, "escalations": 0, "image_tokens_saved": 0},
+            )
+            counters["calls"] += 1
+            if escalated:
+                counters["escalations"] += 1
+            if sent_image:
+                counters["image"] += 1
+            else:
+                counters["text_only"] += 1
+                counters["image_tokens_saved"] += image_tokens
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self._stages.items()}
+        if stages:
+            stages["total"] = {
+                key: sum(counters[key] for counters in stages.values())
+                for key in ("calls", "text_only", "image", "escalations", "image_tokens_saved")
+            }
+        return stages
+
+
+document_mode_stats = DocumentModeStats()
+_active_run_stats: ContextVar[DocumentModeStats | None] = ContextVar("document_mode_run_stats", default=None)
+
+
+@contextmanager
+def track_document_modes():
+    """Collect document mode stats for the calls made inside this block (e.g. one run)."""
+    stats = DocumentModeStats()
+    token = _active_run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _active_run_stats.reset(token)
+
+
+def _record_mode(stage: str, **kwargs) -> None:
+    document_mode_stats.record(stage, **kwargs)
+    run_stats = _active_run_stats.get()
+    if run_stats is not None:
+        run_stats.record(stage, **kwargs)
+
+
+# ---------- DOCUMENT STAGE ----------
+
+def _default_is_confident(result) -> bool:
+    confidence = getattr(result, "confidence", None)
+    if confidence is None:
+        return True
+    return confidence >= MIN_TEXT_ONLY_CONFIDENCE
+
+
+def document_blocks(text: str = "", image_b64: str = "") -> list[dict]:
+    """Content blocks for a document: text layer/OCR text first, then the image."""
+    blocks: list[dict] = []
+    if text:
+        blocks.append({"type": "text", "text": text})
+    if image_b64:
+        blocks.append(
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": image_b64
+                    if image_b64.startswith("data:image")
+                    else f"data:image/jpeg;base64,{image_b64}"
+                },
+            }
+        )
+    return blocks
+
+
+def _attributed(stage: str, invoke: Callable[[list[dict]], T]) -> Callable[[list[dict]], T]:
+    """Attribute the LLM usage of `invoke` to `stage`."""
+
+    def _invoke(blocks: list[dict]) -> T:
+        with usage_context(stage=stage):
+            return invoke(blocks)
+
+    return _invoke
+
+
+def run_document_stage(
+    stage: str,
+    file_path: str,
+    invoke: Callable[[list[dict]], T],
+    *,
+    mode: str | None = None,
+    is_confident: Callable[[T], bool] | None = None,
+    image_loader: Callable[[str], str] = _preview_b64,
+) -> T:
+    """
+    Call `invoke(document_blocks)` with the document content chosen by `mode`.
+    Native-text PDFs go text-only in hybrid mode and escalate to text + image
+    when `invoke` raises or `is_confident` rejects the result.
+    """
+    mode = (mode or document_mode_for(stage)).lower()
+    if mode not in DOCUMENT_MODES:
+        raise ValueError(f"Unknown document mode '{mode}', expected one of {DOCUMENT_MODES}")
+    is_confident = is_confident or _default_is_confident
+    invoke = _attributed(stage, invoke)
+
+    from app.bots.tools.extract_pdf import extract_pdf_contents
+
+    contents = extract_pdf_contents.invoke(
+        {"input": file_path, "include_preview_on_ocr": False, "include_preview_on_native": False}
+    )
+    text = _result_field(contents, "extracted_text")
+    native_text = bool(_result_field(contents, "native_text"))
+
+    text_first = (mode == "hybrid" and native_text) or (mode == "text" and bool(text))
+    if not text_first:
+        image_b64 = image_loader(file_path)
+        _record_mode(stage, sent_image=bool(image_b64), image_tokens=0)
+        return invoke(document_blocks(text, image_b64))
+
+    image_tokens = estimate_document_image_tokens(file_path)
+    try:
+        result = invoke(document_blocks(text))
+        if mode == "text" or is_confident(result):
+            _record_mode(stage, sent_image=False, image_tokens=image_tokens)
+            return result
+        print(f"[{stage}] Low confidence on text-only input; escalating to image.")
+    except Exception as exc:
+        if mode == "text":
+            raise
+        print(f"[{stage}] Text-only attempt failed ({type(exc).__name__}: {exc}); escalating to image.")
+
+    image_b64 = image_loader(file_path)
+    _record_mode(stage, sent_image=bool(image_b64), escalated=True)
+    return invoke(document_blocks(text, image_b64))
+
+
 @observe(name="document_vision_extract")
 def extract_to_schema(
     file_path: str,
     schema: Type[BaseModel],
     *,
-    prompt: str = "Extract structured data according to the schema."
+    prompt: str = "Extract structured data according to the schema.",
+    vendor_prompt: str | None = None,
+    mode: str | None = "image",
+    stage: str | None = None,
+    is_confident: Callable[[BaseModel], bool] | None = None,
 ) -> BaseModel:
     """
     Universal extractor:
     - Accepts PDF or image
-    - Calls multimodal LLM
+    - Calls multimodal LLM (or text-only, see DOCUMENT_MODES; mode=None uses
+      the per-stage default)
     - Validates output to provided Pydantic schema
+    The prompt (then vendor_prompt) goes in the system message ahead of the
+    document so repeat calls share a cacheable prefix (see prompt_layout).
     """
+    stage = stage or schema.__name__
+    mode = (mode or document_mode_for(stage)).lower()
     path = Path(file_path)
     ext = path.suffix.lower()
-
-    # 1️⃣ Convert file → list of PIL images
-    if ext == ".pdf":
-        images = _pdf_to_images(str(path))
-    elif ext in {".png", ".jpg", ".jpeg", ".tiff", ".bmp"}:
-        images = [Image.open(path)]
-    else:
+    if ext != ".pdf" and ext not in IMAGE_SUFFIXES:
         raise ValueError(f"Unsupported file: {file_path}")
 
-    # 2️⃣ Convert 1st page (or best page later) to base64
-    b64 = _image_to_base64(images[0])
-
-    # 3️⃣ Construct multimodal message with explicit schema contract
-    model = ChatOpenAI(
+    # Construct message with explicit schema contract
+    layout = PromptLayout(prompt, vendor_prompt)
+    model = layout.chat_model(
+        stage,
         api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-5-mini",  # or gpt-5-mini if enabled
-        temperature=0
+        temperature=0,
     ).with_structured_output(schema)
 
-    message = HumanMessage(
-        content=[
-            {"type": "text", "text": prompt},
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{b64}"
-                }
-            }
-        ]
-    )
+    def _invoke(blocks: list[dict]) -> BaseModel:
+        messages = layout.messages(blocks)
+        return structured_call(
+            f"extract_to_schema.{stage}",
+            messages,
+            lambda: model.invoke(messages, config={"callbacks": [langfuse_handler, usage_handler]}),
+            schema=schema,
+        )
 
-    # 4️⃣ Invoke model → returns validated Pydantic object
-    return model.invoke([message])
+    if mode == "image":
+        # Legacy path: first page only, no text layer
+        b64 = _first_page_b64(str(path))
+        _record_mode(stage, sent_image=True)
+        return _attributed(stage, _invoke)(document_blocks(image_b64=b64))
+
+    return run_document_stage(
+        stage,
+        str(path),
+        _invoke,
+        mode=mode,
+        is_confident=is_confident,
+        image_loader=_first_page_b64,
+    )
 
 # Example usage:
 if __name__ == "__main__":
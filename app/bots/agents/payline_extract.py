@@ -1,10 +1,13 @@
 from agents import Agent, Runner
 from pydantic import ValidationError
 import asyncio
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 from app.schemas import PaylineExcelExtractedData
 from app.bots.tools.extract_payline_excel import extract_payline_excel
+from app.services.llm_backend import run_agent
+from app.services.usage import record_agents_run
 
 load_dotenv()
 
@@ -73,7 +76,16 @@ async def run_payline_extraction(excel_path: str | Path, extra_instructions: str
             agent = payline_extract_agent
 
         #with trace("Extracting invoice fields"):
-        result = await Runner.run(agent, str(excel_path))
+        started = time.perf_counter()
+        result = await run_agent(
+            agent.name,
+            lambda: Runner.run(agent, str(excel_path)),
+            schema=agent.output_type,
+            prompt=agent.instructions,
+            agent_input=str(excel_path),
+            files=[excel_path],
+        )
+        record_agents_run(result, model=agent.model, stage="payline_extract", started=started)
         #print("✅ Extraction result:")
         #print(result)
         return result
@@ -0,0 +1,48 @@
+"""
+Prompt assembly in cache-friendly order.
+
+OpenAI caches the longest previously seen prompt prefix (1024+ tokens, in
+128-token steps), so every agent lays its messages out the same way:
+
+    1. static prefix   - the stage's base instructions (identical on every call)
+    2. vendor block    - vendor-specific instructions/tables (identical per vendor)
+    3. document        - per-invoice text, JSON and images (always last)
+
+Anything that varies per call must stay out of 1 and 2, otherwise the cached
+prefix ends at the first differing character.
+"""
+import hashlib
+from dataclasses import dataclass
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+DEFAULT_MODEL = "gpt-5-mini"
+
+
+@dataclass(frozen=True)
+class PromptLayout:
+    static: str
+    vendor: str | None = None
+    vendor_heading: str = "Vendor-specific instructions"
+
+    def system_prompt(self) -> str:
+        """Static prefix followed by the vendor block."""
+        static = self.static.strip()
+        if not self.vendor:
+            return static
+        return f"{static}\n\n{self.vendor_heading}:\n{self.vendor.strip()}"
+
+    def cache_key(self, stage: str) -> str:
+        """Routing hint so calls sharing this prefix land on the same cache."""
+        digest = hashlib.sha256(self.system_prompt().encode("utf-8")).hexdigest()[:16]
+        return f"{stage}:{digest}"
+
+    def messages(self, document: list[dict] | str) -> list[BaseMessage]:
+        """System message with the cacheable prefix, then the per-document content."""
+        return [SystemMessage(content=self.system_prompt()), HumanMessage(content=document)]
+
+    def chat_model(self, stage: str, *, model: str = DEFAULT_MODEL, **kwargs) -> ChatOpenAI:
+        """Chat model that sends this layout's prompt_cache_key with every request."""
+        model_kwargs = {**kwargs.pop("model_kwargs", {}), "prompt_cache_key": self.cache_key(stage)}
+        return ChatOpenAI(model=model, model_kwargs=model_kwargs, **kwargs)
@@ -24,6 +24,9 @@ from app.bots.utils.misc import (
     update_bot_run_status,
 )
 from app.bots.agents.multimodal import extract_to_schema
+from app.services.cancellation import cancellation_registry
+from app.services.process_log_writer import process_log_writer
+from app.services.usage import usage_context, usage_summary_for_run
 from app.bots.prompts import CDW_PROMPT, CLASS_PROMPT, MOBILE_PROMPT
 from app.schemas import (
     DirectDepositExtractResult,
@@ -233,124 +236,121 @@ def run_direct_deposit_entry(
     print(f"\n🚀 Starting run {runid} with {len(deposits)} invoices from {file_path}")
 
     cancelled = False
-    try:
-        for deposit in deposits:
-            if is_run_cancel_requested(runid):
-                print(f"Cancellation requested for run {runid}. Stopping further processing.")
-                cancelled = True
-                break
-
-            process_log: Optional[DDProcessSchema] = None
-            system_prompt="""
-            You are a direct deposit extraction agent. 
-            Use the tool to extract raw data from the document.
-            Extract the following fields from the provided direct_deposit document: 
-            emplid, name, date, ssn, bank_name, routing_number, bank_account, checking_account, savings_account, amount_dollars, amount_percentage.
-            The ssn field should only contain the last four digits of the social security number.
-            The checking_account and savings_account fields should be booleans indicating whether the bank account is a checking or savings account.
-            The amount_dollars field is the fixed dollar amount for direct deposit, and amount_percentage is the percentage amount for direct deposit. If one of these is not provided, set it to 0.
-            The date field should be converted to MM-DD-YYYY format.
-            If you can't find the date, use today's date
-            emplid will always be a 6 digit number.
-            if checking and savings account are both true, set savings_account to false.
-            if checking and saving account are both false, set checking_account to true.
-            if amount_dollars and amount_percentage are both blank or 0, then set percentage to 100.
-            Include a confidence score (0-1) for the extracted fields.
-            Return only valid JSON that matches the expected format.
-            """
-            extraction_result = extract_to_schema(str(deposit), DirectDepositExtractResult, prompt=system_prompt)
-
-            result: DepositEntryResult | None = None
-            if not extraction_result:
-                print(f"Failed extraction: {deposit.name}")
-                runlog.failures += 1
-                process_log = DDProcessSchema(
-                    runid=runid,
-                    emplid="",
-                    name="",
-                    bank_name="",
-                    routing_number="",
-                    bank_account="",
-                    amount_dollars=0.0,
-                    status="failure",
-                    message="Extraction Failed",
-                )
-            elif extraction_result.amount_percentage < 100:
-                print(f"Skipping non-100% deposit: {deposit.name} with {extraction_result.amount_percentage}%")
-                runlog.failures += 1
-                process_log = DDProcessSchema(
-                    runid=runid,
-                    emplid=extraction_result.emplid,
-                    name=extraction_result.name,
-                    bank_name=extraction_result.bank_name,
-                    routing_number=extraction_result.routing_number,
-                    bank_account=extraction_result.bank_account,
-                    amount_dollars=extraction_result.amount_dollars,
-                    status="failure",
-                    message=f"Skipped non-100% deposit with {extraction_result.amount_percentage}%",
-                )
-            else:
-                deposit_data = extraction_result
-                deposit_data.date = normalize_date(deposit_data.date)
-                if not deposit_data.date:
-                    deposit_data.date = datetime.datetime.now()
-                #change date to first of month for direct deposit
-                #deposit_data.date = deposit_data.date.replace(day=1)
-                result = deposit_playwright_bot(
-                    deposit_data,
-                    test_mode=test_mode,
-                )
-
-            runlog.processed += 1
-
-            if result and result.success:
-                runlog.successes += 1
-                status = "success"
-                print(f"Moving entered deposits {deposit.name} to Processed.")
-                shutil.move(str(deposit), processed_dir / deposit.name)
-                process_log = process_log or DDProcessSchema(
-                    runid=runid,
-                    emplid=deposit_data.emplid,
-                    name=deposit_data.name,
-                    bank_name=deposit_data.bank_name,
-                    routing_number=deposit_data.routing_number,
-                    bank_account=deposit_data.bank_account,
-                    amount_dollars=deposit_data.amount_dollars,
-                    status=status,
-                    success=True,
-                )
-            else:
-                runlog.failures += 1
-                status = "failure"
-                print(f"Not moving failed deposit {deposit.name}.")
-                process_log = process_log or DDProcessSchema(
-                    runid=runid,
-                    emplid=deposit_data.emplid if extraction_result else "",
-                    name=deposit_data.name if extraction_result else "",
-                    bank_name=deposit_data.bank_name if extraction_result else "",
-                    routing_number=deposit_data.routing_number if extraction_result else "",
-                    bank_account=deposit_data.bank_account if extraction_result else "",
-                    amount_dollars=deposit_data.amount_dollars if extraction_result else 0.0,
-                    status=status,
-                    success=False,
-                    message=result.message if result else "Entry Failed",
-                )
-
-            if process_log:
-                db = database.SessionLocal()
-                try:
-                    payload = process_log.model_dump()
-                    orm_row = models.DirectDepositProcessLog(**payload)
-                    db.add(orm_row)
-                    db.commit()
-                finally:
-                    db.close()
-
-    except Exception as e:
-        print("❌ Unexpected error during direct deposit entry")
-        print(e)
-        db = database.SessionLocal()
+    # Per-file cancel checks read this token instead of the DB
+    cancellation_registry.register(runid)
+    with process_log_writer() as log_writer:
         try:
+            for deposit in deposits:
+                if is_run_cancel_requested(runid):
+                    print(f"Cancellation requested for run {runid}. Stopping further processing.")
+                    cancelled = True
+                    break
+
+                process_log: Optional[DDProcessSchema] = None
+                system_prompt="""
+                You are a direct deposit extraction agent. 
+                Use the tool to extract raw data from the document.
+                Extract the following fields from the provided direct_deposit document: 
+                emplid, name, date, ssn, bank_name, routing_number, bank_account, checking_account, savings_account, amount_dollars, amount_percentage.
+                The ssn field should only contain the last four digits of the social security number.
+                The checking_account and savings_account fields should be booleans indicating whether the bank account is a checking or savings account.
+                The amount_dollars field is the fixed dollar amount for direct deposit, and amount_percentage is the percentage amount for direct deposit. If one of these is not provided, set it to 0.
+                The date field should be converted to MM-DD-YYYY format.
+                If you can't find the date, use today's date
+                emplid will always be a 6 digit number.
+                if checking and savings account are both true, set savings_account to false.
+                if checking and saving account are both false, set checking_account to true.
+                if amount_dollars and amount_percentage are both blank or 0, then set percentage to 100.
+                Include a confidence score (0-1) for the extracted fields.
+                Return only valid JSON that matches the expected format.
+                """
+                with usage_context(runid=runid, filename=deposit.name):
+                    extraction_result = extract_to_schema(
+                        str(deposit), DirectDepositExtractResult, prompt=system_prompt, stage="direct_deposit_extract"
+                    )
+
+                result: DepositEntryResult | None = None
+                if not extraction_result:
+                    print(f"Failed extraction: {deposit.name}")
+                    runlog.failures += 1
+                    process_log = DDProcessSchema(
+                        runid=runid,
+                        emplid="",
+                        name="",
+                        bank_name="",
+                        routing_number="",
+                        bank_account="",
+                        amount_dollars=0.0,
+                        status="failure",
+                        message="Extraction Failed",
+                    )
+                elif extraction_result.amount_percentage < 100:
+                    print(f"Skipping non-100% deposit: {deposit.name} with {extraction_result.amount_percentage}%")
+                    runlog.failures += 1
+                    process_log = DDProcessSchema(
+                        runid=runid,
+                        emplid=extraction_result.emplid,
+                        name=extraction_result.name,
+                        bank_name=extraction_result.bank_name,
+                        routing_number=extraction_result.routing_number,
+                        bank_account=extraction_result.bank_account,
+                        amount_dollars=extraction_result.amount_dollars,
+                        status="failure",
+                        message=f"Skipped non-100% deposit with {extraction_result.amount_percentage}%",
+                    )
+                else:
+                    deposit_data = extraction_result
+                    deposit_data.date = normalize_date(deposit_data.date)
+                    if not deposit_data.date:
+                        deposit_data.date = datetime.datetime.now()
+                    #change date to first of month for direct deposit
+                    #deposit_data.date = deposit_data.date.replace(day=1)
+                    result = deposit_playwright_bot(
+                        deposit_data,
+                        test_mode=test_mode,
+                    )
+
+                runlog.processed += 1
+
+                if result and result.success:
+                    runlog.successes += 1
+                    status = "success"
+                    print(f"Moving entered deposits {deposit.name} to Processed.")
+                    shutil.move(str(deposit), processed_dir / deposit.name)
+                    process_log = process_log or DDProcessSchema(
+                        runid=runid,
+                        emplid=deposit_data.emplid,
+                        name=deposit_data.name,
+                        bank_name=deposit_data.bank_name,
+                        routing_number=deposit_data.routing_number,
+                        bank_account=deposit_data.bank_account,
+                        amount_dollars=deposit_data.amount_dollars,
+                        status=status,
+                        success=True,
+                    )
+                else:
+                    runlog.failures += 1
+                    status = "failure"
+                    print(f"Not moving failed deposit {deposit.name}.")
+                    process_log = process_log or DDProcessSchema(
+                        runid=runid,
+                        emplid=deposit_data.emplid if extraction_result else "",
+                        name=deposit_data.name if extraction_result else "",
+                        bank_name=deposit_data.bank_name if extraction_result else "",
+                        routing_number=deposit_data.routing_number if extraction_result else "",
+                        bank_account=deposit_data.bank_account if extraction_result else "",
+                        amount_dollars=deposit_data.amount_dollars if extraction_result else 0.0,
+                        status=status,
+                        success=False,
+                        message=result.message if result else "Entry Failed",
+                    )
+
+                if process_log:
+                    log_writer.add(models.DirectDepositProcessLog, process_log.model_dump())
+
+        except Exception as e:
+            print("❌ Unexpected error during direct deposit entry")
+            print(e)
             failure_log = DDProcessSchema(
                 runid=runid,
                 emplid=deposit_data.emplid if 'deposit_data' in locals() else "",
@@ -363,12 +363,10 @@ def run_direct_deposit_entry(
                 success=False,
                 message=str(e),
             )
-            orm_row = models.DirectDepositProcessLog(**failure_log.model_dump())
-            db.add(orm_row)
-            db.commit()
+            log_writer.add(models.DirectDepositProcessLog, failure_log.model_dump())
             runlog.failures += 1
         finally:
-            db.close()
+            cancellation_registry.unregister(runid)
 
     # ...existing code...
 
@@ -385,6 +383,7 @@ def run_direct_deposit_entry(
                 "successes": runlog.successes,
                 "duplicates": runlog.duplicates,
                 "failures": runlog.failures,
+                "llm_usage": usage_summary_for_run(runid),
             },
         )
         print(f"Run {runid} cancelled after processing {runlog.processed} deposits.")
@@ -397,6 +396,7 @@ def run_direct_deposit_entry(
                 "successes": runlog.successes,
                 "duplicates": runlog.duplicates,
                 "failures": runlog.failures,
+                "llm_usage": usage_summary_for_run(runid),
             },
         )
         print(f"Completed run {runid}: {runlog.successes} success, {runlog.duplicates} duplicates, {runlog.failures} failures")
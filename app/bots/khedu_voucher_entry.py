@@ -18,6 +18,9 @@ from app.bots.agents.khedu_scholarship_extract import run_scholarship_extraction
 from app.bots.prompts import FIC_PROMPT
 from app.schemas import ScholarshipExtractedCheckAuthorization, VoucherEntryResult, VoucherRunLog, VoucherProcessLog
 from app import models, database
+from app.bots.voucher.preflight import InvoiceKey, existing_voucher_id
+from app.services.invoice_ledger import invoice_ledger, ledger_key
+from app.services.process_log_writer import process_log_writer
 import sqlalchemy
 
 load_dotenv()
@@ -25,8 +28,10 @@ load_dotenv()
 USERNAME = os.getenv("PEOPLESOFT_USERNAME")
 PASSWORD = os.getenv("PEOPLESOFT_PASSWORD")
 
+# Single payment vouchers go to this supplier; the payee is on the voucher
+SCHOLARSHIP_SUPPLIER_ID = "0000000001"
+
 def run_raw_sql() -> str:
-    db_url = os.getenv("PS_DB_URL")
     # Subquery to get the highest voucher_id for KHEDU
     query = """
    WITH latest_voucher AS (
@@ -44,8 +49,7 @@ def run_raw_sql() -> str:
     AND l.DST_ACCT_TYPE = 'DST'
     AND l.CHARTFIELD2 <> '000';
     """
-    engine = sqlalchemy.create_engine(db_url)
-    with engine.connect() as conn:
+    with database.get_ps_engine("fscm").connect() as conn:
         result = conn.execute(sqlalchemy.text(query))
         rows = result.fetchall()
         print(rows)
@@ -146,7 +150,7 @@ def scholarship_playwright_bot(
             #page.keyboard.press("s")
             ps_wait(page, 0.33)
             
-            ps_find_retry(page, "Supplier ID").fill("0000000001")
+            ps_find_retry(page, "Supplier ID").fill(SCHOLARSHIP_SUPPLIER_ID)
             page.keyboard.press("Tab")
             ps_wait(page, 1)
             ps_find_retry(page, "Invoice Number").fill(scholarship_data.invoice_number)
@@ -294,16 +298,16 @@ def run_scholarship_entry(scholarship_key: str, test_mode: bool = True, addition
 
     print(f"\nðŸš€ Starting run {runid} with {len(invoices)} scholarships from {vendor_path}")
 
-    for invoice in invoices:
-        try:
-            # LLM Agent PDF Extraction
-            scholarship_data = asyncio.run(run_scholarship_extraction(str(invoice), additional_instructions))
-            scholarship_data = scholarship_data['structured_response']
-            if not scholarship_data:
-                print(f"Failed extraction: {invoice.name}")
-                runlog.failures += 1
-                process_logs.append(
-                    VoucherProcessLog(
+    with process_log_writer() as log_writer:
+        for invoice in invoices:
+            try:
+                # LLM Agent PDF Extraction
+                scholarship_data = asyncio.run(run_scholarship_extraction(str(invoice), additional_instructions))
+                scholarship_data = scholarship_data['structured_response']
+                if not scholarship_data:
+                    print(f"Failed extraction: {invoice.name}")
+                    runlog.failures += 1
+                    process_log = VoucherProcessLog(
                         runid=runid,
                         filename=invoice.name,
                         voucher_id="Extraction Failed",
@@ -311,71 +315,93 @@ def run_scholarship_entry(scholarship_key: str, test_mode: bool = True, addition
                         invoice="",
                         status="failure",
                     )
-                )
-                continue
+                else:
+                    # Claim the check in the ledger so a copy of it, or a parallel run, is not paid twice
+                    key = ledger_key(
+                        SCHOLARSHIP_SUPPLIER_ID, scholarship_data.invoice_number, scholarship_data.amount, test_mode=test_mode
+                    )
+                    claim = None
+                    if key is not None:
+                        claim = invoice_ledger.claim(
+                            key,
+                            runid=runid,
+                            filename=invoice.name,
+                            verify=lambda: existing_voucher_id(
+                                InvoiceKey(
+                                    invoice_id=scholarship_data.invoice_number,
+                                    amount=scholarship_data.amount,
+                                    vendor_id=SCHOLARSHIP_SUPPLIER_ID,
+                                )
+                            ),
+                        )
+                    if claim is not None and claim.voucher_id:
+                        print(f"{invoice.name}: already entered as voucher {claim.voucher_id}, not opening PeopleSoft.")
+                        result = VoucherEntryResult(voucher_id="Duplicate", duplicate=True, out_of_balance=False)
+                    elif claim is not None and not claim.acquired:
+                        print(f"{invoice.name}: claimed by run {claim.holder} and not settled, skipping.")
+                        result = VoucherEntryResult(
+                            voucher_id="Skipped - Entry in progress", duplicate=False, out_of_balance=False
+                        )
+                    else:
+                        voucher_id = None
+                        try:
+                            result = scholarship_playwright_bot(
+                                scholarship_data,
+                                scholarship_resource,
+                                filepath=str(invoice),
+                                test_mode=test_mode,
+                            )
+                            voucher_id = result.voucher_id
+                        finally:
+                            invoice_ledger.settle(claim, voucher_id)
 
-            result = scholarship_playwright_bot(
-                scholarship_data,
-                scholarship_resource,
-                filepath=str(invoice),
-                test_mode=test_mode,
-            )
+                    runlog.processed += 1
 
-            runlog.processed += 1
-            
-            # Move files
-            if result.duplicate:
-                runlog.duplicates += 1
-                status = "duplicate"
-                voucher_id = "Duplicate"
-                print(f"Moving duplicate invoice {invoice.name} to NotProcessed.")
-                shutil.move(str(invoice), notprocessed_dir / invoice.name)
-            elif result.voucher_id.isdigit():
-                runlog.successes += 1
-                status = "success"
-                voucher_id = result.voucher_id
-                print(f"Moving entered invoice {invoice.name} to Processed.")
-                shutil.move(str(invoice), processed_dir / invoice.name)
-            else:
-                runlog.failures += 1
-                status = "failure"
-                voucher_id = result.voucher_id
-                print(f"Not moving failed invoice {invoice.name}.")
-                # leave file in place
-            
-            process_log = VoucherProcessLog(
-                runid=runid,
-                filename=invoice.name,
-                voucher_id=voucher_id,
-                amount=scholarship_data.amount,
-                invoice=scholarship_data.invoice_number,
-                status=status,
-            )
-            
-        except Exception as e:
-            print(f"ðŸ’¥ Error processing {invoice.name}: {e}")
-            runlog.failures += 1
-            VoucherProcessLog(
-                runid=runid,
-                filename=invoice.name,
-                voucher_id="Error",
-                amount=0.0,
-                invoice="",
-                status="failure",
-            )
+                    # Move files
+                    if result.duplicate:
+                        runlog.duplicates += 1
+                        status = "duplicate"
+                        voucher_id = "Duplicate"
+                        print(f"Moving duplicate invoice {invoice.name} to NotProcessed.")
+                        shutil.move(str(invoice), notprocessed_dir / invoice.name)
+                    elif result.voucher_id.isdigit():
+                        runlog.successes += 1
+                        status = "success"
+                        voucher_id = result.voucher_id
+                        print(f"Moving entered invoice {invoice.name} to Processed.")
+                        shutil.move(str(invoice), processed_dir / invoice.name)
+                    else:
+                        runlog.failures += 1
+                        status = "failure"
+                        voucher_id = result.voucher_id
+                        print(f"Not moving failed invoice {invoice.name}.")
+                        # leave file in place
 
+                    process_log = VoucherProcessLog(
+                        runid=runid,
+                        filename=invoice.name,
+                        voucher_id=voucher_id,
+                        amount=scholarship_data.amount,
+                        invoice=scholarship_data.invoice_number,
+                        status=status,
+                    )
 
-        # Write to DB
-        print(process_log)
-        db = database.SessionLocal()
-        try:
-                payload = process_log.model_dump()
-                orm_row = models.BotProcessLog(**payload)
-                db.add(orm_row)
-                db.commit()
-                print("Logged to database.")
-        finally:
-            db.close()
+            except Exception as e:
+                print(f"ðŸ’¥ Error processing {invoice.name}: {e}")
+                runlog.failures += 1
+                process_log = VoucherProcessLog(
+                    runid=runid,
+                    filename=invoice.name,
+                    voucher_id="Error",
+                    amount=0.0,
+                    invoice="",
+                    status="failure",
+                )
+
+            process_logs.append(process_log)
+            # Write to DB (buffered, flushed in bulk)
+            print(process_log)
+            log_writer.add(models.BotProcessLog, process_log.model_dump())
 
     t1 = time.time()
     print(f"Average time per invoice: {(t1 - t0) / len(invoices):.2f} seconds.")
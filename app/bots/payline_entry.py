@@ -1,5 +1,6 @@
 ﻿from pathlib import Path
 import os, time, asyncio, shutil
+from typing import Optional
 from dotenv import load_dotenv
 from playwright.sync_api import sync_playwright
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
@@ -12,7 +13,9 @@ from app.bots.utils.ps import (
     get_voucher_id,
 )
 from app.bots.utils.misc import generate_runid
+from app.bots.utils.sql import values_table
 from app.bots.agents.payline_extract import run_payline_extraction
+from app.bots.khedu_voucher_entry import run_raw_sql as latest_khedu_goal_code
 from app.bots.prompts import FIC_PROMPT
 from app.schemas import PaylineExcelExtractedData, PaylineExcelItem, PaylineExcelError, PaylineEntryResult, PaylineRunLog
 from app import models, database
@@ -23,42 +26,126 @@ load_dotenv()
 USERNAME = os.getenv("PEOPLESOFT_USERNAME")
 PASSWORD = os.getenv("PEOPLESOFT_PASSWORD")
 
-def run_raw_sql(emplid, empl_rcd, begin_dt, end_dt, erncd, amt) -> str:
-    db_url = os.getenv("PS_DB_URL_HCM")
-    # TODO: Stephen SQL for checking status of payline
-    query = """
-    SELECT COUNT(*)
-    FROM PS_PAY_EARNINGS E
-    JOIN PS_PAY_OTH_EARNS O
-        ON O.PAYGROUP = E.PAYGROUP
-        AND O.PAGE_NUM = E.PAGE_NUM
-        AND O.LINE_NUM = E.LINE_NUM
-        AND O.OFF_CYCLE = E.OFF_CYCLE
-        AND O.SEPCHK = E.SEPCHK
-        AND O.PAY_END_DT = E.PAY_END_DT
-        AND O.ADDL_NBR = E.ADDL_NBR
-    WHERE
-        E.EMPLID = :emplid
-        AND E.EMPL_RCD = :empl_rcd
-        AND E.EARNS_BEGIN_DT = :begin_dt
-        AND E.EARNS_END_DT = :end_dt
-        AND O.ERNCD = :erncd
-        AND (O.OTH_EARNS = :amt OR E.REG_EARNS = :amt)
+# SQL Server caps a statement at 2100 parameters; 7 per candidate keeps chunks under it.
+PAYLINE_CHECK_CHUNK = int(os.getenv("PAYLINE_CHECK_CHUNK", "250"))
+
+ENTERED_PAYLINES_COLUMNS = ("KEY_ID", "EMPLID", "EMPL_RCD", "BEGIN_DT", "END_DT", "ERNCD", "AMT")
+
+ENTERED_PAYLINES_SQL = """
+SELECT DISTINCT C.KEY_ID
+FROM {candidates}
+JOIN PS_PAY_EARNINGS E
+    ON E.EMPLID = C.EMPLID
+    AND E.EMPL_RCD = C.EMPL_RCD
+    AND E.EARNS_BEGIN_DT = C.BEGIN_DT
+    AND E.EARNS_END_DT = C.END_DT
+JOIN PS_PAY_OTH_EARNS O
+    ON O.PAYGROUP = E.PAYGROUP
+    AND O.PAGE_NUM = E.PAGE_NUM
+    AND O.LINE_NUM = E.LINE_NUM
+    AND O.OFF_CYCLE = E.OFF_CYCLE
+    AND O.SEPCHK = E.SEPCHK
+    AND O.PAY_END_DT = E.PAY_END_DT
+    AND O.ADDL_NBR = E.ADDL_NBR
+WHERE
+    O.ERNCD = C.ERNCD
+    AND (O.OTH_EARNS = C.AMT OR E.REG_EARNS = C.AMT)
+"""
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), max(1, size)):
+        yield items[start:start + size]
+
+
+def find_entered_paylines(paylines, chunk_size: int = PAYLINE_CHECK_CHUNK, engine=None) -> set[int]:
     """
-    params = {
-        "emplid": emplid,
-        "empl_rcd": empl_rcd,
-        "begin_dt": begin_dt,
-        "end_dt": end_dt,
-        "erncd": erncd,
-        "amt": amt,
-    }
-    engine = sqlalchemy.create_engine(db_url)
+    Ids of the given payline rows that already exist in PS_PAY_EARNINGS /
+    PS_PAY_OTH_EARNS. Candidates are sent as a VALUES table joined against
+    PeopleSoft, one query per `chunk_size` rows, instead of one query per row.
+    """
+    paylines = list(paylines)
+    if not paylines:
+        return set()
+    engine = engine or database.get_ps_engine("hcm")
+    entered: set[int] = set()
     with engine.connect() as conn:
-        result = conn.execute(sqlalchemy.text(query), params)
-        rows = result.fetchall()
-        print(rows)
-        return str(rows[0][0])
+        for chunk in _chunks(paylines, chunk_size):
+            values = []
+            params = {}
+            for i, payline in enumerate(chunk):
+                values.append(f"(:k{i}, :e{i}, :r{i}, :b{i}, :d{i}, :c{i}, :a{i})")
+                params.update({
+                    f"k{i}": payline.id,
+                    f"e{i}": payline.emplid,
+                    f"r{i}": payline.empl_rcd,
+                    f"b{i}": payline.earnings_begin_dt,
+                    f"d{i}": payline.earnings_end_dt,
+                    f"c{i}": payline.ern_ded_code,
+                    f"a{i}": payline.amount,
+                })
+            candidates = values_table(conn.dialect.name, "C", ENTERED_PAYLINES_COLUMNS, values)
+            query = ENTERED_PAYLINES_SQL.format(candidates=candidates)
+            entered.update(row[0] for row in conn.execute(sqlalchemy.text(query), params))
+    return entered
+
+
+def mark_paylines_status(db, ids, status: str, chunk_size: int = 2000) -> int:
+    """Set `status` on the given payline ids with one UPDATE (per 2000 ids)."""
+    ids = list(ids)
+    updated = 0
+    for chunk in _chunks(ids, chunk_size):
+        updated += (
+            db.query(models.PaylineExcelItem)
+            .filter(models.PaylineExcelItem.id.in_(chunk))
+            .update({models.PaylineExcelItem.status: status}, synchronize_session=False)
+        )
+    db.commit()
+    return updated
+
+# Entry loop status changes are committed in batches of this many paylines
+PAYLINE_COMMIT_EVERY = int(os.getenv("PAYLINE_COMMIT_EVERY", "25"))
+
+
+def _natural_key(row: dict) -> tuple:
+    return tuple(row[name] for name in models.PAYLINE_NATURAL_KEY)
+
+
+def insert_missing_paylines(db, paylines: list[PaylineExcelItem]) -> int:
+    """
+    Insert the extracted paylines whose natural key (tab_name, emplid,
+    empl_rcd, ern_ded_code, amount) is not stored yet: one SELECT of the keys
+    already present for the workbook's tabs, then one bulk INSERT. Returns
+    the number of rows inserted.
+    """
+    model = models.PaylineExcelItem
+    rows = {}
+    for payline in paylines:
+        payload = payline.model_dump()
+        rows.setdefault(_natural_key(payload), payload)
+    if not rows:
+        return 0
+    for attempt in range(2):
+        tabs = sorted({key[0] for key in rows})
+        existing = {
+            tuple(key)
+            for key in db.query(*(getattr(model, name) for name in models.PAYLINE_NATURAL_KEY))
+            .filter(model.tab_name.in_(tabs))
+            .all()
+        }
+        missing = [row for key, row in rows.items() if key not in existing]
+        if not missing:
+            return 0
+        try:
+            db.execute(sqlalchemy.insert(model), missing)
+            db.commit()
+            return len(missing)
+        except sqlalchemy.exc.IntegrityError:
+            # Another run inserted some of the same keys in between; re-read and retry once
+            db.rollback()
+            if attempt:
+                raise
+    return 0
 
 def payline_playwright_bot(
     payline_data: PaylineExcelItem,
@@ -109,7 +196,7 @@ def payline_playwright_bot(
             ps_target_frame(page).get_by_role("link", name="Goal").click()
             page.wait_for_load_state("networkidle")
             ps_target_frame(page).get_by_role("textbox", name="SetID").fill("KHEDU")
-            latest_goal_code = run_raw_sql()
+            latest_goal_code = latest_khedu_goal_code()
             if latest_goal_code == "999":
                 goal_code = "100"
             else:
@@ -258,7 +345,7 @@ def payline_playwright_bot(
                 browser.close()
 
 
-def run_payline_entry(test_mode: bool = True, additional_instructions: str = None):
+def run_payline_entry(test_mode: bool = True, additional_instructions: str = None, runid: Optional[str] = None):
     """
     Process all paylines for one excel file in a directory.
     Returns (VoucherRunLog, list[VoucherProcessLog]).
@@ -274,7 +361,7 @@ def run_payline_entry(test_mode: bool = True, additional_instructions: str = Non
     if not excel_path.exists():
         raise RuntimeError(f"Adjustment file {excel_path} not found")
 
-    runid = generate_runid(
+    runid = runid or generate_runid(
         identifier="payline",
         test_mode=test_mode,
         bot_name="payline_entry",
@@ -301,49 +388,30 @@ def run_payline_entry(test_mode: bool = True, additional_instructions: str = Non
 
     # payline entry results to DB
     db = database.SessionLocal()
-    for payline in paylines:
-        try:
-            payload = payline.model_dump()
-            orm_row = models.PaylineExcelItem(**payload)
-            # check if exists by unique fields (tab_name, emplid, empl_rcd, ern_ded_code, amount)
-            existing = db.query(models.PaylineExcelItem).filter_by(
-                tab_name=payline.tab_name,
-                emplid=payline.emplid,
-                empl_rcd=payline.empl_rcd,
-                ern_ded_code=payline.ern_ded_code,
-                amount=payline.amount
-            ).first()
-            if existing:
-                continue  # Skip duplicates
-            else:
-                db.add(orm_row)
-                db.commit()
-        except Exception as e:
-            print(f"DB error for {payline}: {e}")
+    try:
+        inserted = insert_missing_paylines(db, paylines)
+        print(f"Stored {inserted} new paylines ({len(paylines) - inserted} already known).")
+    except Exception as e:
+        db.rollback()
+        print(f"DB error storing paylines: {e}")
 
     # Get all paylines with status of new
     paylines_to_process = db.query(models.PaylineExcelItem).filter_by(status="new").all()
 
-    # Run SQL to check if they have been entered in PS already and update status to processed if so
-    for payline in paylines_to_process:
-        try:
-            count = int(run_raw_sql(
-                payline.emplid,
-                payline.empl_rcd,
-                payline.earnings_begin_dt,
-                payline.earnings_end_dt,
-                payline.ern_ded_code,
-                payline.amount
-            ))
-            if count > 0:
-                payline.status = "processed"
-                db.commit()
-        except Exception as e:
-            print(f"SQL check error for {payline}: {e}")
+    # Check which have been entered in PS already (set-based) and mark them processed
+    try:
+        entered = find_entered_paylines(paylines_to_process)
+        if entered:
+            mark_paylines_status(db, entered, "processed")
+            print(f"{len(entered)} paylines already entered in PeopleSoft.")
+    except Exception as e:
+        db.rollback()
+        print(f"SQL check error: {e}")
 
     paylines_to_process = db.query(models.PaylineExcelItem).filter_by(status="new").all()
     print(f"Found {len(paylines_to_process)} paylines to process.")
 
+    pending_commits = 0
     for payline in paylines_to_process:
         try:
             #result = payline_playwright_bot(
@@ -365,9 +433,13 @@ def run_payline_entry(test_mode: bool = True, additional_instructions: str = Non
             runlog.failures += 1
             payline.status = "error"
             payline.notes = str(e)
-        db.commit()
+        pending_commits += 1
+        if pending_commits >= PAYLINE_COMMIT_EVERY:
+            db.commit()
+            pending_commits = 0
 
-        db.close()
+    db.commit()
+    db.close()
 
     t1 = time.time()
     print(f"Average time per payline: {(t1 - t0) / len(paylines_to_process):.2f} seconds.")
@@ -393,5 +465,4 @@ def test():
     return payline_result
 
 if __name__ == "__main__":
-    #run_raw_sql('127518', 0, '2025-08-01', '2025-08-31', 'RSA', 813.18)
     run_payline_entry(test_mode=True)
@@ -1,20 +1,15 @@
-import base64
-import io
-
 from langchain.tools import tool
 import fitz
 from pathlib import Path
 from app.schemas import PDFExtractionResult
 from app.bots.utils.ocr import (
-    page_pixmap,
-    pixmap_to_pil,
+    encode_preview_b64,
     safe_preview_b64,
-    preprocess_for_ocr,
-    ocr_image,
-    check_ocr,
+    ocr_pdf_pages,
+    ocr_file_image_cached,
+    ocr_available,
 )
 
-OCR_AVAILABLE = check_ocr()
 IMAGE_SUFFIXES = {
     ".png",
     ".jpg",
@@ -28,42 +23,6 @@ IMAGE_SUFFIXES = {
 MIN_NATIVE_TEXT_LENGTH = 30
 
 
-def _pil_preview_b64(img, *, max_chars: int) -> str:
-    """
-    Build an image preview guaranteed to be <= max_chars in base64 length.
-    Mirrors safe_preview_b64 but works with a PIL Image instance.
-    """
-    from PIL import Image
-
-    try:
-        working = img.convert("RGB")
-        quality = 60
-        width, height = working.size
-
-        while True:
-            buf = io.BytesIO()
-            working.save(buf, format="JPEG", quality=quality, optimize=True)
-            b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-            if len(b64) <= max_chars:
-                return b64
-
-            new_w = max(int(width * 0.8), 400)
-            new_h = max(int(height * 0.8), 400)
-            if (new_w, new_h) == (width, height) and quality <= 45:
-                return ""
-            working = working.resize((new_w, new_h), Image.LANCZOS)
-            width, height = new_w, new_h
-            if quality > 45:
-                quality -= 5
-    except Exception:
-        return ""
-
-
-def _ocr_pil_image(img, *, lang: str, psm: int = 6) -> str:
-    processed = preprocess_for_ocr(img)
-    return ocr_image(processed, lang=lang, psm=psm).strip()
-
-
 def _extract_image_file(
     path: Path,
     *,
@@ -77,9 +36,9 @@ def _extract_image_file(
     with Image.open(path) as img:
         preview_b64 = ""
         if include_preview_on_ocr:
-            preview_b64 = _pil_preview_b64(img, max_chars=max_preview_b64_chars)
+            preview_b64 = encode_preview_b64(img, max_chars=max_preview_b64_chars)
 
-        if not OCR_AVAILABLE:
+        if not ocr_available():
             return PDFExtractionResult(
                 extracted_text="",
                 image_base64=preview_b64,
@@ -95,7 +54,7 @@ def _extract_image_file(
                 description="Image provided; OCR disabled by parameter",
             )
 
-        ocr_text = _ocr_pil_image(img, lang=ocr_lang)
+        ocr_text = ocr_file_image_cached(path, img, lang=ocr_lang)
         if ocr_text:
             return PDFExtractionResult(
                 extracted_text=ocr_text,
@@ -122,12 +81,15 @@ def extract_pdf_contents(
     preview_dpi: int = 140,
     max_ocr_pages: int = 5,
     include_preview_on_ocr: bool = False,
+    include_preview_on_native: bool = True,
     max_preview_b64_chars: int = 1_000_000,
 ) -> PDFExtractionResult:
     """
     Extract text from a PDF or image file. If no text layer / image input, optionally OCR.
-    Returns a size-capped JPEG preview for native-text PDFs; omits the preview
-    on OCR (by default) to avoid large base64 payloads.
+    Returns a size-capped JPEG preview for native-text PDFs (unless
+    include_preview_on_native is False); omits the preview on OCR (by default)
+    to avoid large base64 payloads. native_text is True when the PyMuPDF text
+    layer alone was sufficient.
     """
     try:
         path = Path(input).expanduser().resolve()
@@ -172,22 +134,28 @@ def extract_pdf_contents(
             native_text_length = len(native_text)
 
             first_page = doc[0]
-            native_preview_b64 = safe_preview_b64(
-                first_page, dpi=preview_dpi, max_chars=max_preview_b64_chars
-            )
 
             sufficient_native_text = native_text_length >= MIN_NATIVE_TEXT_LENGTH
             short_native_text = native_text if not sufficient_native_text else ""
 
             if sufficient_native_text:
+                native_preview_b64 = ""
+                if include_preview_on_native:
+                    native_preview_b64 = safe_preview_b64(
+                        first_page, dpi=preview_dpi, max_chars=max_preview_b64_chars
+                    )
                 return PDFExtractionResult(
                     extracted_text=native_text,
                     image_base64=native_preview_b64,
                     success=True,
                     description="PyMuPDF text layer",
+                    native_text=True,
                 )
 
-            if not (ocr_if_empty and OCR_AVAILABLE):
+            if not (ocr_if_empty and ocr_available()):
+                native_preview_b64 = safe_preview_b64(
+                    first_page, dpi=preview_dpi, max_chars=max_preview_b64_chars
+                )
                 description = (
                     f"Short text layer (<{MIN_NATIVE_TEXT_LENGTH} chars); OCR disabled/unavailable"
                     if short_native_text
@@ -200,16 +168,12 @@ def extract_pdf_contents(
                     description=description,
                 )
 
-            ocr_text_parts = []
             pages_to_ocr = min(len(doc), max_ocr_pages)
-            for i in range(pages_to_ocr):
-                pix = page_pixmap(doc[i], dpi=ocr_dpi)
-                pil_img = pixmap_to_pil(pix)
-                page_text = _ocr_pil_image(pil_img, lang=ocr_lang, psm=6)
-                if page_text:
-                    ocr_text_parts.append(page_text)
-
-            ocr_text = "\n".join(ocr_text_parts).strip()
+            ocr_text_parts = ocr_pdf_pages(
+                str(path), doc, range(pages_to_ocr), dpi=ocr_dpi, lang=ocr_lang, psm=6
+            )
+
+            ocr_text = "\n".join(t for t in ocr_text_parts if t).strip()
 
             ocr_preview_b64 = ""
             if include_preview_on_ocr:
@@ -7,6 +7,9 @@ from uuid import uuid4
 
 from dateutil import parser
 
+from app.services.cancellation import cancellation_registry
+from app.services.run_events import publish_run_event
+
 
 def normalize_date(date_str: str) -> str:
     """Convert various date formats into mm/dd/yyyy."""
@@ -122,6 +125,7 @@ def update_bot_run_status(
         if context_updates:
             bot_run.context = _merge_context(bot_run.context, context_updates)
         session.commit()
+        publish_run_event(runid, "status", status=status, message=bot_run.message)
         return True
     finally:
         if owns_session:
@@ -137,17 +141,26 @@ def request_run_cancel(runid: str, *, message: Optional[str] = None) -> bool:
         if bot_run is None or bot_run.status in {"completed", "failed", "cancelled"}:
             return False
         bot_run.cancel_requested = True
-        if bot_run.status not in {"cancelled", "failed"}:
+        if bot_run.status == "queued":
+            bot_run.status = "cancelled"
+        elif bot_run.status not in {"cancelled", "failed"}:
             bot_run.status = "cancel_requested"
         if message:
             bot_run.message = message
         session.commit()
-        return True
+        publish_run_event(runid, "status", status=bot_run.status, message=bot_run.message)
     finally:
         session.close()
+    cancellation_registry.cancel(runid)
+    return True
 
 
 def is_run_cancel_requested(runid: str) -> bool:
+    """In-memory check when the run registered a cancellation token, else a DB read."""
+    token = cancellation_registry.get(runid)
+    if token is not None:
+        return token.cancelled
+
     from app import database, models
 
     session = database.SessionLocal()
@@ -2,11 +2,26 @@
 import fitz
 import io, os
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
 import pytesseract
 from dotenv import load_dotenv
 
 load_dotenv()
 
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", ".cache/ocr")
+OCR_CACHE_MEMORY_ENTRIES = int(os.getenv("OCR_CACHE_MEMORY_ENTRIES", "2048"))
+# Size cap of OCR_CACHE_DIR; the least recently used pages are deleted beyond it (0: no cap)
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "500"))
+# Writes between two checks of the cap
+OCR_CACHE_PRUNE_EVERY = 100
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+
 # ---------- helpers ----------
 
 def check_ocr():
@@ -23,6 +38,17 @@ def check_ocr():
         OCR_AVAILABLE = False
     return OCR_AVAILABLE
 
+
+_ocr_available: bool | None = None
+
+
+def ocr_available() -> bool:
+    """check_ocr() once per process, on first use rather than at import."""
+    global _ocr_available
+    if _ocr_available is None:
+        _ocr_available = check_ocr()
+    return _ocr_available
+
 def page_pixmap(page, dpi: int) -> fitz.Pixmap:
     scale = dpi / 72.0
     return page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
@@ -35,31 +61,82 @@ def pixmap_to_pil(pix: fitz.Pixmap):
 def safe_preview_b64(page, dpi=140, *, max_chars=1_000_000) -> str:
     """
     Build an image preview guaranteed to be <= max_chars in base64 length.
-    Uses JPEG + iterative downscale if needed; returns '' if it can't fit.
+    Renders the page once and hands it to encode_preview_b64; returns '' if it can't fit.
     """
     try:
-        from PIL import Image
         pix = page_pixmap(page, dpi=dpi)
-        img = pixmap_to_pil(pix).convert("RGB")
+        return encode_preview_b64(pixmap_to_pil(pix), max_chars=max_chars)
+    except Exception:
+        return ""
+
+def encode_preview_b64(
+    img,
+    *,
+    max_chars: int = 1_000_000,
+    max_quality: int = 60,
+    min_quality: int = 45,
+    min_side: int = 400,
+    stats: dict | None = None,
+) -> str:
+    """
+    Encode a PIL image as a JPEG whose base64 form is <= max_chars.
+
+    One full-size encode at max_quality measures the image; if it is too big,
+    the target dimensions are estimated from that size (bytes scale roughly
+    with pixel area) and quality is binary-searched within
+    [min_quality, max_quality]. Sizes are compared in raw bytes and only the
+    final JPEG is base64-encoded. Returns '' if it can't fit at min_side.
+    Pass `stats` to collect the number of encodes performed.
+    """
+    from PIL import Image
+
+    max_bytes = (max_chars // 4) * 3
 
-        quality = 60
-        width, height = img.size
+    def _encode(image, quality: int) -> bytes:
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=quality, optimize=True)
+        if stats is not None:
+            stats["encodes"] = stats.get("encodes", 0) + 1
+        return buf.getvalue()
 
+    try:
+        working = img.convert("RGB")
+        data = _encode(working, max_quality)
+        if len(data) <= max_bytes:
+            return base64.b64encode(data).decode("utf-8")
+
+        width, height = working.size
+        floor_w, floor_h = min(width, min_side), min(height, min_side)
+        measured = len(data)  # smallest known-too-big size at the current dimensions
         while True:
-            buf = io.BytesIO()
-            img.save(buf, format="JPEG", quality=quality, optimize=True)
-            b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-            if len(b64) <= max_chars:
-                return b64
-            # shrink & (lightly) drop quality
-            new_w = max(int(width * 0.8), 400)
-            new_h = max(int(height * 0.8), 400)
-            if (new_w, new_h) == (width, height) and quality <= 45:
+            if (width, height) != (floor_w, floor_h):
+                # 0.9 leaves headroom for JPEG overhead that doesn't scale with area
+                scale = (max_bytes / measured) ** 0.5 * 0.9
+                new_w = max(int(width * scale), floor_w)
+                new_h = max(int(height * scale), floor_h)
+                working = working.resize((new_w, new_h), Image.LANCZOS)
+                width, height = new_w, new_h
+
+                # The estimate targets max_quality; fall back to a binary search below it
+                candidate = _encode(working, max_quality)
+                if len(candidate) <= max_bytes:
+                    return base64.b64encode(candidate).decode("utf-8")
+                measured = len(candidate)
+            best = None
+            low, high = min_quality, max_quality - 1
+            while low <= high:
+                quality = (low + high) // 2
+                candidate = _encode(working, quality)
+                if len(candidate) <= max_bytes:
+                    best = candidate
+                    low = quality + 1
+                else:
+                    measured = min(measured, len(candidate))
+                    high = quality - 1
+            if best is not None:
+                return base64.b64encode(best).decode("utf-8")
+            if (width, height) == (floor_w, floor_h):
                 return ""  # give up, safer to omit
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            width, height = new_w, new_h
-            if quality > 45:
-                quality -= 5
     except Exception:
         return ""
 
@@ -72,3 +149,198 @@ def preprocess_for_ocr(img):
 def ocr_image(img, lang="eng", psm=6) -> str:
     config = f"--oem 3 --psm {psm}"
     return pytesseract.image_to_string(img, lang=lang, config=config)
+
+
+# ---------- page OCR cache ----------
+
+def page_content_hash(doc, page) -> str:
+    """
+    Hash of what a page renders from: its content stream(s), embedded images,
+    size and rotation. Identical scans hash the same across files and runs.
+    """
+    h = hashlib.sha256()
+    h.update(page.read_contents() or b"")
+    for img in page.get_images(full=True):
+        try:
+            h.update(doc.xref_stream_raw(img[0]) or b"")
+        except Exception:
+            h.update(str(img).encode("utf-8"))
+    h.update(f"{tuple(page.rect)}:{page.rotation}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class OcrCache:
+    """
+    Per-page OCR text keyed by content hash + OCR parameters.
+    The OCR_CACHE_MEMORY_ENTRIES most recently used pages are kept in memory,
+    and up to OCR_CACHE_MAX_MB of them in OCR_CACHE_DIR, so re-runs skip OCR
+    entirely. The directory can also be deleted by hand at any time.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = OCR_CACHE_DIR,
+        max_entries: int = OCR_CACHE_MEMORY_ENTRIES,
+        max_mb: float = OCR_CACHE_MAX_MB,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _remember(self, key: str, text: str) -> None:
+        with self._lock:
+            self._memory[key] = text
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    @staticmethod
+    def key(content_hash: str, *, dpi: int, lang: str, psm: int) -> str:
+        return hashlib.sha256(f"{content_hash}:{dpi}:{lang}:{psm}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if self.directory is None:
+            return None
+        path = self.directory / f"{key}.txt"
+        try:
+            text = path.read_text(encoding="utf-8")
+            # Pruning goes by mtime, so a hit marks the page as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, text)
+        return text
+
+    def set(self, key: str, text: str) -> None:
+        self._remember(key, text)
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f"{key}.{os.getpid()}.tmp"
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, self.directory / f"{key}.txt")
+        except OSError as exc:
+            print(f"[OCR] Could not persist cache entry {key[:12]}: {exc}")
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % OCR_CACHE_PRUNE_EVERY == 1
+        if due:
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete the least recently used pages until OCR_CACHE_DIR is under its cap. Returns pages deleted."""
+        if self.directory is None or self.max_bytes <= 0:
+            return 0
+        entries = []
+        for path in self.directory.glob("*.txt"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            print(f"[OCR] Pruned {removed} cached pages from {self.directory}")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+ocr_cache = OcrCache()
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: safe under threaded servers and matches Windows behaviour
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def shutdown_ocr_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _ocr_page(pdf_path: str, page_index: int, dpi: int, lang: str, psm: int) -> str:
+    """Render + OCR one page. Top-level so it can run in a worker process."""
+    check_ocr()
+    with fitz.open(pdf_path) as doc:
+        pix = page_pixmap(doc[page_index], dpi=dpi)
+    img = pixmap_to_pil(pix)
+    return ocr_image(preprocess_for_ocr(img), lang=lang, psm=psm).strip()
+
+
+def ocr_pdf_pages(pdf_path: str, doc, page_indices, *, dpi: int = 300, lang: str = "eng", psm: int = 6) -> list[str]:
+    """
+    OCR the given pages of an open document, returning text per page in order.
+    Cached pages cost nothing; misses are spread across a process pool.
+    """
+    page_indices = list(page_indices)
+    texts: dict[int, str] = {}
+    misses: dict[int, str] = {}
+    for i in page_indices:
+        key = OcrCache.key(page_content_hash(doc, doc[i]), dpi=dpi, lang=lang, psm=psm)
+        cached = ocr_cache.get(key)
+        if cached is not None:
+            texts[i] = cached
+        else:
+            misses[i] = key
+
+    if misses:
+        print(f"[OCR] {len(page_indices) - len(misses)} cached, {len(misses)} to OCR (dpi={dpi})")
+        if len(misses) == 1 or OCR_WORKERS <= 1:
+            results = {i: _ocr_page(pdf_path, i, dpi, lang, psm) for i in misses}
+        else:
+            try:
+                pool = _get_ocr_pool()
+                futures = {i: pool.submit(_ocr_page, pdf_path, i, dpi, lang, psm) for i in misses}
+                results = {i: future.result() for i, future in futures.items()}
+            except BrokenProcessPool:
+                shutdown_ocr_pool()
+                results = {i: _ocr_page(pdf_path, i, dpi, lang, psm) for i in misses}
+        for i, text in results.items():
+            ocr_cache.set(misses[i], text)
+            texts[i] = text
+
+    return [texts[i] for i in page_indices]
+
+
+def ocr_file_image_cached(path, img, *, lang: str = "eng", psm: int = 6) -> str:
+    """OCR a standalone image file, cached by the file's bytes."""
+    content_hash = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    key = OcrCache.key(content_hash, dpi=0, lang=lang, psm=psm)
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        return cached
+    text = ocr_image(preprocess_for_ocr(img), lang=lang, psm=psm).strip()
+    ocr_cache.set(key, text)
+    return text
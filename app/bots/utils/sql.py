@@ -0,0 +1,18 @@
+from typing import Sequence
+
+
+def values_table(dialect_name: str, alias: str, columns: Sequence[str], rows: Sequence[str]) -> str:
+    """
+    A derived table over literal rows, each an already parenthesized tuple of
+    bind placeholders, for joining a batch of candidates against PeopleSoft.
+
+    SQL Server only accepts a VALUES list as a derived table with a column
+    list, `(VALUES ...) AS C (A, B)`, never as a CTE. SQLite (tests) has no
+    column lists on derived tables, so there the VALUES columns (column1, ...)
+    are renamed in a subquery instead.
+    """
+    values = ", ".join(rows)
+    if dialect_name == "sqlite":
+        renamed = ", ".join(f"column{i} AS {name}" for i, name in enumerate(columns, 1))
+        return f"(SELECT {renamed} FROM (VALUES {values})) AS {alias}"
+    return f"(VALUES {values}) AS {alias} ({', '.join(columns)})"
@@ -0,0 +1,37 @@
+"""
+Vendor invoice folders for voucher entry.
+
+Kept apart from app.bots.voucher_entry so the API can validate a vendor_key
+without importing Playwright and the extraction agents.
+"""
+from pathlib import Path
+
+
+# TODO: Handle server deployment for file access
+def get_vendor_directory(vendor_key: str, test_mode: bool) -> Path:
+    if test_mode:
+        base_dir = r"C:\Users\Bob_Dickson\OneDrive - Kern High School District\Documents\InvoiceProcessing"
+        vendor_dirs = {
+            "royal": "Royal Industrial",
+            "class": "Class Leasing",
+            "mobile": "Mobile Modular",
+            "floyds": "Floyds",
+            "seq": "Sequoia",
+            "cdw": "CDW",
+            "grainger": "Grainger",
+            "vestis": "Vestis",
+        }
+    else:
+        base_dir = r"C:\Users\Bob_Dickson\OneDrive - Kern High School District\Documents - Fiscal\Accounts Payable"
+        vendor_dirs = {
+            "royal": "Royal Industrial",
+            "class": "Class Leasing Invoices",
+            "mobile": "Mobile Modular Invoices",
+            "floyds": "Floyd's (Standard Plumbing) invoices",
+            "seq": "Sequioa Paint",
+            "cdw": "CDW",
+            "attach": "Invoices scanned, need to be attached",
+            "grainger": "Grainger",
+            "vestis": "Vestis",
+        }
+    return Path(base_dir) / vendor_dirs[vendor_key]
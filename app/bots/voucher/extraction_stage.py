@@ -17,23 +17,29 @@ Fields to extract:
 - lines: description, quantity (if present), unit_price (if present), line_amount (required)
 """
 
-def run_extraction(filepath: str, extra_prompt: str | None = None) -> ExtractedInvoice:
+def _is_usable_extraction(invoice: ExtractedInvoice) -> bool:
+    """Text-only extractions missing the basics are retried with the page image."""
+    return bool(invoice.invoice_number) and invoice.total_amount > 0
+
+
+def run_extraction(filepath: str, extra_prompt: str | None = None, document_mode: str | None = None) -> ExtractedInvoice:
     """
     Use the multimodal extractor to build an ExtractedInvoice.
     Optionally append vendor-specific instructions.
+    document_mode defaults to the per-stage setting (hybrid unless overridden).
     """
     path = Path(filepath).expanduser().resolve()
     if not path.exists():
         raise FileNotFoundError(f"File not found: {path}")
 
-    prompt = EXTRACTION_PROMPT
-    if extra_prompt:
-        prompt = prompt + "\n\nVendor-specific instructions:\n" + extra_prompt
-
     result = extract_to_schema(
         str(path),
         ExtractedInvoice,
-        prompt=prompt,
+        prompt=EXTRACTION_PROMPT,
+        vendor_prompt=extra_prompt,
+        mode=document_mode,
+        stage="extraction",
+        is_confident=_is_usable_extraction,
     )
 
     # Ensure we have at least one line for downstream logic
@@ -4,18 +4,25 @@ from langchain_core.messages import HumanMessage
 from .models import ExtractedInvoice, POLine, LineMapping, InvoiceLine
 from .prompts.line_mapper import LINE_MAPPER_PROMPT
 from app.services.langfuse import langfuse_handler
-from app.bots.tools.extract_pdf import extract_pdf_contents
+from app.services.llm_backend import invoke_agent
+from app.services.usage import usage_handler
+from app.bots.agents.multimodal import run_document_stage
+from app.bots.agents.prompt_layout import PromptLayout
 
 
-def generate_line_mapping(invoice: ExtractedInvoice, po_lines: list[POLine], filepath: str, extra_prompt: str | None = None) -> LineMapping:
-    system_prompt = LINE_MAPPER_PROMPT
-    if extra_prompt:
-        system_prompt = system_prompt + "\n\nVendor-specific instructions:\n" + extra_prompt
+def generate_line_mapping(
+    invoice: ExtractedInvoice,
+    po_lines: list[POLine],
+    filepath: str,
+    extra_prompt: str | None = None,
+    document_mode: str | None = None,
+) -> LineMapping:
+    layout = PromptLayout(LINE_MAPPER_PROMPT, extra_prompt)
     agent = create_agent(
         name="Voucher Line Mapper",
-        system_prompt=system_prompt,
+        system_prompt=layout.system_prompt(),
         tools=[],
-        model="gpt-5-mini",
+        model=layout.chat_model("line_mapper"),
         response_format=LineMapping,
     )
 
@@ -24,37 +31,37 @@ def generate_line_mapping(invoice: ExtractedInvoice, po_lines: list[POLine], fil
         f"PO Lines JSON: {[l.model_dump() for l in po_lines]}"
     )
 
-    pdf_contents = extract_pdf_contents.invoke(
-        {"input": filepath, "include_preview_on_ocr": True}
-    )
-    if isinstance(pdf_contents, dict):
-        extracted_text = pdf_contents.get("extracted_text", "") or ""
-        image_b64 = pdf_contents.get("image_base64", "") or ""
-    else:
-        extracted_text = getattr(pdf_contents, "extracted_text", "") or ""
-        image_b64 = getattr(pdf_contents, "image_base64", "") or ""
+    known_lines = {line.po_line for line in po_lines}
 
-    content_blocks = [{"type": "text", "text": user_prompt}]
-    if extracted_text:
-        content_blocks.append({"type": "text", "text": extracted_text})
-    if image_b64:
-        content_blocks.append(
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": image_b64
-                    if image_b64.startswith("data:image")
-                    else f"data:image/jpeg;base64,{image_b64}"
-                },
-            }
+    def _invoke(document: list[dict]) -> LineMapping:
+        content_blocks = [{"type": "text", "text": user_prompt}, *document]
+        result = invoke_agent(
+            "line_mapper",
+            agent,
+            {"messages": [HumanMessage(content=content_blocks)]},
+            schema=LineMapping,
+            prompt=layout.system_prompt(),
+            config={"callbacks": [langfuse_handler, usage_handler]},
+        )
+        structured = result.get("structured_response", result)
+        return (
+            structured
+            if isinstance(structured, LineMapping)
+            else LineMapping.model_validate(structured)
         )
 
-    result = agent.invoke({"messages": [HumanMessage(content=content_blocks)]}, config={"callbacks": [langfuse_handler]})
-    structured = result.get("structured_response", result)
-    return (
-        structured
-        if isinstance(structured, LineMapping)
-        else LineMapping.model_validate(structured)
+    def _is_valid(mapping: LineMapping) -> bool:
+        # Empty mappings or lines not on the PO mean the text alone wasn't enough
+        if not mapping.lines:
+            return False
+        return not known_lines or all(entry.po_line in known_lines for entry in mapping.lines)
+
+    return run_document_stage(
+        "line_mapper",
+        filepath,
+        _invoke,
+        mode=document_mode,
+        is_confident=_is_valid,
     )
 
 
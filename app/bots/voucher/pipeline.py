@@ -5,12 +5,20 @@ from pydantic import BaseModel
 
 from .extraction_stage import run_extraction
 from .po_identifier import identify_po
-from .po_sql import load_po_lines
+from .preflight import existing_voucher_id, find_existing_voucher, invoice_key
+from .po_sql import invalidate_po_lines, load_po_lines, load_po_lines_many
 from .line_mapper import generate_line_mapping
 from .executor import execute_voucher_entry
 from .models import VoucherEntryPlan
-from .vendor_detection import detect_vendor, load_special_vendor_prompts
+from .vendor_detection import detect_vendor, load_special_vendor_prompts, referenced_po_ids
 from .review_agent import review_plan
+from app.bots.agents.multimodal import track_document_modes
+from app.bots.utils.misc import update_bot_run_status
+from app.services.cancellation import cancellation_token
+from app.services.invoice_ledger import invoice_ledger, ledger_key
+from app.services.process_log_writer import process_log_writer
+from app.services.run_events import publish_run_event
+from app.services.usage import track_usage, usage_context
 from app.bots.voucher.utils import (
     is_numeric_voucher,
     move_invoice_file,
@@ -32,7 +40,35 @@ def run_v2_voucher(
     special_prompts = special_vendor_prompts or load_special_vendor_prompts()
     print(f"[PIPELINE] Loaded special vendor prompts for vendors: {list(special_prompts.keys())}")
 
+    filename = Path(filepath).name
+
+    def _stage(stage: str) -> None:
+        publish_run_event(runid, "stage", filename=filename, stage=stage)
+
+    def _finish(result: dict, review_reason: str = "") -> None:
+        try:
+            if not test_mode:
+                move_invoice_file(filepath, result, processed_dir, duplicates_dir)
+            status = (
+                "duplicate"
+                if result.get("duplicate")
+                else "success"
+                if is_numeric_voucher(result.get("voucher_id"))
+                else "failure"
+            )
+            log_process_to_db(
+                runid=runid,
+                filename=filename,
+                voucher_id=result.get("voucher_id", ""),
+                amount=invoice.total_amount,
+                invoice_number=invoice.invoice_number,
+                status=status + review_reason,
+            )
+        except Exception as e:
+            print(f"[PIPELINE] Post-processing error: {e}")
+
     # Stage 0 - Detect vendor for special handling prompt
+    _stage("vendor_detection")
     detected_vendor, vendor_prompts = detect_vendor(filepath, special_prompts)
     print(f"[PIPELINE] Detected vendor: {detected_vendor}, has special prompts: {bool(vendor_prompts)}")
     if detected_vendor and not vendor_prompts:
@@ -42,21 +78,41 @@ def run_v2_voucher(
 
     # Stage 1 - Extract
     print("[PIPELINE] Running extraction...")
+    _stage("extraction")
     invoice = run_extraction(filepath, extra_prompt=extraction_prompt)
     print(f"[PIPELINE] Extracted invoice: {invoice.invoice_number}, vendor: {invoice.vendor_name}")
 
     # Stage 2 - Validate PO
     print("[PIPELINE] Identifying PO...")
+    _stage("po_identifier")
     validated_po = identify_po(invoice, filepath, extra_prompt=po_prompt)
     print(f"[PIPELINE] Validated PO: {validated_po.po_id} (confidence={validated_po.confidence})")
 
+    # Already entered (ledger) or vouchered in PeopleSoft: skip mapping, review and the browser
+    key = ledger_key(validated_po.vendor_id, invoice.invoice_number, invoice.total_amount, test_mode=test_mode)
+    entered_voucher = invoice_ledger.entered([key]).get(key)
+    duplicate = None if entered_voucher else find_existing_voucher(invoice, validated_po)
+    if entered_voucher or duplicate is not None:
+        alert = duplicate.describe() if duplicate is not None else f"Already entered as voucher {entered_voucher}"
+        print(f"[PIPELINE] {alert}, skipping entry")
+        result = {
+            "voucher_id": "Duplicate",
+            "duplicate": True,
+            "out_of_balance": False,
+            "alert": alert,
+        }
+        _finish(result)
+        return result
+
     # Stage 3 - Load PO Lines
     print("[PIPELINE] Loading PO lines...")
+    _stage("po_lines")
     po_lines = load_po_lines(validated_po.po_id)
     print(f"[PIPELINE] Loaded {len(po_lines)} PO lines")
 
     # Stage 4 - Line Mapping
     print("[PIPELINE] Generating line mapping...")
+    _stage("line_mapping")
     mapping = generate_line_mapping(invoice, po_lines, filepath, extra_prompt=po_prompt)
     print(f"[PIPELINE] Mapping strategy: {mapping.strategy}, mapped lines: {len(mapping.lines)}")
 
@@ -81,6 +137,7 @@ def run_v2_voucher(
 
     # Stage 5 - Execute
     print("[PIPELINE] Reviewing plan before execution...")
+    _stage("review")
     decision = review_plan(plan, extra_prompt=po_prompt)
     print(f"[PIPELINE] Review decision: execute={decision.execute}, reason={decision.reason}")
 
@@ -93,32 +150,38 @@ def run_v2_voucher(
         }
     else:
         print("[PIPELINE] Executing voucher entry...")
-        result = execute_voucher_entry(plan, test_mode=test_mode, page=page, playwright=playwright)
+        _stage("execute")
+        claim = None
+        if key is not None:
+            claim = invoice_ledger.claim(
+                key,
+                runid=runid or filename,
+                filename=filename,
+                verify=lambda: existing_voucher_id(invoice_key(invoice, validated_po)),
+            )
+        if claim is not None and not claim.acquired:
+            # Another run entered or is entering the same invoice
+            result = {
+                "voucher_id": "Duplicate" if claim.voucher_id else "InProgress",
+                "duplicate": bool(claim.voucher_id),
+                "out_of_balance": False,
+                "alert": f"Claimed by run {claim.holder}",
+            }
+        else:
+            result = {}
+            try:
+                result = execute_voucher_entry(plan, test_mode=test_mode, page=page, playwright=playwright)
+            finally:
+                invoice_ledger.settle(claim, result.get("voucher_id"))
         print("[PIPELINE] Execution result:", result)
-    try:
-        if not test_mode:
-            move_invoice_file(filepath, result, processed_dir, duplicates_dir)
-        status = (
-            "duplicate"
-            if result.get("duplicate")
-            else "success"
-            if is_numeric_voucher(result.get("voucher_id"))
-            else "failure"
-        )
-        review_reason = ""
-        if result.get("voucher_id") == "ReviewBlocked":
-            reason_text = decision.short_reason or decision.reason or result.get("alert", "")
-            review_reason = f" Review reason: {reason_text}"
-        log_process_to_db(
-            runid=runid,
-            filename=Path(filepath).name,
-            voucher_id=result.get("voucher_id", ""),
-            amount=invoice.total_amount,
-            invoice_number=invoice.invoice_number,
-            status=status + review_reason,
-        )
-    except Exception as e:
-        print(f"[PIPELINE] Post-processing error: {e}")
+        if is_numeric_voucher(result.get("voucher_id")):
+            # Saving the voucher changes what is left on the PO
+            invalidate_po_lines(validated_po.po_id)
+    review_reason = ""
+    if result.get("voucher_id") == "ReviewBlocked":
+        reason_text = decision.short_reason or decision.reason or result.get("alert", "")
+        review_reason = f" Review reason: {reason_text}"
+    _finish(result, review_reason)
     return result
 
 
@@ -151,26 +214,61 @@ def run_v2_voucher_dir(
 
     files: Iterable[Path] = directory.glob("*.pdf")
     results = []
+    prefetch = referenced_po_ids(special_prompts.get(directory.name.lower()))
+    if prefetch:
+        try:
+            loaded = load_po_lines_many(prefetch)
+            print(f"[PIPELINE] Prefetched lines for {len(loaded)} POs referenced by the {directory.name} prompts")
+        except Exception as e:
+            print(f"[PIPELINE] PO line prefetch failed: {e}")
     from playwright.sync_api import sync_playwright
 
-    with sync_playwright() as p:
+    with (
+        sync_playwright() as p,
+        track_document_modes() as document_modes,
+        track_usage(runid) as usage,
+        process_log_writer(),
+        cancellation_token(runid) as cancel,
+    ):
         for f in files:
+            if cancel.cancelled:
+                print(f"[PIPELINE] Cancellation requested for run {runid}. Stopping further processing.")
+                break
             print(f"[PIPELINE] Processing file: {f.name}")
             try:
-                result = run_v2_voucher(
-                    str(f),
-                    page,
-                    special_vendor_prompts=special_prompts,
-                    test_mode=test_mode,
-                    runid=runid,
-                    processed_dir=processed_dir,
-                    duplicates_dir=duplicates_dir,
-                    playwright=p,
-                )
+                with usage_context(filename=f.name):
+                    result = run_v2_voucher(
+                        str(f),
+                        page,
+                        special_vendor_prompts=special_prompts,
+                        test_mode=test_mode,
+                        runid=runid,
+                        processed_dir=processed_dir,
+                        duplicates_dir=duplicates_dir,
+                        playwright=p,
+                    )
                 results.append((f.name, result))
             except Exception as e:
                 print(f"[PIPELINE] Error processing {f.name}: {e}")
                 results.append((f.name, {"error": str(e)}))
+
+    mode_summary = document_modes.summary()
+    saved = mode_summary.get("total", {}).get("image_tokens_saved", 0)
+    print(f"[PIPELINE] Document modes: {mode_summary} (~{saved} image tokens saved)")
+    usage_summary = usage.summary()
+    print(f"[PIPELINE] LLM usage: {usage_summary['total']}")
+    hit_rates = {stage: totals["cache_hit_rate"] for stage, totals in usage_summary["by_stage"].items()}
+    print(f"[PIPELINE] Prompt cache hit rate by stage: {hit_rates}")
+    update_bot_run_status(
+        runid,
+        "cancelled" if cancel.cancelled else "completed",
+        message="Cancelled by request" if cancel.cancelled else None,
+        context_updates={
+            "processed": len(results),
+            "document_modes": mode_summary,
+            "llm_usage": usage_summary,
+        },
+    )
     return results
 
 if __name__ == "__main__":
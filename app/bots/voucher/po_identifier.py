@@ -1,28 +1,37 @@
 from langchain.agents import create_agent
 from langchain.tools import tool
 from langchain_core.messages import HumanMessage
-from .po_sql import search_po_candidates
+from .po_index import search_po_index
 from .models import ExtractedInvoice, ValidatedPO, InvoiceLine
 from .prompts.po_identifier import PO_IDENTIFIER_PROMPT
 from app.services.langfuse import langfuse_handler
-from app.bots.tools.extract_pdf import extract_pdf_contents
+from app.services.llm_backend import invoke_agent
+from app.services.usage import usage_handler
+from app.bots.agents.multimodal import MIN_TEXT_ONLY_CONFIDENCE, run_document_stage
+from app.bots.agents.prompt_layout import PromptLayout
 
-def identify_po(invoice: ExtractedInvoice, filepath: str, extra_prompt: str | None = None) -> ValidatedPO:
+def identify_po(
+    invoice: ExtractedInvoice,
+    filepath: str,
+    extra_prompt: str | None = None,
+    document_mode: str | None = None,
+) -> ValidatedPO:
 
     @tool
     def po_search(pattern: str) -> list[dict]:
-        """Search for PO candidates in PeopleSoft matching the given pattern."""
-        return search_po_candidates(pattern)
-
-    system_prompt = PO_IDENTIFIER_PROMPT
-    if extra_prompt:
-        system_prompt = system_prompt + "\n\nVendor-specific instructions:\n" + extra_prompt
+        """
+        Search for PO candidates in PeopleSoft matching the given SQL LIKE
+        pattern (e.g. %227878%). If nothing matches, similar PO ids are
+        returned with a `score` (1.0 = identical).
+        """
+        return search_po_index(pattern)
 
+    layout = PromptLayout(PO_IDENTIFIER_PROMPT, extra_prompt)
     agent = create_agent(
         name="Voucher PO Identifier",
-        system_prompt=system_prompt,
+        system_prompt=layout.system_prompt(),
         tools=[po_search],
-        model="gpt-5-mini",
+        model=layout.chat_model("po_identifier"),
         response_format=ValidatedPO,
     )
 
@@ -32,39 +41,30 @@ def identify_po(invoice: ExtractedInvoice, filepath: str, extra_prompt: str | No
         f"Fuzzy PO candidates: {invoice.fuzzy_po_candidates}"
     )
 
-    pdf_contents = extract_pdf_contents.invoke(
-        {"input": filepath, "include_preview_on_ocr": True}
-    )
-    if isinstance(pdf_contents, dict):
-        extracted_text = pdf_contents.get("extracted_text", "") or ""
-        image_b64 = pdf_contents.get("image_base64", "") or ""
-    else:
-        extracted_text = getattr(pdf_contents, "extracted_text", "") or ""
-        image_b64 = getattr(pdf_contents, "image_base64", "") or ""
-
-    content_blocks = [{"type": "text", "text": base_text}]
-    if extracted_text:
-        content_blocks.append({"type": "text", "text": extracted_text})
-    if image_b64:
-        content_blocks.append(
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": image_b64
-                    if image_b64.startswith("data:image")
-                    else f"data:image/jpeg;base64,{image_b64}"
-                },
-            }
+    def _invoke(document: list[dict]) -> ValidatedPO:
+        human_msg = HumanMessage(content=[{"type": "text", "text": base_text}, *document])
+        result = invoke_agent(
+            "po_identifier",
+            agent,
+            {"messages": [human_msg]},
+            schema=ValidatedPO,
+            prompt=layout.system_prompt(),
+            config={"callbacks": [langfuse_handler, usage_handler]},
         )
-    human_msg = HumanMessage(content=content_blocks)
+        structured = result.get("structured_response", result)
+        if not isinstance(structured, ValidatedPO):
+            structured = ValidatedPO.model_validate(structured)
+        if structured.confidence is None:
+            structured.confidence = 0.0
+        return structured
 
-    result = agent.invoke({"messages": [human_msg]}, config={"callbacks": [langfuse_handler]})
-    structured = result.get("structured_response", result)
-    if not isinstance(structured, ValidatedPO):
-        structured = ValidatedPO.model_validate(structured)
-    if structured.confidence is None:
-        structured.confidence = 0.0
-    return structured
+    return run_document_stage(
+        "po_identifier",
+        filepath,
+        _invoke,
+        mode=document_mode,
+        is_confident=lambda po: bool(po.po_id) and po.confidence >= MIN_TEXT_ONLY_CONFIDENCE,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""
+In-memory index of open PO headers for the PO identifier's `po_search` tool.
+
+`search_po_candidates` runs `PO_ID LIKE '%...%'` against PS_PO_HDR, which
+can't use an index and is called several times per invoice. The index keeps
+the open headers (see `load_open_po_headers`) in memory, refreshed every
+PO_INDEX_TTL_SECONDS, with a trigram posting list over the PO ids:
+
+    1. LIKE patterns are answered from the index (trigrams narrow the
+       candidates, a regex confirms them);
+    2. on a miss the live SQL search runs, so POs created or closed since the
+       last refresh are still found;
+    3. if that is empty too, PO ids similar to the pattern (trigram overlap,
+       then edit similarity >= PO_FUZZY_MIN_SCORE) are returned, which covers
+       OCR slips such as O/0 or a dropped digit.
+
+Once loaded, a stale index keeps serving while a background thread reloads it.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from difflib import SequenceMatcher
+from typing import Callable, Optional
+
+PO_INDEX_TTL_SECONDS = float(os.getenv("PO_INDEX_TTL_SECONDS", "900"))
+PO_FUZZY_MIN_SCORE = float(os.getenv("PO_FUZZY_MIN_SCORE", "0.8"))
+PO_SEARCH_LIMIT = 20
+
+
+def normalize_po_id(value: str) -> str:
+    return re.sub(r"[^0-9A-Z]", "", str(value).upper())
+
+
+def _trigrams(value: str) -> set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def _like_regex(pattern: str) -> re.Pattern:
+    """SQL LIKE pattern (% and _ wildcards, case-insensitive) as a regex."""
+    parts = []
+    for char in pattern:
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+class POHeaderIndex:
+    """Refreshable in-memory PO header index with exact, live and fuzzy lookup."""
+
+    def __init__(
+        self,
+        *,
+        ttl: float = PO_INDEX_TTL_SECONDS,
+        min_score: float = PO_FUZZY_MIN_SCORE,
+        loader: Optional[Callable[[], list[dict]]] = None,
+        live_search: Optional[Callable[[str], list[dict]]] = None,
+    ):
+        self.ttl = ttl
+        self.min_score = min_score
+        self._loader = loader
+        self._live_search = live_search
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._loaded_at: float | None = None
+        self._rows: list[dict] = []
+        self._ids: list[str] = []  # upper-cased PO_ID per row
+        self._postings: dict[str, set[int]] = {}
+
+    # ---------- loading ----------
+
+    def _load(self) -> list[dict]:
+        if self._loader is not None:
+            return self._loader()
+        from .po_sql import load_open_po_headers
+
+        return load_open_po_headers()
+
+    def _search_live(self, pattern: str) -> list[dict]:
+        if self._live_search is not None:
+            return self._live_search(pattern)
+        from .po_sql import search_po_candidates
+
+        return search_po_candidates(pattern)
+
+    def refresh(self) -> int:
+        """Reload the headers and rebuild the trigram postings. Returns rows indexed."""
+        rows = self._load()
+        ids = [str(row["po_id"]).upper() for row in rows]
+        postings: dict[str, set[int]] = {}
+        for position, po_id in enumerate(ids):
+            for gram in _trigrams(po_id) | _trigrams(normalize_po_id(po_id)):
+                postings.setdefault(gram, set()).add(position)
+        with self._lock:
+            self._rows, self._ids, self._postings = rows, ids, postings
+            self._loaded_at = time.monotonic()
+        print(f"[PO_INDEX] Indexed {len(rows)} open PO headers")
+        return len(rows)
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as exc:
+            print(f"[PO_INDEX] Refresh failed, keeping previous index: {exc}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_fresh(self) -> bool:
+        """Load on first use; afterwards refresh in the background when stale. Returns loaded."""
+        with self._lock:
+            loaded_at = self._loaded_at
+            stale = loaded_at is not None and time.monotonic() - loaded_at >= self.ttl
+            start_refresh = stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if loaded_at is None:
+            try:
+                self.refresh()
+            except Exception as exc:
+                print(f"[PO_INDEX] Load failed, using live search: {exc}")
+                return False
+        elif start_refresh:
+            threading.Thread(target=self._refresh_in_background, name="po-index-refresh", daemon=True).start()
+        return True
+
+    # ---------- lookup ----------
+
+    def _candidates(self, grams: set[str]) -> set[int] | None:
+        """Rows containing every trigram (None: no trigrams, scan everything)."""
+        if not grams:
+            return None
+        postings = [self._postings.get(gram, set()) for gram in grams]
+        return set.intersection(*sorted(postings, key=len))
+
+    def match(self, pattern: str, limit: int = PO_SEARCH_LIMIT) -> list[dict]:
+        """Index rows whose PO_ID matches the LIKE pattern."""
+        regex = _like_regex(pattern)
+        grams: set[str] = set()
+        for literal in re.split(r"[%_]", pattern.upper()):
+            grams |= _trigrams(literal)
+        with self._lock:
+            candidates = self._candidates(grams)
+            positions = sorted(candidates) if candidates is not None else range(len(self._ids))
+            hits = [self._rows[i] for i in positions if regex.fullmatch(self._ids[i])]
+        return hits[:limit]
+
+    def fuzzy(self, pattern: str, limit: int = PO_SEARCH_LIMIT) -> list[dict]:
+        """Index rows whose PO_ID is similar to the pattern, best first, with a `score`."""
+        query = normalize_po_id(pattern)
+        grams = _trigrams(query)
+        if not grams:
+            return []
+        with self._lock:
+            shared: dict[int, int] = {}
+            for gram in grams:
+                for position in self._postings.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            # Only score rows that share a reasonable part of the trigrams
+            floor = max(1, len(grams) // 3)
+            scored = []
+            for position, count in shared.items():
+                if count < floor:
+                    continue
+                po_id = normalize_po_id(self._ids[position])
+                score = SequenceMatcher(None, query, po_id).ratio()
+                shorter, longer = sorted((query, po_id), key=len)
+                if len(shorter) >= 5 and shorter in longer:
+                    score = max(score, 0.9)  # e.g. "KERNH-0000227878" vs "0000227878"
+                if score >= self.min_score:
+                    scored.append((score, position))
+            scored.sort(key=lambda item: (-item[0], self._ids[item[1]]))
+            return [{**self._rows[position], "score": round(score, 3)} for score, position in scored[:limit]]
+
+    def search(self, pattern: str, limit: int = PO_SEARCH_LIMIT) -> list[dict]:
+        """Drop-in for `search_po_candidates`: index, then live SQL, then fuzzy."""
+        if not self._ensure_fresh():
+            return self._search_live(pattern)
+        hits = self.match(pattern, limit)
+        if hits:
+            return hits
+        hits = self._search_live(pattern)
+        if hits:
+            return hits
+        return self.fuzzy(pattern, limit)
+
+
+po_header_index = POHeaderIndex()
+
+
+def search_po_index(pattern: str) -> list[dict]:
+    return po_header_index.search(pattern)
@@ -1,6 +1,15 @@
+import os
+import threading
+import time
+
 from .models import POLine
 from app.database import SessionLocalPS
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+
+# How long loaded PO lines are reused before PeopleSoft is queried again
+PO_LINES_TTL_SECONDS = float(os.getenv("PO_LINES_TTL_SECONDS", "600"))
+# PO ids per batch query (SQL Server allows 2100 parameters)
+PO_LINES_BATCH = 1000
 
 def search_po_candidates(pattern: str) -> list[dict]:
     sql = text("""
@@ -24,41 +33,138 @@ def search_po_candidates(pattern: str) -> list[dict]:
     ]
 
 
-def load_po_lines(po_id: str) -> list[POLine]:
+def load_open_po_headers() -> list[dict]:
+    """All PO headers that can still be vouchered (not Completed/Canceled), for the PO index."""
     sql = text("""
-        SELECT A.PO_ID, A.LINE_NBR, B.SCHED_NBR, C.DISTRIB_LINE_NUM,
-               A.DESCR254_MIXED, C.MERCHANDISE_AMT,
-               C.ACCOUNT, C.FUND_CODE, C.PROGRAM_CODE
-        FROM PS_PO_LINE A
-        JOIN PS_PO_LINE_SHIP B ON A.BUSINESS_UNIT = B.BUSINESS_UNIT
-                              AND A.PO_ID = B.PO_ID
-                              AND A.LINE_NBR = B.LINE_NBR
-        JOIN PS_PO_LINE_DISTRIB C ON A.BUSINESS_UNIT = C.BUSINESS_UNIT
-                                 AND A.PO_ID = C.PO_ID
-                                 AND A.LINE_NBR = C.LINE_NBR
-                                 AND B.SCHED_NBR = C.SCHED_NBR
-        WHERE A.PO_ID = :po_id
-        ORDER BY A.LINE_NBR, B.SCHED_NBR, C.DISTRIB_LINE_NUM
+        SELECT P.PO_ID, P.VENDOR_ID, V.NAME1, P.PO_STATUS, P.BUSINESS_UNIT
+        FROM PS_PO_HDR P, PS_VENDOR V
+        WHERE P.VENDOR_ID = V.VENDOR_ID
+            AND P.PO_STATUS NOT IN ('C', 'X')
     """)
-
     with SessionLocalPS() as db:
-        rows = db.execute(sql, {"po_id": po_id}).fetchall()
+        rows = db.execute(sql).fetchall()
 
     return [
-        POLine(
-            po_id=row.PO_ID,
-            po_line=row.LINE_NBR,
-            sched=row.SCHED_NBR,
-            distrib=row.DISTRIB_LINE_NUM,
-            description=row.DESCR254_MIXED,
-            amount=row.MERCHANDISE_AMT,
-            account=row.ACCOUNT,
-            fund=row.FUND_CODE,
-            program=row.PROGRAM_CODE,
-        )
+        {
+            "po_id": row.PO_ID,
+            "vendor_id": row.VENDOR_ID,
+            "vendor_name": row.NAME1,
+            "status": row.PO_STATUS,
+            "business_unit": row.BUSINESS_UNIT,
+        }
         for row in rows
     ]
 
+
+PO_LINES_SQL = """
+    SELECT A.PO_ID, A.LINE_NBR, B.SCHED_NBR, C.DISTRIB_LINE_NUM,
+           A.DESCR254_MIXED, C.MERCHANDISE_AMT,
+           C.ACCOUNT, C.FUND_CODE, C.PROGRAM_CODE
+    FROM PS_PO_LINE A
+    JOIN PS_PO_LINE_SHIP B ON A.BUSINESS_UNIT = B.BUSINESS_UNIT
+                          AND A.PO_ID = B.PO_ID
+                          AND A.LINE_NBR = B.LINE_NBR
+    JOIN PS_PO_LINE_DISTRIB C ON A.BUSINESS_UNIT = C.BUSINESS_UNIT
+                             AND A.PO_ID = C.PO_ID
+                             AND A.LINE_NBR = C.LINE_NBR
+                             AND B.SCHED_NBR = C.SCHED_NBR
+    WHERE A.PO_ID IN :po_ids
+    ORDER BY A.PO_ID, A.LINE_NBR, B.SCHED_NBR, C.DISTRIB_LINE_NUM
+"""
+
+
+class POLinesCache:
+    """PO lines by po_id, reused for `ttl` seconds. Callers get copies."""
+
+    def __init__(self, ttl: float = PO_LINES_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[float, list[POLine]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, po_id: str) -> list[POLine] | None:
+        with self._lock:
+            entry = self._entries.get(po_id)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                self._entries.pop(po_id, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [line.model_copy() for line in entry[1]]
+
+    def put(self, po_id: str, lines: list[POLine]) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[po_id] = (time.monotonic(), [line.model_copy() for line in lines])
+
+    def invalidate(self, po_id: str | None = None) -> None:
+        """Forget one PO (e.g. after a voucher was saved against it) or everything."""
+        with self._lock:
+            if po_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(po_id, None)
+
+
+po_lines_cache = POLinesCache()
+
+
+def _query_po_lines(po_ids: list[str]) -> dict[str, list[POLine]]:
+    sql = text(PO_LINES_SQL).bindparams(bindparam("po_ids", expanding=True))
+    lines: dict[str, list[POLine]] = {po_id: [] for po_id in po_ids}
+    with SessionLocalPS() as db:
+        for start in range(0, len(po_ids), PO_LINES_BATCH):
+            rows = db.execute(sql, {"po_ids": po_ids[start:start + PO_LINES_BATCH]}).fetchall()
+            for row in rows:
+                lines.setdefault(row.PO_ID, []).append(
+                    POLine(
+                        po_id=row.PO_ID,
+                        po_line=row.LINE_NBR,
+                        sched=row.SCHED_NBR,
+                        distrib=row.DISTRIB_LINE_NUM,
+                        description=row.DESCR254_MIXED,
+                        amount=row.MERCHANDISE_AMT,
+                        account=row.ACCOUNT,
+                        fund=row.FUND_CODE,
+                        program=row.PROGRAM_CODE,
+                    )
+                )
+    return lines
+
+
+def load_po_lines_many(po_ids) -> dict[str, list[POLine]]:
+    """
+    Lines for several POs: cached ones are reused, the rest are loaded in one
+    query (per PO_LINES_BATCH ids) and cached. POs without lines map to [].
+    """
+    result: dict[str, list[POLine]] = {}
+    missing: list[str] = []
+    for po_id in dict.fromkeys(po_ids):
+        cached = po_lines_cache.get(po_id)
+        if cached is None:
+            missing.append(po_id)
+        else:
+            result[po_id] = cached
+    if missing:
+        loaded = _query_po_lines(missing)
+        for po_id in missing:
+            lines = loaded.get(po_id, [])
+            # Don't cache misses; the PO may be created before the TTL runs out
+            if lines:
+                po_lines_cache.put(po_id, lines)
+            result[po_id] = lines
+    return result
+
+
+def load_po_lines(po_id: str) -> list[POLine]:
+    return load_po_lines_many([po_id])[po_id]
+
+
+def invalidate_po_lines(po_id: str | None = None) -> None:
+    po_lines_cache.invalidate(po_id)
+
 if __name__ == "__main__":
     # Simple search of PO 227878
     results = search_po_candidates("%227878%")
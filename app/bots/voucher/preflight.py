@@ -0,0 +1,273 @@
+"""
+Pre-flight checks against PeopleSoft, run after extraction and before any
+browser time is spent.
+
+Duplicates used to surface only after the whole UI flow (header, PO copy,
+attachment, save) when handle_alerts saw "Duplicate". find_duplicate_vouchers
+looks the extracted invoices up in PS_VOUCHER instead: same vendor and
+invoice id, and the same invoice date or gross amount (PeopleSoft's own
+duplicate invoice rule), ignoring deleted vouchers. All invoices of a run go
+in one query (chunked at PREFLIGHT_CHUNK) as a VALUES derived table joined
+against PeopleSoft, through the pooled FSCM engine.
+
+When the vendor id is not known yet (the vendor entry bot only extracts the
+PO), it is taken from the PO's PS_PO_HDR row.
+
+check_purchase_orders does the same for the PO problems the bot otherwise
+finds after login and header entry: a PO that does not exist, is completed
+or canceled, belongs to another business unit, or (Class/Mobile leases) has
+no line for the current rent period.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import sqlalchemy
+from sqlalchemy import bindparam
+from dateutil import parser as date_parser
+
+from app import database
+from app.bots.utils.sql import values_table
+
+# 6 parameters per invoice keeps a chunk under SQL Server's 2100
+PREFLIGHT_CHUNK = int(os.getenv("PREFLIGHT_CHUNK", "300"))
+# PO ids per PS_PO_HDR/PS_PO_LINE query
+PO_CHECK_CHUNK = 1000
+
+DEFAULT_BUSINESS_UNIT = "KERNH"
+# PO_STATUS values a voucher cannot be entered against
+CLOSED_PO_STATUSES = {"C": "Completed", "X": "Canceled"}
+# Vendors whose POs must have a line for the rent period being paid
+RENT_LINE_VENDORS = frozenset({"class", "mobile"})
+
+DUPLICATE_VOUCHERS_COLUMNS = ("KEY_ID", "VENDOR_ID", "PO_ID", "INVOICE_ID", "INVOICE_DT", "GROSS_AMT")
+
+DUPLICATE_VOUCHERS_SQL = """
+SELECT DISTINCT C.KEY_ID, V.BUSINESS_UNIT, V.VOUCHER_ID
+FROM {candidates}
+LEFT JOIN PS_PO_HDR P
+    ON C.VENDOR_ID IS NULL
+    AND P.PO_ID = C.PO_ID
+JOIN PS_VOUCHER V
+    ON V.VENDOR_ID = COALESCE(C.VENDOR_ID, P.VENDOR_ID)
+    AND V.INVOICE_ID = C.INVOICE_ID
+WHERE V.ENTRY_STATUS <> 'X'
+    AND (V.INVOICE_DT = C.INVOICE_DT OR ABS(V.GROSS_AMT - C.GROSS_AMT) < 0.005)
+ORDER BY C.KEY_ID, V.VOUCHER_ID
+"""
+
+
+@dataclass(frozen=True)
+class InvoiceKey:
+    """What pre-flight needs from an extracted invoice. vendor_id or po_id identifies the vendor."""
+
+    invoice_id: str
+    invoice_date: Optional[str] = None
+    amount: Optional[float] = None
+    vendor_id: Optional[str] = None
+    po_id: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class DuplicateVoucher:
+    business_unit: str
+    voucher_id: str
+
+    def describe(self) -> str:
+        return f"Duplicate of voucher {self.business_unit}/{self.voucher_id}"
+
+
+PO_HEADERS_SQL = """
+SELECT BUSINESS_UNIT, PO_ID, PO_STATUS, VENDOR_ID
+FROM PS_PO_HDR
+WHERE PO_ID IN :po_ids
+"""
+
+RENT_LINES_SQL = """
+SELECT DISTINCT BUSINESS_UNIT, PO_ID
+FROM PS_PO_LINE
+WHERE PO_ID IN :po_ids
+    AND CANCEL_STATUS <> 'X'
+    AND UPPER(DESCR254_MIXED) LIKE :rent_line
+"""
+
+
+def split_purchase_order(purchase_order: Optional[str]) -> tuple[str, str]:
+    """(business unit, PO id) for an extracted PO, as the entry bot splits it ("KERNH-0001", "KERNH_0001" or "0001")."""
+    value = (purchase_order or "").strip()
+    if value.upper().startswith(DEFAULT_BUSINESS_UNIT):
+        for separator in ("-", "_"):
+            if separator in value:
+                business_unit, po_id = value.split(separator, 1)
+                return business_unit.upper(), po_id.strip()
+    return DEFAULT_BUSINESS_UNIT, value
+
+
+def normalize_invoice_id(value: Optional[str]) -> str:
+    return (value or "").strip().upper()
+
+
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return date_parser.parse(value, dayfirst=False).date().isoformat()
+    except (ValueError, OverflowError):
+        return None
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), max(1, size)):
+        yield items[start:start + size]
+
+
+def find_duplicate_vouchers(
+    invoices: Sequence[InvoiceKey],
+    *,
+    chunk_size: int = PREFLIGHT_CHUNK,
+    engine=None,
+) -> dict[int, DuplicateVoucher]:
+    """
+    Index in `invoices` -> the existing voucher it duplicates. Invoices
+    without an invoice id, a vendor/PO, or both date and amount are not checked.
+    """
+    candidates = []
+    for index, invoice in enumerate(invoices):
+        invoice_id = normalize_invoice_id(invoice.invoice_id)
+        vendor_id = (invoice.vendor_id or "").strip() or None
+        po_id = split_purchase_order(invoice.po_id)[1] or None
+        invoice_date = _iso_date(invoice.invoice_date)
+        amount = round(invoice.amount, 2) if invoice.amount else None
+        if invoice_id and (vendor_id or po_id) and (invoice_date or amount):
+            candidates.append((index, vendor_id, po_id, invoice_id, invoice_date, amount))
+    if not candidates:
+        return {}
+
+    engine = engine or database.get_ps_engine("fscm")
+    duplicates: dict[int, DuplicateVoucher] = {}
+    with engine.connect() as conn:
+        for chunk in _chunks(candidates, chunk_size):
+            values = []
+            params = {}
+            for i, (index, vendor_id, po_id, invoice_id, invoice_date, amount) in enumerate(chunk):
+                values.append(f"(:k{i}, :v{i}, :p{i}, :i{i}, :d{i}, :a{i})")
+                params.update({
+                    f"k{i}": index,
+                    f"v{i}": vendor_id,
+                    f"p{i}": po_id,
+                    f"i{i}": invoice_id,
+                    f"d{i}": invoice_date,
+                    f"a{i}": amount,
+                })
+            candidates = values_table(conn.dialect.name, "C", DUPLICATE_VOUCHERS_COLUMNS, values)
+            query = DUPLICATE_VOUCHERS_SQL.format(candidates=candidates)
+            for row in conn.execute(sqlalchemy.text(query), params):
+                duplicates.setdefault(row.KEY_ID, DuplicateVoucher(row.BUSINESS_UNIT, row.VOUCHER_ID))
+    return duplicates
+
+
+def _po_headers(conn, po_ids: list[str], chunk_size: int) -> dict[str, dict]:
+    """PO_ID -> BUSINESS_UNIT -> PS_PO_HDR row."""
+    headers_sql = sqlalchemy.text(PO_HEADERS_SQL).bindparams(bindparam("po_ids", expanding=True))
+    headers: dict[str, dict] = {}
+    for chunk in _chunks(po_ids, chunk_size):
+        for row in conn.execute(headers_sql, {"po_ids": chunk}):
+            headers.setdefault(row.PO_ID, {})[row.BUSINESS_UNIT] = row
+    return headers
+
+
+def find_po_vendors(
+    purchase_orders: Sequence[Optional[str]],
+    *,
+    chunk_size: int = PO_CHECK_CHUNK,
+    engine=None,
+) -> dict[int, str]:
+    """Index in `purchase_orders` -> the PO's PeopleSoft vendor id, for POs that exist."""
+    wanted = {index: split_purchase_order(purchase_order) for index, purchase_order in enumerate(purchase_orders)}
+    po_ids = sorted({po_id for _, po_id in wanted.values() if po_id})
+    if not po_ids:
+        return {}
+    engine = engine or database.get_ps_engine("fscm")
+    with engine.connect() as conn:
+        headers = _po_headers(conn, po_ids, chunk_size)
+    vendors = {}
+    for index, (business_unit, po_id) in wanted.items():
+        row = headers.get(po_id, {}).get(business_unit)
+        if row is not None and row.VENDOR_ID:
+            vendors[index] = row.VENDOR_ID
+    return vendors
+
+
+def check_purchase_orders(
+    purchase_orders: Sequence[Optional[str]],
+    *,
+    rent_line: Optional[str] = None,
+    chunk_size: int = PO_CHECK_CHUNK,
+    engine=None,
+) -> dict[int, str]:
+    """
+    Index in `purchase_orders` -> why entry would fail, worded like the
+    entry bot's own results. With `rent_line`, the PO also needs an open line
+    whose description contains it.
+    """
+    wanted = {}
+    problems: dict[int, str] = {}
+    for index, purchase_order in enumerate(purchase_orders):
+        business_unit, po_id = split_purchase_order(purchase_order)
+        if not po_id:
+            problems[index] = "No PO on invoice"
+        else:
+            wanted[index] = (business_unit, po_id)
+    po_ids = sorted({po_id for _, po_id in wanted.values()})
+    if not po_ids:
+        return problems
+
+    engine = engine or database.get_ps_engine("fscm")
+    rent_lines: set[tuple[str, str]] = set()
+    rent_sql = sqlalchemy.text(RENT_LINES_SQL).bindparams(bindparam("po_ids", expanding=True))
+    with engine.connect() as conn:
+        headers = _po_headers(conn, po_ids, chunk_size)
+        if rent_line:
+            for chunk in _chunks(po_ids, chunk_size):
+                params = {"po_ids": chunk, "rent_line": f"%{rent_line.upper()}%"}
+                rent_lines.update((row.BUSINESS_UNIT, row.PO_ID) for row in conn.execute(rent_sql, params))
+
+    for index, (business_unit, po_id) in wanted.items():
+        units = headers.get(po_id)
+        if not units:
+            problems[index] = "Invalid PO"
+        elif business_unit not in units:
+            problems[index] = f"PO not in business unit {business_unit}"
+        elif units[business_unit].PO_STATUS in CLOSED_PO_STATUSES:
+            problems[index] = f"PO {CLOSED_PO_STATUSES[units[business_unit].PO_STATUS]}"
+        elif rent_line and (business_unit, po_id) not in rent_lines:
+            problems[index] = f"No {rent_line} Rent Line on PO"
+    return problems
+
+
+def existing_voucher_id(invoice: InvoiceKey, *, engine=None) -> Optional[str]:
+    """Voucher PeopleSoft already has for `invoice`, or None. Lookup errors are raised."""
+    duplicate = find_duplicate_vouchers([invoice], engine=engine).get(0)
+    return duplicate.voucher_id if duplicate is not None else None
+
+
+def invoice_key(invoice, validated_po) -> InvoiceKey:
+    """InvoiceKey for a v2 pipeline invoice and its validated PO."""
+    return InvoiceKey(
+        invoice_id=invoice.invoice_number,
+        invoice_date=invoice.invoice_date,
+        amount=invoice.total_amount,
+        vendor_id=validated_po.vendor_id,
+        po_id=validated_po.po_id,
+    )
+
+
+def find_existing_voucher(invoice, validated_po, *, engine=None) -> Optional[DuplicateVoucher]:
+    """Single-invoice check for the v2 pipeline; lookup errors leave the duplicate to PeopleSoft."""
+    try:
+        return find_duplicate_vouchers([invoice_key(invoice, validated_po)], engine=engine).get(0)
+    except Exception as exc:
+        print(f"[PREFLIGHT] Duplicate check failed for {invoice.invoice_number}: {exc}")
+        return None
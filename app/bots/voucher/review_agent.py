@@ -1,21 +1,21 @@
 from langchain.agents import create_agent
 from langchain_core.messages import HumanMessage
 
+from app.bots.agents.prompt_layout import PromptLayout
 from app.services.langfuse import langfuse_handler
+from app.services.llm_backend import invoke_agent
+from app.services.usage import usage_handler, usage_context
 from .models import VoucherEntryPlan, ExecutionDecision
 from .prompts.review import REVIEW_PROMPT
 
 
 def review_plan(plan: VoucherEntryPlan, extra_prompt: str | None = None) -> ExecutionDecision:
-    system_prompt = REVIEW_PROMPT
-    if extra_prompt:
-        system_prompt = system_prompt + "\n\nAdditional instructions:\n" + extra_prompt
-
+    layout = PromptLayout(REVIEW_PROMPT, extra_prompt, vendor_heading="Additional instructions")
     agent = create_agent(
         name="Voucher Review Agent",
-        system_prompt=system_prompt,
+        system_prompt=layout.system_prompt(),
         tools=[],
-        model="gpt-5-mini",
+        model=layout.chat_model("review"),
         response_format=ExecutionDecision,
     )
 
@@ -24,9 +24,14 @@ def review_plan(plan: VoucherEntryPlan, extra_prompt: str | None = None) -> Exec
         f"PO: {plan.po.model_dump()}\n"
         f"Mapping: {plan.mapping.model_dump()}"
     )
-    result = agent.invoke(
-        {"messages": [HumanMessage(content=user_content)]},
-        config={"callbacks": [langfuse_handler]},
-    )
+    with usage_context(stage="review"):
+        result = invoke_agent(
+            "review",
+            agent,
+            {"messages": [HumanMessage(content=user_content)]},
+            schema=ExecutionDecision,
+            prompt=layout.system_prompt(),
+            config={"callbacks": [langfuse_handler, usage_handler]},
+        )
     structured = result.get("structured_response", result)
     return structured if isinstance(structured, ExecutionDecision) else ExecutionDecision.model_validate(structured)
@@ -2,8 +2,9 @@ from pathlib import Path
 from typing import Optional
 import shutil
 
-from app import models, database
+from app import models
 from app.bots.utils.misc import generate_runid
+from app.services.process_log_writer import write_process_log
 
 
 def is_numeric_voucher(voucher_id: str | None) -> bool:
@@ -49,24 +50,18 @@ def log_process_to_db(
     invoice_number: str,
     status: str,
 ):
-    """Persist process log similar to voucher_entry."""
+    """Persist process log similar to voucher_entry (buffered when the run uses a log writer)."""
     if not runid:
         return
-    db = database.SessionLocal()
-    try:
-        payload = {
-            "runid": runid,
-            "filename": filename,
-            "voucher_id": voucher_id,
-            "amount": amount,
-            "invoice": invoice_number,
-            "status": status,
-        }
-        orm_row = models.BotProcessLog(**payload)
-        db.add(orm_row)
-        db.commit()
-    finally:
-        db.close()
+    payload = {
+        "runid": runid,
+        "filename": filename,
+        "voucher_id": voucher_id,
+        "amount": amount,
+        "invoice": invoice_number,
+        "status": status,
+    }
+    write_process_log(models.BotProcessLog, payload)
 
 
 __all__ = ["generate_runid", "is_numeric_voucher", "move_invoice_file", "log_process_to_db"]
@@ -1,3 +1,4 @@
+import re
 from pathlib import Path
 
 from pydantic import BaseModel
@@ -36,7 +37,11 @@ def load_special_vendor_prompts() -> dict[str, dict[str, str]]:
     return prompts
 
 
-def detect_vendor(filepath: str, special_prompts: dict[str, dict[str, str]]) -> tuple[str | None, dict[str, str] | None]:
+def detect_vendor(
+    filepath: str,
+    special_prompts: dict[str, dict[str, str]],
+    document_mode: str | None = None,
+) -> tuple[str | None, dict[str, str] | None]:
     """
     Light vendor detection using multimodal extract. Returns (vendor_name, vendor_specific_prompt).
     """
@@ -49,9 +54,38 @@ def detect_vendor(filepath: str, special_prompts: dict[str, dict[str, str]]) ->
             filepath,
             VendorDetectionResult,
             prompt=base_prompt,
+            mode=document_mode,
+            stage="vendor_detection",
+            is_confident=lambda r: bool(r.vendor_name),
         )
         vendor = (result.vendor_name or "").strip()
         prompt_bundle = special_prompts.get(vendor.lower()) if vendor else None
         return vendor, prompt_bundle
     except Exception:
         return None, None
+
+
+PO_TABLE_COLUMNS = ("po_to_use", "po_id")
+
+
+def referenced_po_ids(prompt_bundle: dict[str, str] | None) -> list[str]:
+    """
+    PO ids listed in a vendor prompt's markdown table (a `po_to_use` or `po_id`
+    column), e.g. the Vestis account -> PO table. Used to prefetch PO lines.
+    """
+    po_ids: dict[str, None] = {}
+    for text in (prompt_bundle or {}).values():
+        column = None
+        for line in (text or "").splitlines():
+            if not line.strip().startswith("|"):
+                column = None
+                continue
+            cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+            if column is None:
+                names = [cell.lower() for cell in cells]
+                column = next((names.index(name) for name in PO_TABLE_COLUMNS if name in names), None)
+                continue
+            if column < len(cells) and re.fullmatch(r"[A-Za-z0-9-]+", cells[column]) and not set(cells[column]) <= {"-"}:
+                po_ids[cells[column]] = None
+    return list(po_ids)
+
@@ -23,45 +23,30 @@ from app.bots.utils.misc import (
     update_bot_run_status,
 )
 from app.bots.agents.invoice_extract import run_invoice_extraction
+from app.services.cancellation import cancellation_registry
+from app.bots.voucher.preflight import (
+    RENT_LINE_VENDORS,
+    InvoiceKey,
+    check_purchase_orders,
+    existing_voucher_id,
+    find_duplicate_vouchers,
+    find_po_vendors,
+)
+from app.services.inbox import InboxEntry, inbox_manifest
+from app.services.invoice_ledger import LedgerKey, invoice_ledger, ledger_key
+from app.services.job_scheduler import environment
+from app.services.process_log_writer import process_log_writer
+from app.services.usage import usage_context, usage_summary_for_run
 from app.bots.prompts import CDW_PROMPT, CLASS_PROMPT, MOBILE_PROMPT, GRAINGER_PROMPT
 from app.schemas import ExtractedInvoiceData, VoucherEntryResult, VoucherRunLog, VoucherProcessLog
 from app.config import get_settings
+from app.bots.vendor_dirs import get_vendor_directory
 if sys.platform.startswith("win"):
     try:
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
     except AttributeError:
         pass
-from app import models, database
-
-# TODO: Handle server deployment for file access
-def get_vendor_directory(vendor_key: str, test_mode: bool) -> Path:
-    if test_mode:
-        base_dir = r"C:\Users\Bob_Dickson\OneDrive - Kern High School District\Documents\InvoiceProcessing"
-        vendor_dirs = {
-            "royal": "Royal Industrial",
-            "class": "Class Leasing",
-            "mobile": "Mobile Modular",
-            "floyds": "Floyds",
-            "seq": "Sequoia",
-            "cdw": "CDW",
-            "grainger": "Grainger",
-            "vestis": "Vestis",
-        }
-    else:
-        base_dir = r"C:\Users\Bob_Dickson\OneDrive - Kern High School District\Documents - Fiscal\Accounts Payable"
-        vendor_dirs = {
-            "royal": "Royal Industrial",
-            "class": "Class Leasing Invoices",
-            "mobile": "Mobile Modular Invoices",
-            "floyds": "Floyd's (Standard Plumbing) invoices",
-            "seq": "Sequioa Paint",
-            "cdw": "CDW",
-            "attach": "Invoices scanned, need to be attached",
-            "grainger": "Grainger",
-            "vestis": "Vestis",
-        }
-    return Path(base_dir) / vendor_dirs[vendor_key]
-
+from app import models
 
 settings = get_settings()
 USERNAME = settings.peoplesoft_username
@@ -296,6 +281,19 @@ def voucher_playwright_bot(
                 browser.close()
 
 
+def _error_process_log(runid: str, filename: str, error: Exception) -> VoucherProcessLog:
+    error_message = str(error).strip() or "Unknown error"
+    truncated_error = error_message if len(error_message) <= 240 else f"{error_message[:237]}..."
+    return VoucherProcessLog(
+        runid=runid,
+        filename=filename,
+        voucher_id=f"Error: {truncated_error}",
+        amount=0.0,
+        invoice="",
+        status="failure",
+    )
+
+
 def run_vendor_entry(
     vendor_key: str,
     test_mode: bool = True,
@@ -304,9 +302,11 @@ def run_vendor_entry(
     apo_override: str = None,
     additional_instructions: str = None,
     runid: Optional[str] = None,
+    retry_failed: bool = False,
 ):
     """
-    Process all invoices for one vendor in a directory.
+    Process the new invoices for one vendor in a directory (see
+    app.services.inbox; `retry_failed` also retries files that failed before).
     Returns (VoucherRunLog, list[VoucherProcessLog]).
     """
     t0 = time.time()
@@ -314,9 +314,10 @@ def run_vendor_entry(
     if not vendor_path.exists():
         raise RuntimeError(f"Vendor directory {vendor_path} not found")
 
-    invoices = list(vendor_path.glob("*.pdf"))
+    pending = inbox_manifest.scan(vendor_path, environment=environment("fscm", test_mode), retry_failed=retry_failed)
+    invoices = [entry.path for entry in pending]
     if not invoices:
-        print(f"No invoices found in {vendor_path}")
+        print(f"No new invoices found in {vendor_path}")
         return None, []
 
     runid = runid or generate_runid(
@@ -351,19 +352,33 @@ def run_vendor_entry(
     print(f"\n🚀 Starting run {runid} with {len(invoices)} invoices from {vendor_path}")
 
     cancelled = False
-    try:
-        for invoice in invoices:
-            if is_run_cancel_requested(runid):
-                print(f"Cancellation requested for run {runid}. Stopping further processing.")
-                cancelled = True
-                break
 
-            process_log: Optional[VoucherProcessLog] = None
+    def record(entry: InboxEntry, process_log: VoucherProcessLog, *, retryable: bool = False) -> None:
+        # retryable: nothing final was learned about the file, leave it for the next scan
+        process_logs.append(process_log)
+        inbox_manifest.record(
+            entry, process_log.status, voucher_id=process_log.voucher_id, runid=runid, retryable=retryable
+        )
+        # Write to DB (buffered, flushed in bulk)
+        print(process_log)
+        log_writer.add(models.BotProcessLog, process_log.model_dump())
+
+    # Per-file cancel checks read this token instead of the DB
+    cancellation_registry.register(runid)
+    with process_log_writer() as log_writer:
+        try:
+            # Extract every pending file first so PeopleSoft can be checked for all of them at once
+            prepared: list[tuple[InboxEntry, ExtractedInvoiceData]] = []
+            for entry in pending:
+                invoice = entry.path
+                if is_run_cancel_requested(runid):
+                    print(f"Cancellation requested for run {runid}. Stopping further processing.")
+                    cancelled = True
+                    break
 
-            try:
                 if vendor_key == "attach":
                     # For attach-only, we just need minimal invoice data
-                    invoice_data = ExtractedInvoiceData(
+                    prepared.append((entry, ExtractedInvoiceData(
                         invoice_number=invoice.stem,
                         invoice_date="",
                         total_amount=0.0,
@@ -372,74 +387,177 @@ def run_vendor_entry(
                         sales_tax=0.0,
                         miscellaneous_amount=0.0,
                         purchase_order="",
-                    )
+                    )))
+                    continue
+
+                try:
+                    with usage_context(runid=runid, filename=invoice.name):
+                        extraction_result = asyncio.run(
+                            run_invoice_extraction(str(invoice), additional_instructions)
+                        )
 
-                    result = voucher_playwright_bot(
-                        invoice_data,
-                        filepath=str(invoice),
-                        rent_line=rent_line,
-                        attach_only=attach_only,
-                        test_mode=test_mode,
-                        royal_style_entry=False,
-                        generic_attach=True,
-                    )
-                    runlog.successes += 1
-                    status = "success"
-                    voucher_id = result.voucher_id
-                    print(f"Moving entered invoice {invoice.name} to Processed.")
-                    shutil.move(str(invoice), processed_dir / invoice.name)
-                else:
-                    extraction_result = asyncio.run(
-                        run_invoice_extraction(str(invoice), additional_instructions)
-                    )
-                    
                     if not extraction_result:
                         print(f"Failed extraction: {invoice.name}")
                         runlog.failures += 1
-                        process_log = VoucherProcessLog(
+                        record(entry, VoucherProcessLog(
                             runid=runid,
                             filename=invoice.name,
                             voucher_id="Extraction Failed",
                             amount=0.0,
                             invoice="",
                             status="failure",
-                        )
-                    else:
-                        invoice_data = extraction_result['structured_response']
-                        invoice_data.purchase_order = invoice_data.purchase_order.strip()
-                        invoice_data.invoice_date = normalize_date(invoice_data.invoice_date)
-                        if apo_override:
-                            invoice_data.purchase_order = apo_override
-
-                        # Check Grainger for exact APO950011J only process those, print skip message otherwise
-                        if vendor_key == "grainger":
-                            if "APO950011J" not in invoice_data.purchase_order:
-                                print(f"Skipping Grainger invoice {invoice.name} without APO950011J PO.")
-                                runlog.failures += 1
-                                process_log = VoucherProcessLog(
-                                    runid=runid,
-                                    filename=invoice.name,
-                                    voucher_id="Skipped - No APO950011J",
-                                    amount=invoice_data.total_amount,
-                                    invoice=invoice_data.invoice_number,
-                                    status="failure",
-                                )
-                                process_logs.append(process_log)
-                                continue
-
-                        # Check if vendor_key is in the royal style set which will enter PO at voucher screen
-                        royal_style = False
-                        if vendor_key in ROYAL_STYLE_VENDORS:
-                            royal_style = True
+                        ))
+                        continue
+
+                    invoice_data = extraction_result['structured_response']
+                    invoice_data.purchase_order = invoice_data.purchase_order.strip()
+                    invoice_data.invoice_date = normalize_date(invoice_data.invoice_date)
+                    if apo_override:
+                        invoice_data.purchase_order = apo_override
+
+                    # Check Grainger for exact APO950011J only process those, print skip message otherwise
+                    if vendor_key == "grainger" and "APO950011J" not in invoice_data.purchase_order:
+                        print(f"Skipping Grainger invoice {invoice.name} without APO950011J PO.")
+                        runlog.failures += 1
+                        record(entry, VoucherProcessLog(
+                            runid=runid,
+                            filename=invoice.name,
+                            voucher_id="Skipped - No APO950011J",
+                            amount=invoice_data.total_amount,
+                            invoice=invoice_data.invoice_number,
+                            status="failure",
+                        ))
+                        continue
+
+                    prepared.append((entry, invoice_data))
+                except Exception as e:
+                    print(f"Error processing {invoice.name}: {e}")
+                    runlog.failures += 1
+                    record(entry, _error_process_log(runid, invoice.name, e), retryable=True)
+
+            # Batched PeopleSoft lookups instead of finding duplicates and bad POs in the browser
+            duplicates, po_problems = {}, {}
+            ledger_keys: list[Optional[LedgerKey]] = [None] * len(prepared)
+            already_entered: dict[LedgerKey, str] = {}
+            invoice_keys: list[InvoiceKey] = []
+            if prepared and not cancelled and vendor_key != "attach" and not attach_only:
+                try:
+                    # Ledger keys use the PeopleSoft vendor id, like the v2 pipeline
+                    vendor_ids = find_po_vendors([invoice_data.purchase_order for _, invoice_data in prepared])
+                except Exception as exc:
+                    print(f"[PREFLIGHT] PO vendor lookup failed, leaving production invoices for the next run: {exc}")
+                    vendor_ids = {}
+                invoice_keys = [
+                    InvoiceKey(
+                        invoice_id=invoice_data.invoice_number,
+                        invoice_date=invoice_data.invoice_date,
+                        amount=invoice_data.total_amount,
+                        vendor_id=vendor_ids.get(index),
+                        po_id=invoice_data.purchase_order,
+                    )
+                    for index, (_, invoice_data) in enumerate(prepared)
+                ]
+                ledger_keys = [
+                    ledger_key(key.vendor_id, key.invoice_id, key.amount, test_mode=test_mode) for key in invoice_keys
+                ]
+                already_entered = invoice_ledger.entered(ledger_keys)
+                try:
+                    duplicates = find_duplicate_vouchers(invoice_keys)
+                except Exception as exc:
+                    # PeopleSoft still flags duplicates on save
+                    print(f"[PREFLIGHT] Duplicate check failed, continuing without it: {exc}")
+                try:
+                    po_problems = check_purchase_orders(
+                        [invoice_data.purchase_order for _, invoice_data in prepared],
+                        rent_line=rent_line if vendor_key in RENT_LINE_VENDORS else None,
+                    )
+                except Exception as exc:
+                    # The bot still reports PO problems from PeopleSoft
+                    print(f"[PREFLIGHT] PO check failed, continuing without it: {exc}")
+
+            # Check Royal style vendors which will enter PO at voucher screen
+            royal_style = vendor_key in ROYAL_STYLE_VENDORS
+            for index, (entry, invoice_data) in enumerate(prepared):
+                invoice = entry.path
+                if cancelled or is_run_cancel_requested(runid):
+                    print(f"Cancellation requested for run {runid}. Stopping further processing.")
+                    cancelled = True
+                    break
 
+                try:
+                    if vendor_key == "attach":
                         result = voucher_playwright_bot(
                             invoice_data,
                             filepath=str(invoice),
                             rent_line=rent_line,
                             attach_only=attach_only,
                             test_mode=test_mode,
-                            royal_style_entry=royal_style,
+                            royal_style_entry=False,
+                            generic_attach=True,
                         )
+                        runlog.successes += 1
+                        print(f"Moving entered invoice {invoice.name} to Processed.")
+                        shutil.move(str(invoice), processed_dir / invoice.name)
+                        record(entry, VoucherProcessLog(
+                            runid=runid,
+                            filename=invoice.name,
+                            voucher_id=result.voucher_id,
+                            amount=invoice_data.total_amount,
+                            invoice=invoice_data.invoice_number,
+                            status="success",
+                        ))
+                        continue
+
+                    key = ledger_keys[index]
+                    retryable = False
+                    if key in already_entered:
+                        print(f"{invoice.name}: already entered as voucher {already_entered[key]}, not opening PeopleSoft.")
+                        result = VoucherEntryResult(voucher_id="Duplicate", duplicate=True, out_of_balance=False)
+                    elif index in duplicates:
+                        print(f"{invoice.name}: {duplicates[index].describe()}, not opening PeopleSoft.")
+                        result = VoucherEntryResult(voucher_id="Duplicate", duplicate=True, out_of_balance=False)
+                    elif index in po_problems:
+                        print(f"{invoice.name}: {po_problems[index]}, not opening PeopleSoft.")
+                        result = VoucherEntryResult(voucher_id=po_problems[index], duplicate=False, out_of_balance=False)
+                    elif key is None and not test_mode:
+                        # No PeopleSoft vendor (lookup failed) or no invoice number: nothing to claim,
+                        # and a parallel run could enter the same invoice
+                        print(f"{invoice.name}: no ledger key, not entering without the ledger guard.")
+                        retryable = True
+                        result = VoucherEntryResult(voucher_id="Skipped - No ledger key", duplicate=False, out_of_balance=False)
+                    else:
+                        # Claim the invoice so a parallel run entering the same one backs off
+                        claim = None
+                        if key is not None:
+                            claim = invoice_ledger.claim(
+                                key,
+                                runid=runid,
+                                filename=invoice.name,
+                                verify=lambda: existing_voucher_id(invoice_keys[index]),
+                            )
+                        if claim is not None and claim.voucher_id:
+                            print(f"{invoice.name}: already entered as voucher {claim.voucher_id}, not opening PeopleSoft.")
+                            result = VoucherEntryResult(voucher_id="Duplicate", duplicate=True, out_of_balance=False)
+                        elif claim is not None and not claim.acquired:
+                            print(f"{invoice.name}: claimed by run {claim.holder} and not settled, skipping.")
+                            retryable = True
+                            result = VoucherEntryResult(
+                                voucher_id="Skipped - Entry in progress", duplicate=False, out_of_balance=False
+                            )
+                        else:
+                            voucher_id = None
+                            try:
+                                result = voucher_playwright_bot(
+                                    invoice_data,
+                                    filepath=str(invoice),
+                                    rent_line=rent_line,
+                                    attach_only=attach_only,
+                                    test_mode=test_mode,
+                                    royal_style_entry=royal_style,
+                                )
+                                voucher_id = result.voucher_id
+                            finally:
+                                invoice_ledger.settle(claim, voucher_id)
 
                     runlog.processed += 1
 
@@ -463,50 +581,25 @@ def run_vendor_entry(
                         print(f"Not moving failed invoice {invoice.name}.")
                         # leave file in place
 
-                    process_log = VoucherProcessLog(
+                    record(entry, VoucherProcessLog(
                         runid=runid,
                         filename=invoice.name,
                         voucher_id=voucher_id,
                         amount=invoice_data.total_amount,
                         invoice=invoice_data.invoice_number,
                         status=status,
-                    )
-
-            except Exception as e:
-                print(f"Error processing {invoice.name}: {e}")
-                runlog.failures += 1
-                error_message = str(e).strip() or "Unknown error"
-                truncated_error = (
-                    error_message if len(error_message) <= 240 else f"{error_message[:237]}..."
-                )
-                process_log = VoucherProcessLog(
-                    runid=runid,
-                    filename=invoice.name,
-                    voucher_id=f"Error: {truncated_error}",
-                    amount=0.0,
-                    invoice="",
-                    status="failure",
-                )
-
-            if process_log is None:
-                continue
-
-            process_logs.append(process_log)
-
-            # Write to DB
-            print(process_log)
-            db = database.SessionLocal()
-            try:
-                payload = process_log.model_dump()
-                orm_row = models.BotProcessLog(**payload)
-                db.add(orm_row)
-                db.commit()
-                print("Logged to database.")
-            finally:
-                db.close()
-    except Exception as exc:
-        update_bot_run_status(runid, "failed", message=str(exc))
-        raise
+                    ), retryable=retryable)
+
+                except Exception as e:
+                    # e.g. the ledger was unavailable or the browser crashed; PeopleSoft returned no result
+                    print(f"Error processing {invoice.name}: {e}")
+                    runlog.failures += 1
+                    record(entry, _error_process_log(runid, invoice.name, e), retryable=True)
+        except Exception as exc:
+            update_bot_run_status(runid, "failed", message=str(exc))
+            raise
+        finally:
+            cancellation_registry.unregister(runid)
 
     t1 = time.time()
     print(f"Average time per invoice: {(t1 - t0) / len(invoices):.2f} seconds.")
@@ -521,6 +614,7 @@ def run_vendor_entry(
                 "successes": runlog.successes,
                 "duplicates": runlog.duplicates,
                 "failures": runlog.failures,
+                "llm_usage": usage_summary_for_run(runid),
             },
         )
         print(f"Run {runid} cancelled after processing {runlog.processed} invoices.")
@@ -533,6 +627,7 @@ def run_vendor_entry(
                 "successes": runlog.successes,
                 "duplicates": runlog.duplicates,
                 "failures": runlog.failures,
+                "llm_usage": usage_summary_for_run(runid),
             },
         )
         print(f"Completed run {runid}: {runlog.successes} success, {runlog.duplicates} duplicates, {runlog.failures} failures")
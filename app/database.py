@@ -1,23 +1,174 @@
 import os
+import threading
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
     pass
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 PS_DATABASE_URL = os.getenv("PS_DB_URL")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The app engine is created on first use, so importing the app (and its
+# models) needs neither a reachable database nor the DB driver.
+_engine: Engine | None = None
+_sessionmaker: sessionmaker | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Engine on the app database, created on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if not DATABASE_URL:
+                    raise RuntimeError("DATABASE_URL is not set in the environment.")
+                _engine = create_engine(DATABASE_URL)
+    return _engine
+
+
+def SessionLocal() -> Session:
+    """Session on the app database."""
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return _sessionmaker()
+
+
+def __getattr__(name: str):
+    # `database.engine` / `from app.database import engine` resolve lazily
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# PeopleSoft databases by name -> env var holding the URL
+PS_DATABASES = {
+    "fscm": "PS_DB_URL",
+    "hcm": "PS_DB_URL_HCM",
+}
+# Pool sizing per PeopleSoft engine; pool_size + max_overflow caps concurrent
+# connections, so size for the number of parallel workers.
+PS_POOL_SIZE = int(os.getenv("PS_POOL_SIZE", "5"))
+PS_MAX_OVERFLOW = int(os.getenv("PS_MAX_OVERFLOW", "10"))
+PS_POOL_RECYCLE = int(os.getenv("PS_POOL_RECYCLE", "1800"))
+PS_POOL_TIMEOUT = int(os.getenv("PS_POOL_TIMEOUT", "30"))
+
+_ps_engines: dict[str, Engine] = {}
+_ps_sessionmakers: dict[str, sessionmaker] = {}
+_ps_lock = threading.Lock()
+
+
+def get_ps_engine(name: str = "fscm") -> Engine:
+    """
+    Shared pooled engine for a PeopleSoft database, created on first use.
+    Connections are pre-pinged so ones dropped by the server or a VPN blip are
+    replaced instead of failing the query.
+    """
+    engine = _ps_engines.get(name)
+    if engine is not None:
+        return engine
+    with _ps_lock:
+        engine = _ps_engines.get(name)
+        if engine is None:
+            env_var = PS_DATABASES.get(name)
+            if env_var is None:
+                raise KeyError(f"Unknown PeopleSoft database '{name}', expected one of {list(PS_DATABASES)}")
+            url = os.getenv(env_var)
+            if not url:
+                raise RuntimeError(f"{env_var} is not set in the environment.")
+            pool_kwargs = {}
+            if not url.startswith("sqlite"):
+                pool_kwargs = {
+                    "pool_size": PS_POOL_SIZE,
+                    "max_overflow": PS_MAX_OVERFLOW,
+                    "pool_recycle": PS_POOL_RECYCLE,
+                    "pool_timeout": PS_POOL_TIMEOUT,
+                }
+            engine = create_engine(url, pool_pre_ping=True, **pool_kwargs)
+            _ps_engines[name] = engine
+    return engine
+
+
+def SessionLocalPS(name: str = "fscm") -> Session:
+    """Session on the pooled PeopleSoft engine (FSCM by default)."""
+    factory = _ps_sessionmakers.get(name)
+    if factory is None:
+        factory = sessionmaker(autocommit=False, autoflush=False, bind=get_ps_engine(name))
+        _ps_sessionmakers[name] = factory
+    return factory()
+
+
+def dispose_ps_engines() -> None:
+    """Close all pooled PeopleSoft connections (e.g. on app shutdown)."""
+    with _ps_lock:
+        engines = list(_ps_engines.values())
+        _ps_engines.clear()
+        _ps_sessionmakers.clear()
+    for ps_engine in engines:
+        ps_engine.dispose()
+
+
+# Async engine for the read-heavy API endpoints; the bots keep the blocking
+# SessionLocal. ASYNC_DATABASE_URL overrides the driver derived from DATABASE_URL.
+ASYNC_DRIVERS = {
+    "mssql": "mssql+aioodbc",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "10"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_MAX_OVERFLOW", "10"))
+
+_async_engine: AsyncEngine | None = None
+_async_sessionmaker: async_sessionmaker | None = None
+_async_lock = threading.Lock()
+
+
+def async_database_url() -> str:
+    explicit = os.getenv("ASYNC_DATABASE_URL")
+    if explicit:
+        return explicit
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL is not set in the environment.")
+    url = make_url(DATABASE_URL)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver known for {url.drivername}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def get_async_engine() -> AsyncEngine:
+    """Async engine on the app database, created on first use."""
+    global _async_engine
+    if _async_engine is None:
+        with _async_lock:
+            if _async_engine is None:
+                url = async_database_url()
+                pool_kwargs = {}
+                if not url.startswith("sqlite"):
+                    pool_kwargs = {"pool_size": ASYNC_POOL_SIZE, "max_overflow": ASYNC_MAX_OVERFLOW}
+                _async_engine = create_async_engine(url, pool_pre_ping=True, **pool_kwargs)
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        _async_sessionmaker = async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker()
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _async_sessionmaker
+    engine, _async_engine, _async_sessionmaker = _async_engine, None, None
+    if engine is not None:
+        await engine.dispose()
 
-if not PS_DATABASE_URL:
-    raise RuntimeError("PS_DB_URL is not set in the environment.")
-ps_engine = create_engine(PS_DATABASE_URL)
-SessionLocalPS = sessionmaker(autocommit=False, autoflush=False, bind=ps_engine)
 
 Base = declarative_base()
 
@@ -30,6 +181,11 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def get_ps_db():
     db = SessionLocalPS()
     try:
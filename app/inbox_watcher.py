@@ -0,0 +1,88 @@
+"""
+Queue voucher entry runs when vendor inbox folders change.
+
+    python -m app.inbox_watcher --vendors royal,cdw,grainger          # test folders
+    python -m app.inbox_watcher --vendors royal,cdw --prod
+
+When a vendor folder has settled after a change, its manifest is scanned
+(app.services.inbox) and a voucher_entry job is queued for the workers if
+there are new files and no run for that vendor is already waiting.
+"""
+from __future__ import annotations
+
+import argparse
+
+from app.bots.vendor_dirs import get_vendor_directory
+from app.services.inbox import INBOX_POLL_SECONDS, INBOX_SETTLE_SECONDS, InboxWatcher, inbox_manifest
+from app.services.job_queue import job_queue
+from app.services.job_scheduler import PRIORITY_NORMAL, environment
+
+
+def _queued_vendors(test_mode: bool) -> set[str]:
+    from app import database, models
+
+    with database.SessionLocal() as session:
+        rows = (
+            session.query(models.BotRun.job_args)
+            .filter(
+                models.BotRun.status == "queued",
+                models.BotRun.job_type == "voucher_entry",
+                models.BotRun.test_mode.is_(test_mode),
+            )
+            .all()
+        )
+    return {(args or {}).get("vendor_key") for (args,) in rows}
+
+
+def queue_vendor_if_pending(vendor_key: str, test_mode: bool) -> str | None:
+    """Queue a voucher entry run for the vendor when its folder has new files. Returns the runid."""
+    folder = get_vendor_directory(vendor_key, test_mode)
+    pending = inbox_manifest.scan(folder, environment=environment("fscm", test_mode))
+    if not pending:
+        return None
+    if vendor_key in _queued_vendors(test_mode):
+        print(f"[INBOX] {vendor_key}: {len(pending)} new files, run already queued")
+        return None
+    runid = job_queue.enqueue(
+        "voucher_entry",
+        {"vendor_key": vendor_key},
+        identifier=vendor_key,
+        test_mode=test_mode,
+        bot_name="voucher_entry",
+        context={"vendor_key": vendor_key, "test_mode": test_mode, "trigger": "inbox", "new_files": len(pending)},
+        priority=PRIORITY_NORMAL,
+    )
+    print(f"[INBOX] {vendor_key}: queued {runid} for {len(pending)} new files")
+    return runid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vendors", required=True, help="Comma-separated vendor keys to watch")
+    parser.add_argument("--prod", action="store_true", help="Watch the production folders (default: test)")
+    parser.add_argument("--poll-seconds", type=float, default=INBOX_POLL_SECONDS)
+    parser.add_argument("--settle-seconds", type=float, default=INBOX_SETTLE_SECONDS)
+    args = parser.parse_args()
+
+    test_mode = not args.prod
+    folders = {}
+    for vendor_key in (key.strip() for key in args.vendors.split(",") if key.strip()):
+        try:
+            folders[vendor_key] = get_vendor_directory(vendor_key, test_mode)
+        except KeyError:
+            parser.error(f"Unknown vendor key '{vendor_key}'")
+
+    watcher = InboxWatcher(
+        folders,
+        lambda vendor_key: queue_vendor_if_pending(vendor_key, test_mode),
+        poll_seconds=args.poll_seconds,
+        settle_seconds=args.settle_seconds,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("[INBOX] Stopping")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,22 @@
-﻿from typing import List, Dict
-from anyio import from_thread
+﻿from typing import List, Dict, Optional
 from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from . import models, database
-from .routes import process_log, bots_voucher_entry, bot_runs
+from .routes import process_log, bots_voucher_entry, bot_runs, invoice_extraction
+from .services.invoice_extraction import extract_invoice as extract_invoice_cached
+from .services.run_summary import empty_summary, summary_counts
 from urllib.parse import unquote
+from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="AI Bot Process Log API")
 app.include_router(process_log.router)
 app.include_router(bots_voucher_entry.router)
 app.include_router(bot_runs.router)
+app.include_router(invoice_extraction.router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,31 +32,51 @@ class ExtractInvoiceIn(BaseModel):
 @app.on_event("startup")
 def on_startup():
     # create tables if they do not exist
-    models.Base.metadata.create_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.get_engine())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    database.dispose_ps_engines()
+    await database.dispose_async_engine()
 
 
 @app.get("/runids", response_model=List[str])
-def list_runids(db: Session = Depends(database.get_db)):
-    """List all distinct run IDs in the process log."""
-    rows = db.query(models.BotProcessLog.runid).distinct().all()
-    return [row[0] for row in rows]
+async def list_runids(
+    bot_name: Optional[str] = Query(None, description="Only runs of this bot"),
+    limit: Optional[int] = Query(None, ge=1, description="Newest N run IDs"),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """List run IDs, newest first (from the runs table, not the process log)."""
+    query = select(models.BotRun.runid)
+    if bot_name:
+        query = query.where(models.BotRun.bot_name == bot_name)
+    query = query.order_by(models.BotRun.id.desc())
+    if limit:
+        query = query.limit(limit)
+    return list(await db.scalars(query))
 
 
 @app.get("/runids/status_counts", response_model=Dict[str, int])
-def status_counts(runid: str = Query(...), db: Session = Depends(database.get_db)):
-    """Get count of each status for run IDs starting with the given value."""
-    rows = (
-        db.query(
-            models.BotProcessLog.status,
-            func.count(models.BotProcessLog.id)
-        )
-        .filter(models.BotProcessLog.runid.like(f"{runid}%"))
-        .group_by(models.BotProcessLog.status)
-        .all()
-    )
-    if not rows:
+async def status_counts(runid: str = Query(...), db: AsyncSession = Depends(database.get_async_db)):
+    """Summed status counters for run IDs starting with the given value."""
+    summaries = list(await db.scalars(select(models.RunSummary).where(models.RunSummary.runid.like(f"{runid}%"))))
+    if not summaries:
         raise HTTPException(status_code=404, detail=f"No entries found for runid starting with '{runid}'")
-    return {status: count for status, count in rows}
+    totals = empty_summary()
+    for summary in summaries:
+        for name, count in summary_counts(summary).items():
+            totals[name] += count
+    return totals
+
+
+@app.get("/runids/{runid}/status_counts", response_model=Dict[str, int])
+async def run_status_counts(runid: str, db: AsyncSession = Depends(database.get_async_db)):
+    """Status counters for one run ID."""
+    summary = await db.scalar(select(models.RunSummary).where(models.RunSummary.runid == runid))
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"No entries found for runid '{runid}'")
+    return summary_counts(summary)
 
 
 @app.delete("/runids/{runid}")
@@ -61,21 +85,20 @@ def delete_runid(runid: str, db: Session = Depends(database.get_db)):
     deleted = db.query(models.BotProcessLog).filter(models.BotProcessLog.runid == runid).delete()
     if deleted == 0:
         raise HTTPException(status_code=404, detail=f"No entries found to delete for runid '{runid}'")
+    db.query(models.RunSummary).filter(models.RunSummary.runid == runid).delete()
     db.commit()
     return {"deleted": deleted}
 
 @app.post("/extract_invoice")
-def extract_invoice(payload: ExtractInvoiceIn):
-    
+async def extract_invoice(payload: ExtractInvoiceIn):
     """
-    Run the invoice_agent extraction process for the given filename and return the result.
+    Run the invoice extraction for the given filename and return the extracted
+    fields (cached by file content; see /extract_invoice/batch for many files).
     """
-    filename = payload.filename
-    from .bots.agents.invoice_extract import run_invoice_extraction  # Adjust import as needed
-    print(f"Extracting invoice from: {filename}")
-    try:
-        result = from_thread.run(run_invoice_extraction, filename)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    return result.final_output
-
+    print(f"Extracting invoice from: {payload.filename}")
+    outcome = await extract_invoice_cached(Path(payload.filename).expanduser())
+    if outcome.status == "not_found":
+        raise HTTPException(status_code=404, detail=outcome.error)
+    if outcome.data is None:
+        raise HTTPException(status_code=500, detail=outcome.error)
+    return outcome.data
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, DateTime, Float, Integer, JSON, String, UniqueConstraint, func
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, Index, Integer, JSON, String, UniqueConstraint, func
 
 from .database import Base
 
@@ -20,6 +20,8 @@ class BotProcessLog(Base):
 
 class BotRun(Base):
     __tablename__ = "automation_runs"
+    # Queue scan: queued runs by priority, oldest first
+    __table_args__ = (Index("ix_bot_runs_status_priority", "status", "priority", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     runid = Column(String(100), unique=True, nullable=False, index=True)
@@ -29,6 +31,17 @@ class BotRun(Base):
     test_mode = Column(Boolean, nullable=False, default=False)
     context = Column(JSON, nullable=True)
     message = Column(String(255), nullable=True)
+    # Job queue (see app.services.job_queue): what to run and who holds the lease
+    job_type = Column(String(50), nullable=True, index=True)
+    job_args = Column(JSON, nullable=True)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # Scheduling (see app.services.job_scheduler): higher priority is claimed first
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+    queued_at = Column(DateTime(timezone=True), nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -36,8 +49,12 @@ class BotRun(Base):
         return f"<BotRun(runid={self.runid}, bot_name={self.bot_name}, status={self.status})>"
 
 
+PAYLINE_NATURAL_KEY = ("tab_name", "emplid", "empl_rcd", "ern_ded_code", "amount")
+
+
 class PaylineExcelItem(Base):
     __tablename__ = "automation_payline_items"
+    __table_args__ = (UniqueConstraint(*PAYLINE_NATURAL_KEY, name="uq_payline_items_natural_key"),)
 
     id = Column(Integer, primary_key=True, index=True)
     tab_name = Column(String(100), nullable=False, index=True)
@@ -118,3 +135,115 @@ class DirectDepositProcessLog(Base):
 
     def __repr__(self) -> str:
         return f"<DirectDepositProcessLog(id={self.id}, runid={self.runid}, status={self.status})>"
+
+
+class LLMUsage(Base):
+    __tablename__ = "automation_llm_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    runid = Column(String(100), nullable=True, index=True)
+    filename = Column(String(255), nullable=True, index=True)
+    stage = Column(String(100), nullable=True, index=True)
+    model = Column(String(100), nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    image_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<LLMUsage(runid={self.runid}, stage={self.stage}, total_tokens={self.total_tokens})>"
+
+
+class RunSummary(Base):
+    """Per-run status counters, kept up to date by the process log writer."""
+
+    __tablename__ = "automation_run_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    runid = Column(String(255), unique=True, nullable=False, index=True)
+    processed = Column(Integer, nullable=False, default=0)
+    success = Column(Integer, nullable=False, default=0)
+    duplicate = Column(Integer, nullable=False, default=0)
+    failure = Column(Integer, nullable=False, default=0)
+    review_blocked = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<RunSummary(runid={self.runid}, processed={self.processed})>"
+
+
+class LlmSlot(Base):
+    """An LLM-heavy task running outside the job queue (API extractions), counted against JOB_MAX_LLM_JOBS."""
+
+    __tablename__ = "automation_llm_slots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    owner = Column(String(255), nullable=False)
+    acquired_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Slots of a process that died are ignored, and removed by requeue_expired, after this
+    lease_expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<LlmSlot(kind={self.kind}, owner={self.owner})>"
+
+
+class InboxFile(Base):
+    """Manifest entry for one file in a watched inbox folder (see app.services.inbox)."""
+
+    __tablename__ = "automation_inbox_files"
+    __table_args__ = (UniqueConstraint("folder", "filename", name="uq_inbox_files_folder_filename"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    folder = Column(String(500), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(Float, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    # PeopleSoft environment the last outcome was recorded for (e.g. fscm_prod)
+    environment = Column(String(20), nullable=True, index=True)
+    # new, success, duplicate, failure or already_entered
+    last_outcome = Column(String(50), nullable=False, default="new", index=True)
+    voucher_id = Column(String(255), nullable=True)
+    runid = Column(String(255), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    first_seen_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<InboxFile(folder={self.folder}, filename={self.filename}, last_outcome={self.last_outcome})>"
+
+
+class EnteredInvoice(Base):
+    """Idempotency ledger row for one invoice claimed or entered by a bot (see app.services.invoice_ledger)."""
+
+    __tablename__ = "automation_entered_invoices"
+    __table_args__ = (
+        UniqueConstraint(
+            "environment", "vendor", "invoice_number", "amount_cents", name="uq_entered_invoices_key"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # PeopleSoft environment (fscm_prod, fscm_test); test entries never block production
+    environment = Column(String(20), nullable=False)
+    vendor = Column(String(100), nullable=False)
+    invoice_number = Column(String(255), nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)
+    # claimed while a bot is entering it, entered once PeopleSoft returned a voucher
+    status = Column(String(20), nullable=False, default="claimed", index=True)
+    voucher_id = Column(String(255), nullable=True)
+    runid = Column(String(255), nullable=True, index=True)
+    filename = Column(String(255), nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=False)
+    entered_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"<EnteredInvoice(vendor={self.vendor}, invoice_number={self.invoice_number}, "
+            f"status={self.status}, voucher_id={self.voucher_id})>"
+        )
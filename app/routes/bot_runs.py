@@ -1,31 +1,52 @@
-﻿from typing import List, Optional
+﻿import asyncio
+import json
+import os
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from .. import database, models
 from ..schemas import BotRunCancelRequest, BotRunOut
+from ..services.cancellation import cancellation_registry
+from ..services.job_queue import job_queue
+from ..services.run_events import TERMINAL_STATUSES, publish_run_event, run_event_bus
+from ..services.run_summary import empty_summary, summary_counts
 
 router = APIRouter(prefix="/bot-runs", tags=["bot_runs"])
 
+# Idle streams re-check the DB (runs in other processes) and send a keepalive this often
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "15"))
+SNAPSHOT_RESULTS = 50
+
 
 @router.get("", response_model=List[BotRunOut])
-def list_bot_runs(
+async def list_bot_runs(
     bot_name: Optional[str] = None,
     status: Optional[str] = None,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
 ) -> List[models.BotRun]:
-    query = db.query(models.BotRun)
+    query = select(models.BotRun)
     if bot_name:
-        query = query.filter(models.BotRun.bot_name == bot_name)
+        query = query.where(models.BotRun.bot_name == bot_name)
     if status:
-        query = query.filter(models.BotRun.status == status)
-    return query.order_by(models.BotRun.created_at.desc()).all()
+        query = query.where(models.BotRun.status == status)
+    result = await db.scalars(query.order_by(models.BotRun.created_at.desc()))
+    return list(result)
+
+
+@router.get("/queue")
+async def job_queue_stats(db: AsyncSession = Depends(database.get_async_db)) -> dict:
+    """Queued runs per job type, PeopleSoft session / LLM job usage against the limits, and recent queue waits."""
+    return await db.run_sync(job_queue.stats)
 
 
 @router.get("/{runid}", response_model=BotRunOut)
-def get_bot_run(runid: str, db: Session = Depends(database.get_db)) -> models.BotRun:
-    run = db.query(models.BotRun).filter(models.BotRun.runid == runid).one_or_none()
+async def get_bot_run(runid: str, db: AsyncSession = Depends(database.get_async_db)) -> models.BotRun:
+    run = await db.scalar(select(models.BotRun).where(models.BotRun.runid == runid))
     if run is None:
         raise HTTPException(status_code=404, detail=f"Run '{runid}' not found")
     return run
@@ -45,11 +66,139 @@ def cancel_bot_run(
         raise HTTPException(status_code=400, detail=f"Run is already {run.status}")
 
     run.cancel_requested = True
-    if run.status not in {"cancel_requested"}:
+    if run.status == "queued":
+        # No worker has claimed it yet, so nothing else will finish it
+        run.status = "cancelled"
+    elif run.status not in {"cancel_requested"}:
         run.status = "cancel_requested"
     if payload and payload.reason:
         run.message = payload.reason
 
     db.commit()
     db.refresh(run)
+    # Runs executing in this process see the cancel immediately; others pick it up on the next poll
+    cancellation_registry.cancel(runid)
+    publish_run_event(runid, "status", status=run.status, message=run.message)
     return run
+
+
+async def _run_state(db: AsyncSession, runid: str) -> Optional[dict]:
+    run = await db.scalar(select(models.BotRun).where(models.BotRun.runid == runid))
+    if run is None:
+        return None
+    summary = await db.scalar(select(models.RunSummary).where(models.RunSummary.runid == runid))
+    return {
+        "status": run.status,
+        "message": run.message,
+        "counters": summary_counts(summary) if summary else empty_summary(),
+    }
+
+
+async def _snapshot(runid: str) -> Optional[dict]:
+    """Run status, counters and the latest results from the DB, for (re)joining clients."""
+    async with database.AsyncSessionLocal() as db:
+        state = await _run_state(db, runid)
+        if state is None:
+            return None
+        log = models.BotProcessLog
+        columns = ("id", "filename", "voucher_id", "amount", "invoice", "status")
+        rows = await db.execute(
+            select(*(getattr(log, name) for name in columns))
+            .where(log.runid == runid)
+            .order_by(log.id.desc())
+            .limit(SNAPSHOT_RESULTS)
+        )
+        state["results"] = [dict(zip(columns, row)) for row in reversed(rows.all())]
+    return state
+
+
+def _sse(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+def _last_seq(runid: str, last_event_id: Optional[str]) -> Optional[int]:
+    if not last_event_id or ":" not in last_event_id:
+        return None
+    event_runid, _, seq = last_event_id.rpartition(":")
+    return int(seq) if event_runid == runid and seq.isdigit() else None
+
+
+@router.get("/{runid}/events")
+async def stream_bot_run_events(
+    runid: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(database.get_async_db),
+) -> StreamingResponse:
+    """
+    Server-Sent Events for one run: a `snapshot` (status, counters, latest
+    results from the DB), then live `result`, `stage`, `counters` and
+    `status` events. Reconnecting with Last-Event-ID resumes from memory when
+    possible. The stream ends after a terminal status.
+    """
+    if await db.scalar(select(models.BotRun.id).where(models.BotRun.runid == runid)) is None:
+        raise HTTPException(status_code=404, detail=f"Run '{runid}' not found")
+    resume_after = _last_seq(runid, last_event_id)
+
+    async def _events() -> AsyncIterator[str]:
+        with run_event_bus.subscribe(runid) as queue:
+            sent = 0
+            history = run_event_bus.recent(runid)
+            if resume_after is not None and history and history[0].seq <= resume_after:
+                backlog = [event for event in history if event.seq > resume_after]
+                # Baseline for the idle DB poll below
+                async with database.AsyncSessionLocal() as state_db:
+                    state = await _run_state(state_db, runid)
+                if state is None:
+                    return
+            else:
+                state = await _snapshot(runid)
+                if state is None:
+                    return
+                yield _sse("snapshot", state)
+                backlog = []
+                if state["status"] in TERMINAL_STATUSES:
+                    return
+            for event in backlog:
+                sent = event.seq
+                yield _sse(event.type, event.as_dict(), event.id)
+                if event.type == "status" and event.data.get("status") in TERMINAL_STATUSES:
+                    return
+            if state["status"] in TERMINAL_STATUSES:
+                # Finished in another process while the client was away
+                yield _sse("status", {"runid": runid, "status": state["status"], "message": state["message"]})
+                return
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    # Nothing in memory: the run may be progressing in another process
+                    async with database.AsyncSessionLocal() as poll_db:
+                        latest = await _run_state(poll_db, runid)
+                    if latest is None:
+                        return
+                    if latest["counters"] != state["counters"]:
+                        yield _sse("counters", {"runid": runid, **latest["counters"]})
+                    if latest["status"] != state["status"]:
+                        yield _sse("status", {"runid": runid, "status": latest["status"], "message": latest["message"]})
+                        if latest["status"] in TERMINAL_STATUSES:
+                            return
+                    state = latest
+                    yield ": keepalive\n\n"
+                    continue
+                if event.seq <= sent:
+                    continue
+                sent = event.seq
+                yield _sse(event.type, event.as_dict(), event.id)
+                if event.type == "status" and event.data.get("status") in TERMINAL_STATUSES:
+                    return
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
@@ -1,17 +1,15 @@
-﻿import os
-from typing import Optional
+﻿from typing import Literal, Optional
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from ..bots.utils.misc import generate_runid, update_bot_run_status
-from ..bots.voucher_entry import get_vendor_directory, run_vendor_entry
+from ..bots.vendor_dirs import get_vendor_directory
+from ..services.inbox import inbox_manifest
+from ..services.job_queue import job_queue
+from ..services.job_scheduler import JOB_PRIORITIES, environment
 
 router = APIRouter(prefix="/bots/voucher-entry", tags=["bots"])
 
-RUN_BOTS_LOCALLY = os.getenv("RUN_BOTS_LOCALLY", "false").lower() in {"1", "true", "yes", "y"}
-
-
 class VoucherEntryRequest(BaseModel):
     vendor_key: str
     test_mode: bool = True
@@ -19,34 +17,19 @@ class VoucherEntryRequest(BaseModel):
     attach_only: bool = False
     apo_override: Optional[str] = None
     additional_instructions: Optional[str] = None
+    # Also retry files whose last attempt failed (new and changed files are always picked up)
+    retry_failed: bool = False
+    # Runs started from the UI go ahead of bulk/month-end backfills
+    priority: Literal["interactive", "normal", "backfill"] = "interactive"
 
 
 class VoucherEntryAccepted(BaseModel):
     runid: str
-    message: str = "Voucher entry run scheduled"
-
-
-def _run_voucher_entry_job(payload: dict, runid: str) -> None:
-    try:
-        run_vendor_entry(
-            vendor_key=payload["vendor_key"],
-            test_mode=payload["test_mode"],
-            rent_line=payload["rent_line"],
-            attach_only=payload["attach_only"],
-            apo_override=payload["apo_override"],
-            additional_instructions=payload["additional_instructions"],
-            runid=runid,
-        )
-    except Exception as exc:  # pragma: no cover - console logging for operator awareness
-        print(f"[voucher_entry] Background run {runid} failed: {exc}")
-        update_bot_run_status(runid, "failed", message=str(exc))
+    message: str = "Voucher entry run queued for a worker"
 
 
 @router.post("", response_model=VoucherEntryAccepted, status_code=202)
-def trigger_voucher_entry(payload: VoucherEntryRequest, background_tasks: BackgroundTasks) -> VoucherEntryAccepted:
-    if not RUN_BOTS_LOCALLY:
-        raise HTTPException(status_code=503, detail="Bot execution is disabled. Set RUN_BOTS_LOCALLY=1 to enable local runs.")
-
+def trigger_voucher_entry(payload: VoucherEntryRequest) -> VoucherEntryAccepted:
     try:
         vendor_path = get_vendor_directory(payload.vendor_key, payload.test_mode)
     except KeyError as exc:
@@ -55,22 +38,29 @@ def trigger_voucher_entry(payload: VoucherEntryRequest, background_tasks: Backgr
     if not vendor_path.exists():
         raise HTTPException(status_code=400, detail=f"Vendor directory {vendor_path} not found")
 
-    invoices = list(vendor_path.glob("*.pdf"))
-    if not invoices:
-        raise HTTPException(status_code=404, detail=f"No invoices found in {vendor_path}")
-
-    runid = generate_runid(
-        payload.vendor_key,
-        payload.test_mode,
+    pending = inbox_manifest.scan(
+        vendor_path,
+        environment=environment("fscm", payload.test_mode),
+        retry_failed=payload.retry_failed,
+    )
+    if not pending:
+        raise HTTPException(status_code=404, detail=f"No new invoices found in {vendor_path}")
+
+    # Executed by `python -m app.worker`, not in the API process
+    runid = job_queue.enqueue(
+        "voucher_entry",
+        payload.model_dump(exclude={"test_mode", "priority"}),
+        identifier=payload.vendor_key,
+        test_mode=payload.test_mode,
         bot_name="voucher_entry",
         context={
             "vendor_key": payload.vendor_key,
             "test_mode": payload.test_mode,
             "rent_line": payload.rent_line,
             "attach_only": payload.attach_only,
+            "new_files": len(pending),
         },
-        initial_status="queued",
+        priority=JOB_PRIORITIES[payload.priority],
     )
-    background_tasks.add_task(_run_voucher_entry_job, payload.model_dump(), runid)
 
     return VoucherEntryAccepted(runid=runid)
@@ -0,0 +1,65 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from ..services.invoice_extraction import extract_invoices
+
+router = APIRouter(prefix="/extract_invoice", tags=["extraction"])
+
+MAX_BATCH_FILES = 500
+
+
+class ExtractBatchIn(BaseModel):
+    filenames: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_FILES)
+    additional_instructions: Optional[str] = None
+
+
+def _stream(files: Iterable[tuple[str, Path]], extra_instructions: Optional[str], cleanup: Optional[Path] = None) -> StreamingResponse:
+    async def _lines() -> AsyncIterator[str]:
+        try:
+            async for outcome in extract_invoices(files, extra_instructions):
+                yield json.dumps(outcome.as_dict()) + "\n"
+        finally:
+            if cleanup is not None:
+                shutil.rmtree(cleanup, ignore_errors=True)
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+@router.post("/batch")
+async def extract_invoice_batch(payload: ExtractBatchIn) -> StreamingResponse:
+    """
+    Extract many invoices (server-side paths) concurrently. Streams one NDJSON
+    line per file as it finishes: cache hits first, then extractions.
+    """
+    files = [(filename, Path(filename).expanduser()) for filename in payload.filenames]
+    return _stream(files, payload.additional_instructions)
+
+
+@router.post("/batch/upload")
+async def extract_invoice_batch_upload(
+    files: List[UploadFile] = File(...),
+    additional_instructions: Optional[str] = Form(None),
+) -> StreamingResponse:
+    """Same as /batch for uploaded files; results are keyed by the uploaded filename."""
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+    scratch = Path(tempfile.mkdtemp(prefix="extract_upload_"))
+    saved = []
+    try:
+        for index, upload in enumerate(files):
+            name = upload.filename or f"upload-{index}.pdf"
+            # Index prefix keeps duplicate upload names apart
+            path = scratch / f"{index}-{Path(name).name}"
+            path.write_bytes(await upload.read())
+            saved.append((name, path))
+    except Exception:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return _stream(saved, additional_instructions, cleanup=scratch)
@@ -1,34 +1,99 @@
-﻿from typing import List, Optional
+﻿import json
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import database, models
 
 router = APIRouter(prefix="/process-logs", tags=["process_logs"])
 
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+EXPORT_CHUNK_SIZE = 1000
+LOG_FIELDS = ("id", "runid", "filename", "voucher_id", "amount", "invoice", "status")
+
 
 class BotProcessLogOut(BaseModel):
     id: int
-    runid: str
-    filename: Optional[str]
-    voucher_id: Optional[str]
-    amount: Optional[float]
-    invoice: Optional[str]
-    status: Optional[str]
+    runid: Optional[str] = None
+    filename: Optional[str] = None
+    voucher_id: Optional[str] = None
+    amount: Optional[float] = None
+    invoice: Optional[str] = None
+    status: Optional[str] = None
 
     class Config:
         orm_mode = True
 
 
-@router.get("", response_model=List[BotProcessLogOut])
-def list_process_logs(
-    runid: Optional[str] = Query(None, description="Filter logs by runid"),
-    db: Session = Depends(database.get_db),
-) -> List[models.BotProcessLog]:
-    query = db.query(models.BotProcessLog)
+def _parse_fields(fields: Optional[str]) -> tuple[str, ...]:
+    """Requested columns (id is always included, it is the cursor)."""
+    if not fields:
+        return LOG_FIELDS
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(requested) - set(LOG_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}; choose from {list(LOG_FIELDS)}")
+    return tuple(dict.fromkeys(["id", *requested]))
+
+
+def _page_query(columns: tuple[str, ...], runid: Optional[str], before_id: Optional[int], limit: int):
+    """One page, newest first, of rows with id < before_id."""
+    model = models.BotProcessLog
+    query = select(*(getattr(model, name) for name in columns))
     if runid:
-        query = query.filter(models.BotProcessLog.runid == runid)
-    return query.order_by(models.BotProcessLog.id.desc()).all()
+        query = query.where(model.runid == runid)
+    if before_id is not None:
+        query = query.where(model.id < before_id)
+    return query.order_by(model.id.desc()).limit(limit)
+
+
+async def _page(db: AsyncSession, columns: tuple[str, ...], runid: Optional[str], before_id: Optional[int], limit: int) -> list[dict]:
+    result = await db.execute(_page_query(columns, runid, before_id, limit))
+    return [dict(zip(columns, row)) for row in result]
+
+
+@router.get("", response_model=List[BotProcessLogOut], response_model_exclude_unset=True)
+async def list_process_logs(
+    response: Response,
+    runid: Optional[str] = Query(None, description="Filter logs by runid"),
+    before_id: Optional[int] = Query(None, description="Cursor: only rows with a smaller id (use X-Next-Cursor)"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status"),
+    db: AsyncSession = Depends(database.get_async_db),
+) -> List[dict]:
+    """
+    Newest logs first, `limit` per page. When more rows exist, the
+    X-Next-Cursor header holds the `before_id` for the next page.
+    """
+    rows = await _page(db, _parse_fields(fields), runid, before_id, limit)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return rows
+
+
+@router.get("/export")
+async def export_process_logs(
+    runid: Optional[str] = Query(None, description="Filter logs by runid"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status"),
+) -> StreamingResponse:
+    """Stream all matching logs as NDJSON (one object per line), newest first."""
+    columns = _parse_fields(fields)
+
+    async def _lines() -> AsyncIterator[str]:
+        # Own session: the request-scoped one is closed before the body is streamed
+        async with database.AsyncSessionLocal() as db:
+            before_id = None
+            while True:
+                rows = await _page(db, columns, runid, before_id, EXPORT_CHUNK_SIZE)
+                for row in rows:
+                    yield json.dumps(row) + "\n"
+                if len(rows) < EXPORT_CHUNK_SIZE:
+                    return
+                before_id = rows[-1]["id"]
 
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
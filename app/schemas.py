@@ -44,6 +44,7 @@ class PDFExtractionResult(BaseModel):
     image_base64: str
     success: bool
     description: str
+    native_text: bool = False
 
 
 class ScholarshipExtractedCheckAuthorization(BaseModel):
@@ -69,6 +70,10 @@ class BotRunOut(BaseModel):
     test_mode: bool
     context: Optional[dict[str, Any]] = None
     message: Optional[str] = None
+    job_type: Optional[str] = None
+    lease_owner: Optional[str] = None
+    attempts: Optional[int] = None
+    priority: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,146 @@
+"""
+In-memory run cancellation.
+
+Workers check a CancellationToken (a threading.Event) instead of querying
+BotRun.cancel_requested before every file. Tokens are kept in sync two ways:
+
+- push: the cancel endpoint / request_run_cancel set the token directly when
+  the run lives in this process (immediate);
+- poll: one background thread reads cancel_requested for all registered runs
+  in a single query every CANCEL_POLL_SECONDS (bounds the latency when the
+  cancel comes from another process).
+
+The poller only runs while at least one token is registered.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "5"))
+
+
+class CancellationToken:
+    """Cheap, thread-safe cancel flag for one run."""
+
+    def __init__(self, runid: str):
+        self.runid = runid
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Sleep up to `timeout` seconds, waking early on cancel. Returns cancelled."""
+        return self._event.wait(timeout)
+
+
+class CancellationRegistry:
+    """Tokens for the runs active in this process, plus the DB poller."""
+
+    def __init__(self, poll_seconds: float = CANCEL_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._tokens: dict[str, CancellationToken] = {}
+        self._refs: dict[str, int] = {}
+        self._poller: threading.Thread | None = None
+
+    def register(self, runid: str, *, sync: bool = True) -> CancellationToken:
+        """Get (or create) the token for `runid`; `sync` reads the DB flag once now."""
+        with self._lock:
+            token = self._tokens.get(runid)
+            if token is None:
+                token = self._tokens[runid] = CancellationToken(runid)
+            self._refs[runid] = self._refs.get(runid, 0) + 1
+            self._ensure_poller()
+        if sync:
+            self.sync([runid])
+        return token
+
+    def unregister(self, runid: str) -> None:
+        with self._lock:
+            remaining = self._refs.get(runid, 0) - 1
+            if remaining > 0:
+                self._refs[runid] = remaining
+                return
+            self._refs.pop(runid, None)
+            self._tokens.pop(runid, None)
+
+    def get(self, runid: str) -> Optional[CancellationToken]:
+        with self._lock:
+            return self._tokens.get(runid)
+
+    def cancel(self, runid: str) -> bool:
+        """Push a cancel to an in-process run. Returns False if the run isn't here."""
+        token = self.get(runid)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    # ---------- DB sync ----------
+
+    def sync(self, runids: list[str] | None = None) -> set[str]:
+        """Read cancel_requested for the given (default: all registered) runs in one query."""
+        with self._lock:
+            pending = [
+                runid
+                for runid in (runids or list(self._tokens))
+                if runid in self._tokens and not self._tokens[runid].cancelled
+            ]
+        if not pending:
+            return set()
+        from app import database, models
+
+        session = database.SessionLocal()
+        try:
+            cancelled = {
+                runid
+                for (runid,) in session.query(models.BotRun.runid)
+                .filter(models.BotRun.runid.in_(pending), models.BotRun.cancel_requested.is_(True))
+                .all()
+            }
+        except Exception as exc:
+            print(f"[CANCEL] Cancel flag sync failed: {exc}")
+            return set()
+        finally:
+            session.close()
+        for runid in cancelled:
+            self.cancel(runid)
+        return cancelled
+
+    def _ensure_poller(self) -> None:
+        # Called with the lock held
+        if self.poll_seconds <= 0 or (self._poller is not None and self._poller.is_alive()):
+            return
+        self._poller = threading.Thread(target=self._poll, name="cancel-poller", daemon=True)
+        self._poller.start()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                if not self._tokens:
+                    self._poller = None
+                    return
+            self.sync()
+
+
+cancellation_registry = CancellationRegistry()
+
+
+@contextmanager
+def cancellation_token(runid: str) -> Iterator[CancellationToken]:
+    """Register a token for the duration of a run."""
+    token = cancellation_registry.register(runid)
+    try:
+        yield token
+    finally:
+        cancellation_registry.unregister(runid)
@@ -0,0 +1,303 @@
+"""
+Incremental ingestion of inbox folders (vendor invoice folders on OneDrive).
+
+InboxManifest keeps one automation_inbox_files row per file seen in a folder:
+size, mtime, sha256 and the last outcome of processing it. A scan
+
+- stats every file and only re-hashes those whose size or mtime changed;
+- returns files that are new or whose content changed;
+- skips files that were duplicates or already failed (failures are retried
+  with retry_failed), so a bad scan is not re-extracted and re-entered on
+  every run;
+- skips files whose content already produced a voucher in the same
+  PeopleSoft environment, in any folder (outcome "already_entered"), e.g.
+  the same invoice saved twice. A test run's voucher does not count for prod.
+
+Bots call record() with each file's outcome. Outcomes that say nothing about
+the file itself (another run holds the invoice, the ledger or extraction
+raised) are recorded as retryable: the file stays "new" and is picked up by
+the next scan, until it has been attempted INBOX_MAX_ATTEMPTS times. InboxWatcher notices folders
+with new or changed files (OS notifications when the optional `watchdog`
+package is installed, otherwise a cheap stat poll) so runs can be started
+per folder instead of on a schedule (see app.inbox_watcher).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from sqlalchemy import case, update
+
+INBOX_POLL_SECONDS = float(os.getenv("INBOX_POLL_SECONDS", "30"))
+# A folder must be quiet this long before it is processed (OneDrive writes files in pieces)
+INBOX_SETTLE_SECONDS = float(os.getenv("INBOX_SETTLE_SECONDS", "10"))
+# sha256 values per "already entered" lookup (SQL Server allows 2100 parameters)
+SHA_LOOKUP_CHUNK = 1000
+# Attempts after which a retryable outcome is kept as a failure
+INBOX_MAX_ATTEMPTS = int(os.getenv("INBOX_MAX_ATTEMPTS", "5"))
+
+NEW = "new"
+SUCCESS = "success"
+ALREADY_ENTERED = "already_entered"
+RETRYABLE_OUTCOMES = frozenset({"failure"})
+
+
+@dataclass(frozen=True)
+class InboxEntry:
+    path: Path
+    sha256: str
+    previous_outcome: str
+    # PeopleSoft environment of the run processing it, recorded with the outcome
+    environment: str
+
+
+def file_sha256(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def folder_key(folder: str | Path) -> str:
+    return str(Path(folder).expanduser().resolve())
+
+
+class InboxManifest:
+    def _session(self):
+        from app import database
+
+        return database.SessionLocal()
+
+    def scan(
+        self,
+        folder: str | Path,
+        pattern: str = "*.pdf",
+        *,
+        environment: str,
+        retry_failed: bool = False,
+    ) -> list[InboxEntry]:
+        """
+        Files in `folder` that need processing for a run against `environment`
+        (job_scheduler.environment, e.g. "fscm_prod"), in name order; updates the manifest.
+        """
+        from app import models
+
+        key = folder_key(folder)
+        paths = sorted(Path(key).glob(pattern))
+        with self._session() as session:
+            rows = {
+                row.filename: row
+                for row in session.query(models.InboxFile).filter(models.InboxFile.folder == key)
+            }
+            seen = []
+            for path in paths:
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue  # moved away mid-scan
+                row = rows.get(path.name)
+                if row is not None and row.size == stat.st_size and row.mtime == stat.st_mtime:
+                    seen.append((path, row))
+                    continue
+                sha256 = file_sha256(path)
+                if row is None:
+                    row = models.InboxFile(folder=key, filename=path.name, sha256=sha256, last_outcome=NEW, attempts=0)
+                    session.add(row)
+                elif row.sha256 != sha256:
+                    # Same name, new content: a new piece of work
+                    row.sha256, row.last_outcome, row.voucher_id, row.attempts = sha256, NEW, None, 0
+                row.size, row.mtime = stat.st_size, stat.st_mtime
+                seen.append((path, row))
+            session.flush()
+
+            entered = self._entered(
+                session, {row.sha256 for _, row in seen if row.last_outcome != SUCCESS}, environment
+            )
+            pending = []
+            for path, row in seen:
+                if row.last_outcome in (SUCCESS, ALREADY_ENTERED):
+                    continue
+                if row.sha256 in entered:
+                    row.last_outcome, row.voucher_id = ALREADY_ENTERED, entered[row.sha256]
+                    row.environment = environment
+                    print(f"[INBOX] Skipping {path.name}: same content already entered as voucher {row.voucher_id}")
+                    continue
+                if row.last_outcome == NEW or (retry_failed and row.last_outcome in RETRYABLE_OUTCOMES):
+                    pending.append(InboxEntry(path, row.sha256, row.last_outcome, environment))
+            session.commit()
+        return pending
+
+    @staticmethod
+    def _entered(session, hashes: set[str], environment: str) -> dict[str, Optional[str]]:
+        """sha256 -> voucher_id for contents entered successfully in `environment`, in any folder."""
+        from app import models
+
+        table = models.InboxFile
+        hashes_list = sorted(hashes)
+        entered: dict[str, Optional[str]] = {}
+        for start in range(0, len(hashes_list), SHA_LOOKUP_CHUNK):
+            chunk = hashes_list[start : start + SHA_LOOKUP_CHUNK]
+            entered.update(
+                session.query(table.sha256, table.voucher_id)
+                .filter(
+                    table.sha256.in_(chunk),
+                    table.last_outcome == SUCCESS,
+                    table.environment == environment,
+                )
+                .all()
+            )
+        return entered
+
+    def record(
+        self,
+        entry: InboxEntry,
+        outcome: str,
+        *,
+        voucher_id: Optional[str] = None,
+        runid: Optional[str] = None,
+        retryable: bool = False,
+    ) -> None:
+        """
+        Store the outcome of processing `entry` ("success", "duplicate" or
+        "failure"). A `retryable` outcome leaves the file "new" for the next
+        scan until INBOX_MAX_ATTEMPTS.
+        """
+        from app import models
+
+        table = models.InboxFile
+        last_outcome = case((table.attempts + 1 < INBOX_MAX_ATTEMPTS, NEW), else_=outcome) if retryable else outcome
+        try:
+            with self._session() as session:
+                session.execute(
+                    update(table)
+                    .where(
+                        table.folder == folder_key(entry.path.parent),
+                        table.filename == entry.path.name,
+                        table.sha256 == entry.sha256,
+                    )
+                    .values(
+                        last_outcome=last_outcome,
+                        environment=entry.environment,
+                        voucher_id=voucher_id,
+                        runid=runid,
+                        attempts=table.attempts + 1,
+                    )
+                )
+                session.commit()
+        except Exception as exc:
+            print(f"[INBOX] Could not record {outcome} for {entry.path.name}: {exc}")
+
+
+inbox_manifest = InboxManifest()
+
+
+class InboxWatcher:
+    """
+    Calls `on_ready(name)` for a watched folder once it has new or changed
+    files and has been quiet for `settle_seconds`, and once per folder at start.
+    """
+
+    def __init__(
+        self,
+        folders: dict[str, Path],
+        on_ready: Callable[[str], None],
+        *,
+        pattern: str = "*.pdf",
+        poll_seconds: float = INBOX_POLL_SECONDS,
+        settle_seconds: float = INBOX_SETTLE_SECONDS,
+    ):
+        self.folders = {name: Path(folder) for name, folder in folders.items()}
+        self.on_ready = on_ready
+        self.pattern = pattern
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self._lock = threading.Lock()
+        # name -> monotonic time of the last change not yet handed to on_ready
+        self._dirty: dict[str, float] = {name: 0.0 for name in self.folders}
+        self._signatures: dict[str, frozenset] = {}
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _signature(self, folder: Path) -> frozenset:
+        entries = []
+        for path in folder.glob(self.pattern):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((path.name, stat.st_size, stat.st_mtime))
+        return frozenset(entries)
+
+    def mark_changed(self, name: str) -> None:
+        with self._lock:
+            self._dirty[name] = time.monotonic()
+
+    def poll(self) -> None:
+        """Detect changes by comparing stat signatures (used without watchdog)."""
+        for name, folder in self.folders.items():
+            signature = self._signature(folder)
+            if self._signatures.get(name) not in (None, signature):
+                self.mark_changed(name)
+            self._signatures[name] = signature
+
+    def dispatch_ready(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            ready = [name for name, changed in self._dirty.items() if now - changed >= self.settle_seconds]
+            for name in ready:
+                del self._dirty[name]
+        for name in ready:
+            try:
+                self.on_ready(name)
+            except Exception as exc:
+                print(f"[INBOX] Handling {name} failed: {exc}")
+        return ready
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def __init__(self, name: str):
+                self.name = name
+
+            def on_any_event(self, event):
+                paths = [getattr(event, "src_path", ""), getattr(event, "dest_path", "")]
+                if any(path and Path(path).match(watcher.pattern) for path in paths):
+                    watcher.mark_changed(self.name)
+
+        observer = Observer()
+        for name, folder in self.folders.items():
+            observer.schedule(_Handler(name), str(folder), recursive=False)
+        observer.start()
+        return observer
+
+    def run(self) -> None:
+        observer = self._start_observer()
+        mode = "filesystem events" if observer is not None else f"polling every {self.poll_seconds:.0f}s"
+        print(f"[INBOX] Watching {len(self.folders)} folders ({mode})")
+        tick = min(self.poll_seconds, max(self.settle_seconds, 1.0))
+        next_poll = 0.0
+        try:
+            while not self._stop.is_set():
+                if observer is None and time.monotonic() >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + self.poll_seconds
+                self.dispatch_ready()
+                self._stop.wait(tick)
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
@@ -0,0 +1,203 @@
+"""
+Invoice extraction for the API: bounded concurrency plus a content-hash cache.
+
+Every API extraction (single or batch) runs on one shared thread pool of
+EXTRACT_CONCURRENCY workers (default JOB_MAX_LLM_JOBS), and every
+extraction holds an LLM slot from the job queue while it calls the model
+(JobQueue.llm_slot). Slots count against JOB_MAX_LLM_JOBS together with the
+running bot jobs, so a pre-extract of a whole vendor folder shares the LLM
+limit with the workers instead of adding to it.
+Results are cached by the file's bytes (and the extra instructions) in
+memory (the EXTRACT_CACHE_MEMORY_ENTRIES most recently used) and under
+EXTRACT_CACHE_DIR, so re-sending a file, even renamed or from another
+folder, is answered without calling the model. Bump EXTRACT_CACHE_VERSION
+when the extraction prompt or ExtractedInvoiceData changes.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterable, Optional
+
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY") or os.getenv("JOB_MAX_LLM_JOBS", "3"))
+EXTRACT_CACHE_MEMORY_ENTRIES = int(os.getenv("EXTRACT_CACHE_MEMORY_ENTRIES", "512"))
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", ".cache/extract")
+EXTRACT_CACHE_VERSION = "1"
+
+
+@dataclass
+class ExtractionOutcome:
+    filename: str
+    status: str  # "extracted", "cached", "not_found" or "failed"
+    data: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class ExtractionCache:
+    """Extraction results keyed by content hash; an LRU in memory, mirrored to EXTRACT_CACHE_DIR."""
+
+    def __init__(self, directory: str | None = EXTRACT_CACHE_DIR, max_entries: int = EXTRACT_CACHE_MEMORY_ENTRIES):
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max(1, max_entries)
+        self._memory: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, data: dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    @staticmethod
+    def key(content_hash: str, extra_instructions: str | None = None) -> str:
+        raw = f"{EXTRACT_CACHE_VERSION}:{content_hash}:{extra_instructions or ''}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if self.directory is None:
+            return None
+        try:
+            data = json.loads((self.directory / f"{key}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        self._remember(key, data)
+        return data
+
+    def set(self, key: str, data: dict[str, Any]) -> None:
+        self._remember(key, data)
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f"{key}.{os.getpid()}.tmp"
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.directory / f"{key}.json")
+        except OSError as exc:
+            print(f"[EXTRACT] Could not persist cache entry {key[:12]}: {exc}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+extraction_cache = ExtractionCache()
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _extract_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, EXTRACT_CONCURRENCY), thread_name_prefix="extract")
+        return _pool
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _llm_slot():
+    from app.services.job_queue import job_queue
+    from app.services.job_scheduler import API_EXTRACT
+
+    return job_queue.llm_slot(API_EXTRACT, owner=f"api:{socket.gethostname()}:{os.getpid()}")
+
+
+def _extract_in_slot(path: Path, extra_instructions: str | None) -> dict[str, Any] | None:
+    # Waits on the pool thread until the shared LLM limit has room
+    with _llm_slot():
+        return _extract_sync(path, extra_instructions)
+
+
+def _extract_sync(path: Path, extra_instructions: str | None) -> dict[str, Any] | None:
+    # The agent call blocks, so each extraction gets its own loop on a pool thread
+    from app.bots.agents.invoice_extract import run_invoice_extraction
+
+    result = asyncio.run(run_invoice_extraction(path, extra_instructions))
+    structured = (result or {}).get("structured_response")
+    if structured is None:
+        return None
+    return structured.model_dump(mode="json") if hasattr(structured, "model_dump") else dict(structured)
+
+
+@dataclass
+class _Pending:
+    path: Path
+    key: str
+    filenames: list[str] = field(default_factory=list)
+
+
+async def extract_invoices(
+    files: Iterable[tuple[str, Path]],
+    extra_instructions: str | None = None,
+    *,
+    cache: ExtractionCache | None = None,
+) -> AsyncIterator[ExtractionOutcome]:
+    """
+    Extract (name, path) files concurrently, yielding outcomes as they finish:
+    cache hits and missing files first, then extractions in completion order.
+    Files with identical content are extracted once.
+    """
+    cache = cache or extraction_cache
+    pending: dict[str, _Pending] = {}
+    for name, path in files:
+        start = time.perf_counter()
+        try:
+            data = await asyncio.to_thread(Path(path).read_bytes)
+        except OSError:
+            yield ExtractionOutcome(name, "not_found", error=f"File not found: {path}")
+            continue
+        key = ExtractionCache.key(content_hash(data), extra_instructions)
+        cached = cache.get(key)
+        if cached is not None:
+            yield ExtractionOutcome(name, "cached", data=cached, seconds=time.perf_counter() - start)
+            continue
+        pending.setdefault(key, _Pending(Path(path), key)).filenames.append(name)
+
+    if not pending:
+        return
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+
+    async def _run(job: _Pending) -> tuple[_Pending, dict[str, Any] | None, str | None]:
+        try:
+            return job, await loop.run_in_executor(_extract_pool(), _extract_in_slot, job.path, extra_instructions), None
+        except Exception as exc:
+            return job, None, str(exc)
+
+    for finished in asyncio.as_completed([_run(job) for job in pending.values()]):
+        job, data, error = await finished
+        elapsed = time.perf_counter() - start
+        if data is not None:
+            cache.set(job.key, data)
+        for name in job.filenames:
+            if data is not None:
+                yield ExtractionOutcome(name, "extracted", data=data, seconds=elapsed)
+            else:
+                yield ExtractionOutcome(name, "failed", error=error or "Extraction returned no result", seconds=elapsed)
+
+
+async def extract_invoice(path: Path, extra_instructions: str | None = None) -> ExtractionOutcome:
+    async for outcome in extract_invoices([(str(path), path)], extra_instructions):
+        return outcome
+    raise RuntimeError("extract_invoices yielded nothing")  # pragma: no cover
@@ -0,0 +1,227 @@
+"""
+Idempotency ledger of invoices entered into PeopleSoft.
+
+automation_entered_invoices has one row per (environment, vendor, invoice
+number, amount), normalized and enforced by a unique constraint. The same
+invoice dropped twice under different file names extracts to the same key,
+so bots can skip it after extraction with one indexed lookup, and two
+workers racing on the same invoice cannot both enter it:
+
+- entered(keys): key -> voucher_id for invoices already entered;
+- claim(key) inserts a "claimed" row right before browser entry; the unique
+  constraint lets exactly one run win, the others get the existing row;
+- settle(claim, voucher_id) marks the row entered when PeopleSoft returned a
+  voucher and deletes the claim otherwise, so the invoice can be retried.
+
+A claim left unsettled by a worker that died mid-entry is resumed by the same
+run when it is requeued, or taken over by another run after
+LEDGER_CLAIM_TTL_SECONDS. The dead worker may have saved the voucher before
+it died, so a resumed claim is only acquired after claim()'s `verify`
+callback confirmed PeopleSoft has no voucher for the invoice.
+
+entered() is a shortcut and logs lookup errors instead of raising; claim()
+guards entry and raises when the ledger cannot be reached.
+"""
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+LEDGER_CLAIM_TTL_SECONDS = float(os.getenv("LEDGER_CLAIM_TTL_SECONDS", "3600"))
+# Invoice numbers per lookup (SQL Server allows 2100 parameters)
+LEDGER_LOOKUP_CHUNK = 1000
+
+CLAIMED = "claimed"
+ENTERED = "entered"
+
+
+@dataclass(frozen=True)
+class LedgerKey:
+    environment: str
+    vendor: str
+    invoice_number: str
+    amount_cents: int
+
+
+@dataclass(frozen=True)
+class LedgerClaim:
+    key: LedgerKey
+    runid: str
+    acquired: bool
+    # Set when the invoice was already entered
+    voucher_id: Optional[str] = None
+    # Run holding the claim when it was not acquired
+    holder: Optional[str] = None
+
+
+def ledger_key(vendor: Optional[str], invoice_number: Optional[str], amount, *, test_mode: bool) -> Optional[LedgerKey]:
+    """Normalized key, or None when the invoice has no vendor or invoice number to key on."""
+    from app.services.job_scheduler import environment
+
+    vendor = re.sub(r"[^A-Z0-9]", "", (vendor or "").upper())
+    invoice_number = re.sub(r"\s+", "", (invoice_number or "").upper())
+    if not vendor or not invoice_number:
+        return None
+    return LedgerKey(environment("fscm", test_mode), vendor, invoice_number, int(round(float(amount or 0) * 100)))
+
+
+def is_voucher_id(voucher_id: Optional[str]) -> bool:
+    return bool(voucher_id) and str(voucher_id).isdigit()
+
+
+class InvoiceLedger:
+    def __init__(self, claim_ttl: float = LEDGER_CLAIM_TTL_SECONDS):
+        self.claim_ttl = claim_ttl
+
+    def _session(self):
+        from app import database
+
+        return database.SessionLocal()
+
+    @staticmethod
+    def _match(table, key: LedgerKey):
+        return (
+            table.environment == key.environment,
+            table.vendor == key.vendor,
+            table.invoice_number == key.invoice_number,
+            table.amount_cents == key.amount_cents,
+        )
+
+    def entered(self, keys: Iterable[LedgerKey]) -> dict[LedgerKey, str]:
+        """key -> voucher_id for the keys already entered ({} when the ledger cannot be read)."""
+        from app import models
+
+        table = models.EnteredInvoice
+        wanted = {key for key in keys if key is not None}
+        numbers = sorted({key.invoice_number for key in wanted})
+        found: dict[LedgerKey, str] = {}
+        try:
+            with self._session() as session:
+                for start in range(0, len(numbers), LEDGER_LOOKUP_CHUNK):
+                    rows = session.query(table).filter(
+                        table.invoice_number.in_(numbers[start : start + LEDGER_LOOKUP_CHUNK]),
+                        table.status == ENTERED,
+                    )
+                    for row in rows:
+                        key = LedgerKey(row.environment, row.vendor, row.invoice_number, row.amount_cents)
+                        if key in wanted:
+                            found[key] = row.voucher_id
+        except SQLAlchemyError as exc:
+            # claim() still stops a second entry
+            print(f"[LEDGER] Lookup failed, continuing without it: {exc}")
+            return {}
+        return found
+
+    def claim(
+        self,
+        key: LedgerKey,
+        *,
+        runid: str,
+        filename: Optional[str] = None,
+        verify: Optional[Callable[[], Optional[str]]] = None,
+    ) -> LedgerClaim:
+        """
+        Claim `key` for `runid` before entering it. `verify` returns the voucher
+        PeopleSoft already has for the invoice (or None) and is called before
+        resuming an unsettled claim; without it such a claim is not acquired.
+        """
+        try:
+            return self._claim(key, runid=runid, filename=filename, verify=verify)
+        except SQLAlchemyError as exc:
+            raise RuntimeError(f"Invoice ledger unavailable, not entering {key.invoice_number}: {exc}") from exc
+
+    def _claim(self, key: LedgerKey, *, runid: str, filename: Optional[str], verify) -> LedgerClaim:
+        from app import models
+
+        table = models.EnteredInvoice
+        now = datetime.now(timezone.utc)
+        with self._session() as session:
+            session.add(
+                table(
+                    environment=key.environment,
+                    vendor=key.vendor,
+                    invoice_number=key.invoice_number,
+                    amount_cents=key.amount_cents,
+                    status=CLAIMED,
+                    runid=runid,
+                    filename=filename,
+                    claimed_at=now,
+                )
+            )
+            try:
+                session.commit()
+                return LedgerClaim(key, runid, acquired=True)
+            except IntegrityError:
+                session.rollback()
+
+            row = session.query(table).filter(*self._match(table, key)).one_or_none()
+            if row is None:
+                # Released between our insert and the lookup; the caller can retry later
+                return LedgerClaim(key, runid, acquired=False)
+            if row.status == ENTERED:
+                return LedgerClaim(key, runid, acquired=False, voucher_id=row.voucher_id, holder=row.runid)
+            previous = row.runid
+            if previous != runid:
+                # Take over a claim whose run stopped without settling it
+                taken = session.execute(
+                    update(table)
+                    .where(
+                        table.id == row.id,
+                        table.status == CLAIMED,
+                        table.claimed_at < now - timedelta(seconds=self.claim_ttl),
+                    )
+                    .values(runid=runid, filename=filename, claimed_at=now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                session.commit()
+                if not taken:
+                    return LedgerClaim(key, runid, acquired=False, holder=previous)
+                print(f"[LEDGER] Took over stale claim on {key.invoice_number} from run {previous}")
+        # Same run requeued after its worker died, or a stale claim taken over
+        return self._resume(key, runid, previous, verify)
+
+    def _resume(self, key: LedgerKey, runid: str, previous: Optional[str], verify) -> LedgerClaim:
+        """Acquire an unsettled claim only once PeopleSoft shows no voucher for it."""
+        if verify is None:
+            print(f"[LEDGER] {key.invoice_number}: unsettled claim from run {previous}, cannot verify, not entering")
+            return LedgerClaim(key, runid, acquired=False, holder=previous)
+        try:
+            voucher_id = verify()
+        except Exception as exc:
+            # Keep the claim: entering now could duplicate a voucher the earlier attempt saved
+            print(f"[LEDGER] {key.invoice_number}: could not check PeopleSoft ({exc}), not entering")
+            return LedgerClaim(key, runid, acquired=False, holder=runid)
+        if voucher_id:
+            print(f"[LEDGER] {key.invoice_number}: run {previous} already saved voucher {voucher_id}")
+            self.settle(LedgerClaim(key, runid, acquired=True), voucher_id)
+            return LedgerClaim(key, runid, acquired=False, voucher_id=voucher_id, holder=previous)
+        return LedgerClaim(key, runid, acquired=True)
+
+    def settle(self, claim: Optional[LedgerClaim], voucher_id: Optional[str]) -> None:
+        """Record the voucher for an acquired claim, or release it when entry produced none."""
+        if claim is None or not claim.acquired:
+            return
+        from app import models
+
+        table = models.EnteredInvoice
+        owned = (*self._match(table, claim.key), table.runid == claim.runid, table.status == CLAIMED)
+        with self._session() as session:
+            if is_voucher_id(voucher_id):
+                session.execute(
+                    update(table)
+                    .where(*owned)
+                    .values(status=ENTERED, voucher_id=voucher_id, entered_at=datetime.now(timezone.utc))
+                    .execution_options(synchronize_session=False)
+                )
+            else:
+                session.execute(delete(table).where(*owned).execution_options(synchronize_session=False))
+            session.commit()
+
+
+invoice_ledger = InvoiceLedger()
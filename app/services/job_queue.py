@@ -0,0 +1,366 @@
+"""
+Durable job queue on automation_runs.
+
+The API enqueues a run (status "queued", job_type + job_args) and returns;
+worker processes (`python -m app.worker`) claim runs, execute them and keep
+the claim alive with heartbeats:
+
+    queued --claim--> running (lease_owner, lease_expires_at) --finish--> completed/failed/...
+               ^                     |
+               +---requeue_expired---+  lease ran out (worker died or hung)
+
+Which run is claimed next is decided by app.services.job_scheduler: runs
+that would exceed a PeopleSoft session or LLM job limit are skipped, and
+higher priority runs go first.
+
+Claiming locks the candidate row without waiting on rows other workers hold
+(`WITH (UPDLOCK, ROWLOCK, READPAST)` on SQL Server, `FOR UPDATE SKIP LOCKED`
+on PostgreSQL) and the UPDATE re-checks the status, so a run is handed to
+exactly one worker. Claims take a short transaction-scoped application lock
+so two workers cannot both fill the last slot of a limit. Runs whose lease expires are requeued until they have
+been attempted JOB_MAX_ATTEMPTS times, then marked failed; expired leases on
+runs that are no longer "running" are released too.
+
+Work that makes LLM calls outside the queue (API invoice extractions) takes
+an LLM slot with llm_slot(): a leased automation_llm_slots row, granted
+under the same claim lock and counted with the running jobs, so the API and
+the workers share JOB_MAX_LLM_JOBS.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import and_, not_, or_, select, text, update
+
+from app.services.job_scheduler import PRIORITY_NORMAL, JobLimits, active_llm_slots, queue_stats
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# An LLM slot is freed after this even if its holder died without releasing it
+LLM_SLOT_LEASE_SECONDS = int(os.getenv("LLM_SLOT_LEASE_SECONDS", "600"))
+# How long llm_slot() waits for a free slot before giving up
+LLM_SLOT_WAIT_SECONDS = float(os.getenv("LLM_SLOT_WAIT_SECONDS", "300"))
+LLM_SLOT_POLL_SECONDS = 1.0
+
+CLAIM_LOCK = "bot_job_claim"
+QUEUED = "queued"
+RUNNING = "running"
+
+
+@dataclass
+class ClaimedJob:
+    runid: str
+    job_type: str
+    args: dict[str, Any]
+    test_mode: bool
+    attempts: int
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+class JobQueue:
+    def __init__(
+        self,
+        *,
+        lease_seconds: int = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        limits: Optional[JobLimits] = None,
+    ):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.limits = limits or JobLimits()
+
+    def _session(self):
+        from app import database
+
+        return database.SessionLocal()
+
+    # ---------- producer ----------
+
+    def enqueue(
+        self,
+        job_type: str,
+        args: dict[str, Any],
+        *,
+        identifier: str,
+        test_mode: bool,
+        bot_name: str,
+        context: Optional[dict[str, Any]] = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> str:
+        """Create a queued BotRun for `job_type` and return its runid."""
+        from app import models
+        from app.bots.utils.misc import generate_runid
+
+        runid = generate_runid(identifier, test_mode, bot_name=bot_name, context=context, initial_status=QUEUED)
+        # job_type is set last: a run is only claimable once it has one
+        with self._session() as session:
+            session.query(models.BotRun).filter(models.BotRun.runid == runid).update(
+                {
+                    models.BotRun.job_type: job_type,
+                    models.BotRun.job_args: args,
+                    models.BotRun.priority: priority,
+                    models.BotRun.queued_at: _utcnow(),
+                },
+                synchronize_session=False,
+            )
+            session.commit()
+        return runid
+
+    # ---------- worker ----------
+
+    def claim(self, worker_id: str, job_types: Optional[list[str]] = None) -> Optional[ClaimedJob]:
+        """
+        Lease the best queued run (of `job_types`) that fits the limits to
+        `worker_id`, or None when nothing can start now.
+        """
+        from app import models
+
+        runs = models.BotRun.__table__
+        now = _utcnow()
+        with self._session() as session:
+            self._lock_claims(session)
+            active = self._active(session)
+            blocked = self.limits.blocked(active)
+            candidate = select(runs.c.id, runs.c.job_type, runs.c.test_mode).where(
+                runs.c.status == QUEUED,
+                runs.c.job_type.is_not(None),
+                runs.c.cancel_requested.is_(False),
+            )
+            if job_types is not None:
+                candidate = candidate.where(runs.c.job_type.in_(job_types))
+            if blocked:
+                candidate = candidate.where(
+                    not_(or_(*(and_(runs.c.job_type == jt, runs.c.test_mode.is_(tm)) for jt, tm in blocked)))
+                )
+            candidate = (
+                candidate.order_by(runs.c.priority.desc(), runs.c.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .with_hint(runs, "WITH (UPDLOCK, ROWLOCK, READPAST)", "mssql")
+            )
+            picked = session.execute(candidate).first()
+            if picked is None:
+                session.rollback()
+                return None
+            claimed = session.execute(
+                update(runs)
+                .where(runs.c.id == picked.id, runs.c.status == QUEUED)
+                .values(
+                    status=RUNNING,
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                    heartbeat_at=now,
+                    claimed_at=now,
+                    attempts=runs.c.attempts + 1,
+                )
+            ).rowcount
+            # Without the claim lock (e.g. SQLite) another worker may have taken this run,
+            # or started one of the same kind, since we looked
+            if claimed != 1 or self.limits.exceeded(self._active(session)):
+                session.rollback()
+                return None
+            row = session.execute(
+                select(runs.c.runid, runs.c.job_type, runs.c.job_args, runs.c.test_mode, runs.c.attempts).where(
+                    runs.c.id == picked.id
+                )
+            ).one()
+            session.commit()
+        return ClaimedJob(
+            runid=row.runid,
+            job_type=row.job_type,
+            args=dict(row.job_args or {}),
+            test_mode=bool(row.test_mode),
+            attempts=row.attempts,
+        )
+
+    @staticmethod
+    def _lock_claims(session) -> None:
+        """Serialize claims so the limits are checked against every committed claim."""
+        dialect = session.get_bind().dialect.name
+        if dialect == "mssql":
+            session.execute(
+                text("EXEC sp_getapplock @Resource = :name, @LockMode = 'Exclusive', @LockOwner = 'Transaction'"),
+                {"name": CLAIM_LOCK},
+            )
+        elif dialect == "postgresql":
+            session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": CLAIM_LOCK})
+
+    @staticmethod
+    def _active(session) -> list[tuple[str, bool]]:
+        from app import models
+
+        runs = [
+            (job_type, bool(test_mode))
+            for job_type, test_mode in session.query(models.BotRun.job_type, models.BotRun.test_mode).filter(
+                models.BotRun.lease_owner.is_not(None)
+            )
+        ]
+        return runs + active_llm_slots(session, _utcnow())
+
+    # ---------- LLM slots ----------
+
+    def acquire_llm_slot(self, kind: str, owner: str) -> Optional[int]:
+        """Take an LLM slot for `kind` if JOB_MAX_LLM_JOBS allows it now. Returns the slot id, or None."""
+        from app import models
+
+        now = _utcnow()
+        with self._session() as session:
+            self._lock_claims(session)
+            if (kind, False) in self.limits.blocked(self._active(session)):
+                session.rollback()
+                return None
+            slot = models.LlmSlot(
+                kind=kind,
+                owner=owner,
+                acquired_at=now,
+                lease_expires_at=now + timedelta(seconds=LLM_SLOT_LEASE_SECONDS),
+            )
+            session.add(slot)
+            session.flush()
+            # Without the claim lock (e.g. SQLite) a worker may have filled the limit since we looked
+            if self.limits.exceeded(self._active(session)):
+                session.rollback()
+                return None
+            session.commit()
+            return slot.id
+
+    def release_llm_slot(self, slot_id: int) -> None:
+        from app import models
+
+        with self._session() as session:
+            session.query(models.LlmSlot).filter(models.LlmSlot.id == slot_id).delete(synchronize_session=False)
+            session.commit()
+
+    @contextmanager
+    def llm_slot(
+        self,
+        kind: str,
+        owner: str,
+        *,
+        wait_seconds: float = LLM_SLOT_WAIT_SECONDS,
+        poll_seconds: float = LLM_SLOT_POLL_SECONDS,
+    ) -> Iterator[int]:
+        """Hold an LLM slot for the block, waiting up to `wait_seconds` for one to free up."""
+        deadline = time.monotonic() + wait_seconds
+        slot_id = self.acquire_llm_slot(kind, owner)
+        while slot_id is None:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No LLM slot free within {wait_seconds:.0f}s (JOB_MAX_LLM_JOBS={self.limits.llm_jobs})")
+            time.sleep(poll_seconds)
+            slot_id = self.acquire_llm_slot(kind, owner)
+        try:
+            yield slot_id
+        finally:
+            self.release_llm_slot(slot_id)
+
+    def stats(self, session) -> dict[str, Any]:
+        return queue_stats(session, self.limits)
+
+    def heartbeat(self, runid: str, worker_id: str) -> bool:
+        """Extend the lease. False means the lease was lost (expired and requeued/failed)."""
+        from app import models
+
+        now = _utcnow()
+        with self._session() as session:
+            extended = (
+                session.query(models.BotRun)
+                .filter(
+                    models.BotRun.runid == runid,
+                    models.BotRun.lease_owner == worker_id,
+                )
+                .update(
+                    {
+                        models.BotRun.heartbeat_at: now,
+                        models.BotRun.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+                    },
+                    synchronize_session=False,
+                )
+            )
+            session.commit()
+        return extended == 1
+
+    def finish(self, runid: str, worker_id: str, *, error: Optional[str] = None) -> None:
+        """
+        Release the lease. Runs the bot left in "running" become completed, or
+        failed when `error` is given; statuses the bot set itself are kept.
+        """
+        from app import models
+
+        with self._session() as session:
+            run = (
+                session.query(models.BotRun)
+                .filter(models.BotRun.runid == runid, models.BotRun.lease_owner == worker_id)
+                .one_or_none()
+            )
+            if run is None:
+                return
+            status = run.status
+            if error is not None:
+                status = "failed"
+                run.message = error[:255]
+            elif status in {RUNNING, "cancel_requested"}:
+                status = "cancelled" if run.cancel_requested else "completed"
+            run.status = status
+            run.lease_owner = None
+            run.lease_expires_at = None
+            session.commit()
+        from app.services.run_events import publish_run_event
+
+        publish_run_event(runid, "status", status=status, message=error)
+
+    def requeue_expired(self) -> tuple[int, int]:
+        """
+        Release every lease that ran out, whatever the run's status, so dead
+        workers stop counting against the limits. Running jobs are requeued,
+        or failed once out of attempts; runs with a cancel request become
+        cancelled and statuses the bot already set are kept. Returns (requeued, failed).
+        """
+        from app import models
+
+        runs = models.BotRun
+        expired = (runs.lease_expires_at.is_not(None), runs.lease_expires_at < _utcnow())
+        cancelling = or_(runs.status == "cancel_requested", runs.cancel_requested.is_(True))
+        running = (runs.status == RUNNING, not_(cancelling))
+        lease_cleared = {runs.lease_owner: None, runs.lease_expires_at: None}
+        with self._session() as session:
+            cancelled = (
+                session.query(runs)
+                .filter(*expired, runs.status.in_([RUNNING, "cancel_requested"]), cancelling)
+                .update({**lease_cleared, runs.status: "cancelled"}, synchronize_session=False)
+            )
+            failed = (
+                session.query(runs)
+                .filter(*expired, *running, runs.attempts >= self.max_attempts)
+                .update(
+                    {**lease_cleared, runs.status: "failed", runs.message: "Worker lease expired too many times"},
+                    synchronize_session=False,
+                )
+            )
+            requeued = (
+                session.query(runs)
+                .filter(*expired, *running, runs.attempts < self.max_attempts)
+                .update({**lease_cleared, runs.status: QUEUED}, synchronize_session=False)
+            )
+            # The bot set its own status (e.g. completed) but the worker died before finish()
+            released = session.query(runs).filter(*expired).update(lease_cleared, synchronize_session=False)
+            # LLM slots of API processes that died
+            session.query(models.LlmSlot).filter(models.LlmSlot.lease_expires_at < _utcnow()).delete(
+                synchronize_session=False
+            )
+            session.commit()
+        if requeued or failed or cancelled or released:
+            print(
+                f"[QUEUE] Expired leases: {requeued} requeued, {failed} failed, "
+                f"{cancelled} cancelled, {released} released"
+            )
+        return requeued, failed
+
+job_queue = JobQueue()
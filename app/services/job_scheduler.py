@@ -0,0 +1,174 @@
+"""
+Concurrency limits and priorities for the bot job queue.
+
+Every job type drives one PeopleSoft (FSCM or HCM) in a browser, and most
+also make a stream of LLM calls. JobQueue.claim only hands out a run when
+starting it keeps within:
+
+- JOB_MAX_SESSIONS_<SYSTEM>_<ENV>: browser sessions per PeopleSoft
+  environment (fscm_prod, fscm_test, hcm_prod, hcm_test; test runs use the
+  test environment);
+- JOB_MAX_LLM_JOBS: concurrently running LLM-heavy jobs, including API
+  invoice extractions, which hold an LLM slot (JobQueue.llm_slot) while
+  they run.
+
+Among the runs that fit, higher `priority` goes first (interactive runs
+from the API before month-end backfills), then the oldest. Runs of a job
+type without a profile are never limited.
+"""
+from __future__ import annotations
+
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from typing import Any, Iterable, Optional
+
+PRIORITY_INTERACTIVE = 10
+PRIORITY_NORMAL = 0
+PRIORITY_BACKFILL = -10
+JOB_PRIORITIES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "normal": PRIORITY_NORMAL,
+    "backfill": PRIORITY_BACKFILL,
+}
+
+# Claims in this window feed the wait-time metrics
+WAIT_METRICS_WINDOW = timedelta(hours=1)
+
+
+@dataclass(frozen=True)
+class JobProfile:
+    system: Optional[str]  # PeopleSoft the bot drives: "fscm", "hcm" or None
+    llm_heavy: bool
+
+
+# LLM slot kind of API invoice extractions (app.services.invoice_extraction)
+API_EXTRACT = "api_extract"
+
+
+JOB_PROFILES: dict[str, JobProfile] = {
+    "voucher_entry": JobProfile("fscm", llm_heavy=True),
+    "voucher_v2": JobProfile("fscm", llm_heavy=True),
+    "direct_deposit": JobProfile("hcm", llm_heavy=True),
+    "payline": JobProfile("hcm", llm_heavy=False),
+    API_EXTRACT: JobProfile(None, llm_heavy=True),
+}
+
+
+def environment(system: str, test_mode: bool) -> str:
+    return f"{system}_{'test' if test_mode else 'prod'}"
+
+
+def _session_limits() -> dict[str, int]:
+    return {
+        env: int(os.getenv(f"JOB_MAX_SESSIONS_{env.upper()}", default))
+        for env, default in (("fscm_prod", "2"), ("fscm_test", "3"), ("hcm_prod", "1"), ("hcm_test", "2"))
+    }
+
+
+class JobLimits:
+    def __init__(
+        self,
+        sessions: Optional[dict[str, int]] = None,
+        llm_jobs: Optional[int] = None,
+        profiles: Optional[dict[str, JobProfile]] = None,
+    ):
+        self.sessions = sessions if sessions is not None else _session_limits()
+        self.llm_jobs = llm_jobs if llm_jobs is not None else int(os.getenv("JOB_MAX_LLM_JOBS", "3"))
+        self.profiles = profiles if profiles is not None else JOB_PROFILES
+
+    def usage(self, active: Iterable[tuple[str, bool]]) -> tuple[Counter, int]:
+        """Sessions per environment and LLM-heavy job count for active (job_type, test_mode) runs."""
+        sessions: Counter = Counter()
+        llm_jobs = 0
+        for job_type, test_mode in active:
+            profile = self.profiles.get(job_type)
+            if profile is None:
+                continue
+            if profile.system is not None:
+                sessions[environment(profile.system, bool(test_mode))] += 1
+            llm_jobs += profile.llm_heavy
+        return sessions, llm_jobs
+
+    def fits(self, job_type: str, test_mode: bool, sessions: Counter, llm_jobs: int) -> bool:
+        """Whether one more run of this kind stays within the limits, given current usage."""
+        profile = self.profiles.get(job_type)
+        if profile is None:
+            return True
+        if profile.system is not None:
+            env = environment(profile.system, test_mode)
+            if env in self.sessions and sessions[env] >= self.sessions[env]:
+                return False
+        return not (profile.llm_heavy and llm_jobs >= self.llm_jobs)
+
+    def blocked(self, active: Iterable[tuple[str, bool]]) -> list[tuple[str, bool]]:
+        """(job_type, test_mode) combinations that cannot start now."""
+        sessions, llm_jobs = self.usage(active)
+        return [
+            (job_type, test_mode)
+            for job_type in self.profiles
+            for test_mode in (False, True)
+            if not self.fits(job_type, test_mode, sessions, llm_jobs)
+        ]
+
+    def exceeded(self, active: Iterable[tuple[str, bool]]) -> bool:
+        sessions, llm_jobs = self.usage(active)
+        return llm_jobs > self.llm_jobs or any(sessions[env] > cap for env, cap in self.sessions.items())
+
+
+def _utc(value: datetime) -> datetime:
+    # DATETIMEOFFSET columns come back aware on SQL Server, naive elsewhere
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def active_llm_slots(session, now: Optional[datetime] = None) -> list[tuple[str, bool]]:
+    """(kind, False) per unexpired LLM slot, to count with the active runs."""
+    from app import models
+
+    slots = models.LlmSlot
+    now = now or datetime.utcnow()
+    return [(kind, False) for (kind,) in session.query(slots.kind).filter(slots.lease_expires_at >= now)]
+
+
+def queue_stats(session, limits: JobLimits, now: Optional[datetime] = None) -> dict[str, Any]:
+    """Queue depth, waits and limit usage, for dashboards and capacity tuning."""
+    from app import models
+
+    runs = models.BotRun
+    now = now or datetime.utcnow()
+    queued: dict[str, dict[str, Any]] = {}
+    for job_type, priority, queued_at in session.query(runs.job_type, runs.priority, runs.queued_at).filter(
+        runs.status == "queued", runs.job_type.is_not(None)
+    ):
+        entry = queued.setdefault(job_type, {"depth": 0, "oldest_wait_seconds": 0.0, "by_priority": {}})
+        entry["depth"] += 1
+        entry["by_priority"][str(priority)] = entry["by_priority"].get(str(priority), 0) + 1
+        if queued_at is not None:
+            entry["oldest_wait_seconds"] = max(entry["oldest_wait_seconds"], (now - _utc(queued_at)).total_seconds())
+
+    active = session.query(runs.job_type, runs.test_mode).filter(runs.lease_owner.is_not(None)).all()
+    slots = active_llm_slots(session, now)
+    sessions, llm_jobs = limits.usage(active + slots)
+
+    waits = [
+        (_utc(claimed_at) - _utc(queued_at)).total_seconds()
+        for queued_at, claimed_at in session.query(runs.queued_at, runs.claimed_at).filter(
+            runs.claimed_at >= now - WAIT_METRICS_WINDOW, runs.queued_at.is_not(None)
+        )
+    ]
+    return {
+        "queued": queued,
+        "running": len(active),
+        "sessions": {env: {"active": sessions[env], "limit": cap} for env, cap in limits.sessions.items()},
+        "llm_jobs": {"active": llm_jobs, "limit": limits.llm_jobs, "api_extractions": len(slots)},
+        "recent_waits": {
+            "window_seconds": int(WAIT_METRICS_WINDOW.total_seconds()),
+            "claimed": len(waits),
+            "median_seconds": median(waits) if waits else None,
+            "max_seconds": max(waits) if waits else None,
+        },
+    }
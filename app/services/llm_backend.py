@@ -0,0 +1,222 @@
+"""
+Pluggable LLM backend: live, record or replay.
+
+    LLM_BACKEND=live     call the model (default)
+    LLM_BACKEND=record   call the model and save each structured response
+    LLM_BACKEND=replay   serve saved responses; never call the model
+
+Responses are stored one JSON file per request fingerprint under
+LLM_CASSETTE_DIR/<name>/<fingerprint>.json. The fingerprint covers the call
+name, the response schema, the prompt/messages and the bytes of any input
+files, so a cassette recorded on a corpus replays for that same corpus only.
+LLM_REPLAY_LATENCY_MS adds a fixed delay per replayed call so benchmarks can
+model provider latency without the network.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Type, TypeVar
+
+from pydantic import BaseModel
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+M = TypeVar("M", bound=BaseModel)
+
+BACKENDS = ("live", "record", "replay")
+DEFAULT_CASSETTE_DIR = ".cache/llm_cassettes"
+
+
+class CassetteMiss(LookupError):
+    """Replay mode found no recorded response for a request."""
+
+
+def backend_mode() -> str:
+    mode = os.getenv("LLM_BACKEND", "live").lower()
+    if mode not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{mode}', expected one of {BACKENDS}")
+    return mode
+
+
+def cassette_dir() -> Path:
+    return Path(os.getenv("LLM_CASSETTE_DIR", DEFAULT_CASSETTE_DIR))
+
+
+def replay_latency() -> float:
+    return float(os.getenv("LLM_REPLAY_LATENCY_MS", "0")) / 1000.0
+
+
+# ---------- FINGERPRINTS ----------
+
+def _normalize(value: Any, aliases: dict[str, str]) -> Any:
+    """
+    JSON-friendly form of messages/inputs (LangChain messages, pydantic models,
+    paths). Input file paths are swapped for placeholders via `aliases`.
+    """
+    if isinstance(value, BaseModel):
+        if hasattr(value, "content") and hasattr(value, "type"):  # LangChain BaseMessage
+            return {"type": value.type, "content": _normalize(value.content, aliases)}
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {str(key): _normalize(item, aliases) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item, aliases) for item in value]
+    if isinstance(value, Path):
+        value = str(value)
+    if isinstance(value, str):
+        return aliases.get(value, value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def _file_digest(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(name: str, request: Any, schema: Type[BaseModel], files: Iterable[str | Path] = ()) -> str:
+    files = list(files)
+    aliases: dict[str, str] = {}
+    for index, path in enumerate(files):
+        aliases[str(path)] = aliases[str(Path(path).expanduser().resolve())] = f"<file:{index}>"
+    payload = {
+        "name": name,
+        "schema": schema.model_json_schema(),
+        "request": _normalize(request, aliases),
+        # Files are identified by content, so the corpus can move between machines.
+        "files": [_file_digest(path) for path in files],
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "llm"
+
+
+def _cassette_path(name: str, key: str) -> Path:
+    return cassette_dir() / _slug(name) / f"{key}.json"
+
+
+def _save(name: str, key: str, schema: Type[BaseModel], response: BaseModel) -> None:
+    path = _cassette_path(name, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(
+        json.dumps(
+            {"name": name, "schema": schema.__name__, "fingerprint": key, "response": response.model_dump(mode="json")},
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+
+
+def _load(name: str, key: str, schema: Type[M]) -> M:
+    path = _cassette_path(name, key)
+    if not path.exists():
+        raise CassetteMiss(f"No recorded response for {name} ({key[:12]}) in {cassette_dir()}")
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return schema.model_validate(data["response"])
+
+
+def _as_schema(response: Any, schema: Type[M]) -> M:
+    return response if isinstance(response, schema) else schema.model_validate(response)
+
+
+# ---------- CALLS ----------
+
+def structured_call(
+    name: str,
+    request: Any,
+    call: Callable[[], Any],
+    *,
+    schema: Type[M],
+    files: Iterable[str | Path] = (),
+) -> M:
+    """Run `call()` (which returns a `schema` instance) through the configured backend."""
+    mode = backend_mode()
+    if mode == "live":
+        return call()
+    key = fingerprint(name, request, schema, files)
+    if mode == "replay":
+        delay = replay_latency()
+        if delay:
+            time.sleep(delay)
+        return _load(name, key, schema)
+    response = _as_schema(call(), schema)
+    _save(name, key, schema, response)
+    return response
+
+
+def invoke_agent(
+    name: str,
+    agent,
+    agent_input: dict,
+    *,
+    schema: Type[M],
+    prompt: str,
+    config: dict | None = None,
+    files: Iterable[str | Path] = (),
+) -> dict:
+    """
+    `agent.invoke(...)` for create_agent consumers. Replayed results carry only
+    `structured_response` (no message history).
+    """
+    if backend_mode() == "live":
+        return agent.invoke(agent_input, config=config)
+    holder: dict = {}
+
+    def _call():
+        holder["result"] = agent.invoke(agent_input, config=config)
+        return holder["result"].get("structured_response")
+
+    structured = structured_call(name, {"prompt": prompt, "input": agent_input}, _call, schema=schema, files=files)
+    return holder.get("result") or {"structured_response": structured, "messages": []}
+
+
+@dataclass
+class ReplayRunResult:
+    """Stand-in for an openai-agents RunResult when the response was replayed."""
+
+    final_output: Any
+    context_wrapper: Any = None
+
+
+async def run_agent(
+    name: str,
+    run: Callable[[], Awaitable[Any]],
+    *,
+    schema: Type[M],
+    prompt: str,
+    agent_input: Any,
+    files: Iterable[str | Path] = (),
+):
+    """`await Runner.run(...)` through the backend; `run` performs the live call."""
+    mode = backend_mode()
+    if mode == "live":
+        return await run()
+    key = fingerprint(name, {"prompt": prompt, "input": agent_input}, schema, files)
+    if mode == "replay":
+        delay = replay_latency()
+        if delay:
+            await asyncio.sleep(delay)
+        return ReplayRunResult(final_output=_load(name, key, schema))
+    result = await run()
+    _save(name, key, schema, _as_schema(result.final_output, schema))
+    return result
@@ -0,0 +1,286 @@
+"""
+Buffered writer for per-file process log rows.
+
+Bots used to open a session, insert one row and commit for every processed
+file. ProcessLogWriter buffers rows (BotProcessLog, DirectDepositProcessLog,
+...) and inserts them in one executemany per model when the buffer reaches
+LOG_FLUSH_ROWS rows or LOG_FLUSH_SECONDS have passed, whichever comes first.
+A background timer covers the time trigger, so rows still land while a slow
+file is being processed.
+
+Each flush also bumps the per-run counters in automation_run_summaries (see
+app.services.run_summary) in the same transaction. Rows are published as
+`result` events when added, and the updated counters as `counters` events
+after each flush (see app.services.run_events).
+
+Rows are flushed on close(), when the `process_log_writer()` block exits
+(normally, on an exception or on cancellation) and at interpreter exit.
+String values are cut to their column length when added. If a bulk insert
+fails, the batch is written row by row so one bad row cannot hold back the
+others; rows that fail stay buffered for the next flush, up to
+LOG_FLUSH_ATTEMPTS flushes. Rows that still cannot be written, after their
+last attempt or on close, are appended to a JSON lines file in
+LOG_SPOOL_DIR instead of being dropped.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from sqlalchemy import String, insert
+
+from app.services.run_events import publish_run_event
+from app.services.run_summary import apply_run_summary, summary_counts
+
+LOG_FLUSH_ROWS = int(os.getenv("LOG_FLUSH_ROWS", "25"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "5"))
+# Flushes a row is tried in before it is spooled to LOG_SPOOL_DIR
+LOG_FLUSH_ATTEMPTS = int(os.getenv("LOG_FLUSH_ATTEMPTS", "3"))
+LOG_SPOOL_DIR = os.getenv("LOG_SPOOL_DIR", ".cache/process_log_spool")
+# Never sent to event subscribers
+PRIVATE_LOG_FIELDS = frozenset({"bank_account", "routing_number"})
+
+_open_writers: "weakref.WeakSet[ProcessLogWriter]" = weakref.WeakSet()
+
+
+@lru_cache(maxsize=None)
+def _column_lengths(model) -> dict[str, int]:
+    return {
+        column.key: column.type.length
+        for column in model.__table__.columns
+        if isinstance(column.type, String) and column.type.length
+    }
+
+
+def fit_to_columns(model, row: dict) -> dict:
+    """`row` with string values cut to their column's length (e.g. a long review reason in status)."""
+    fitted = dict(row)
+    for key, length in _column_lengths(model).items():
+        value = fitted.get(key)
+        if isinstance(value, str) and len(value) > length:
+            fitted[key] = value[:length]
+    return fitted
+
+
+class ProcessLogWriter:
+    """Thread-safe buffered inserts for log models."""
+
+    def __init__(
+        self,
+        *,
+        max_rows: int = LOG_FLUSH_ROWS,
+        max_interval: float = LOG_FLUSH_SECONDS,
+        session_factory: Optional[Callable[[], Any]] = None,
+        max_attempts: int = LOG_FLUSH_ATTEMPTS,
+        spool_dir: str | None = LOG_SPOOL_DIR,
+    ):
+        self.max_rows = max(1, max_rows)
+        self.max_interval = max_interval
+        self.max_attempts = max(1, max_attempts)
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (model, row, failed flushes so far)
+        self._buffer: list[tuple[Any, dict, int]] = []
+        self._last_flush = time.monotonic()
+        self._closed = False
+        self._stop = threading.Event()
+        self._timer: threading.Thread | None = None
+        if max_interval and max_interval > 0:
+            self._timer = threading.Thread(target=self._run_timer, name="process-log-writer", daemon=True)
+            self._timer.start()
+        _open_writers.add(self)
+
+    # ---------- buffering ----------
+
+    def add(self, model, row: dict) -> None:
+        """Queue one row for `model` (an ORM class); flushes when a trigger is hit."""
+        if self._closed:
+            raise RuntimeError("ProcessLogWriter is closed")
+        row = fit_to_columns(model, row)
+        with self._lock:
+            self._buffer.append((model, row, 0))
+            due = len(self._buffer) >= self.max_rows or self._interval_elapsed()
+        publish_run_event(
+            row.get("runid"),
+            "result",
+            log=model.__name__,
+            **{key: value for key, value in row.items() if key != "runid" and key not in PRIVATE_LOG_FIELDS},
+        )
+        if due:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def _interval_elapsed(self) -> bool:
+        return bool(self.max_interval) and time.monotonic() - self._last_flush >= self.max_interval
+
+    def _run_timer(self) -> None:
+        while not self._stop.wait(self.max_interval):
+            with self._lock:
+                due = bool(self._buffer) and self._interval_elapsed()
+            if due:
+                self.flush()
+
+    # ---------- writing ----------
+
+    def _session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app import database
+
+        return database.SessionLocal()
+
+    def flush(self) -> int:
+        """Insert everything buffered. Returns rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if not rows:
+                return 0
+            by_model: dict[Any, list[dict]] = {}
+            for model, row, _ in rows:
+                by_model.setdefault(model, []).append(row)
+            session = self._session()
+            try:
+                try:
+                    for model, model_rows in by_model.items():
+                        session.execute(insert(model), model_rows)
+                    apply_run_summary(session, (row for _, row, _ in rows))
+                    session.commit()
+                    written = rows
+                except Exception as exc:
+                    session.rollback()
+                    print(f"[LOGWRITER] Flush of {len(rows)} rows failed, writing them one by one: {exc}")
+                    written = self._write_each(session, rows)
+                if written:
+                    self._publish_counters(session, {row.get("runid") for _, row, _ in written})
+                return len(written)
+            finally:
+                session.close()
+
+    def _write_each(self, session, rows: list[tuple[Any, dict, int]]) -> list[tuple[Any, dict, int]]:
+        """Insert rows in their own transactions; failed ones go back to the buffer or the spool."""
+        written, retry, rejected = [], [], []
+        for model, row, attempts in rows:
+            try:
+                session.execute(insert(model), [row])
+                apply_run_summary(session, [row])
+                session.commit()
+                written.append((model, row, attempts))
+            except Exception as exc:
+                session.rollback()
+                if attempts + 1 >= self.max_attempts:
+                    print(f"[LOGWRITER] {model.__name__} row failed {attempts + 1} times, spooling it: {exc}")
+                    rejected.append((model, row, attempts + 1))
+                else:
+                    retry.append((model, row, attempts + 1))
+        if retry:
+            with self._lock:
+                self._buffer[:0] = retry
+        self._spool(rejected)
+        return written
+
+    def _spool(self, rows: list[tuple[Any, dict, int]]) -> None:
+        """Append rows that could not be written to LOG_SPOOL_DIR, for loading them by hand later."""
+        if not rows:
+            return
+        try:
+            if self.spool_dir is None:
+                raise OSError("no LOG_SPOOL_DIR")
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            path = self.spool_dir / f"unwritten-{os.getpid()}.jsonl"
+            spooled_at = datetime.now(timezone.utc).isoformat()
+            with open(path, "a", encoding="utf-8") as handle:
+                for model, row, attempts in rows:
+                    record = {"model": model.__name__, "attempts": attempts, "spooled_at": spooled_at, "row": row}
+                    handle.write(json.dumps(record, default=str) + "\n")
+            print(f"[LOGWRITER] Spooled {len(rows)} unwritten rows to {path}")
+        except OSError as exc:
+            print(f"[LOGWRITER] Could not spool unwritten rows ({exc}):")
+            for model, row, _ in rows:
+                print(f"[LOGWRITER] Unwritten {model.__name__} row: {row}")
+
+    def _publish_counters(self, session, runids: set) -> None:
+        from app import models
+
+        runids.discard(None)
+        if not runids:
+            return
+        try:
+            summaries = session.query(models.RunSummary).filter(models.RunSummary.runid.in_(runids)).all()
+        except Exception as exc:
+            print(f"[LOGWRITER] Could not read run counters: {exc}")
+            return
+        for summary in summaries:
+            publish_run_event(summary.runid, "counters", **summary_counts(summary))
+
+    def close(self) -> None:
+        """Stop the timer and flush what is left."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        if self._timer is not None and self._timer is not threading.current_thread():
+            self._timer.join(timeout=self.max_interval + 1)
+        self.flush()
+        with self._lock:
+            unwritten, self._buffer = self._buffer, []
+        self._spool(unwritten)
+        _open_writers.discard(self)
+
+    def __enter__(self) -> "ProcessLogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+@atexit.register
+def _close_open_writers() -> None:
+    for writer in list(_open_writers):
+        writer.close()
+
+
+# ---------- active writer ----------
+
+_active_writer: ContextVar[ProcessLogWriter | None] = ContextVar("process_log_writer", default=None)
+
+
+@contextmanager
+def process_log_writer(**kwargs) -> Iterator[ProcessLogWriter]:
+    """
+    Buffer the process log rows written inside this block (e.g. one run) and
+    flush them when it exits.
+    """
+    writer = ProcessLogWriter(**kwargs)
+    token = _active_writer.set(writer)
+    try:
+        yield writer
+    finally:
+        _active_writer.reset(token)
+        writer.close()
+
+
+def write_process_log(model, row: dict) -> None:
+    """Queue on the active writer, or insert immediately when no run is buffering."""
+    writer = _active_writer.get()
+    if writer is not None:
+        writer.add(model, row)
+        return
+    with ProcessLogWriter(max_interval=0) as single:
+        single.add(model, row)
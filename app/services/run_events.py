@@ -0,0 +1,126 @@
+"""
+In-process pub/sub for live run progress.
+
+Bots publish events as they work; `GET /bot-runs/{runid}/events` streams them
+to the UI over Server-Sent Events. Event types:
+
+    result    one processed file/row (the process log row)
+    stage     a pipeline stage started for a file
+    counters  the run's summary counters after a log flush
+    status    the run's status changed (completed, failed, cancelled, ...)
+
+Publishing is thread-safe and cheap when nobody listens. Each run keeps its
+last RUN_EVENT_HISTORY events so a reconnecting client can resume from
+`Last-Event-ID`; older history and runs in other processes come from the
+DB snapshot the endpoint sends first.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+RUN_EVENT_HISTORY = int(os.getenv("RUN_EVENT_HISTORY", "200"))
+# Runs whose history is kept in memory at once (oldest dropped first)
+MAX_TRACKED_RUNS = 100
+SUBSCRIBER_QUEUE_SIZE = 1000
+TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+
+@dataclass
+class RunEvent:
+    runid: str
+    seq: int
+    type: str
+    data: dict[str, Any]
+    at: float = field(default_factory=time.time)
+
+    @property
+    def id(self) -> str:
+        return f"{self.runid}:{self.seq}"
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**self.data, "runid": self.runid, "type": self.type, "at": self.at}
+
+
+class _Subscriber:
+    """Delivers events from any thread into one asyncio queue."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue[RunEvent] = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def _put(self, event: RunEvent) -> None:
+        if self.queue.full():
+            # Slow client: drop the oldest event rather than block the bots
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def deliver(self, event: RunEvent) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop closed; the subscription is going away
+
+
+class RunEventBus:
+    def __init__(self, history: int = RUN_EVENT_HISTORY, max_runs: int = MAX_TRACKED_RUNS):
+        self.history = history
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._history: OrderedDict[str, deque[RunEvent]] = OrderedDict()
+        self._subscribers: dict[str, set[_Subscriber]] = {}
+
+    def publish(self, runid: str | None, type: str, /, **data: Any) -> RunEvent | None:
+        if not runid:
+            return None
+        with self._lock:
+            event = RunEvent(runid=runid, seq=next(self._seq), type=type, data=data)
+            events = self._history.get(runid)
+            if events is None:
+                events = self._history[runid] = deque(maxlen=self.history)
+                while len(self._history) > self.max_runs:
+                    self._history.popitem(last=False)
+            events.append(event)
+            subscribers = list(self._subscribers.get(runid, ()))
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+        return event
+
+    def recent(self, runid: str, after_seq: int = 0) -> list[RunEvent]:
+        with self._lock:
+            return [event for event in self._history.get(runid, ()) if event.seq > after_seq]
+
+    @contextmanager
+    def subscribe(self, runid: str) -> Iterator[asyncio.Queue]:
+        """Queue receiving the run's events from now on (call from the event loop)."""
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(runid, set()).add(subscriber)
+        try:
+            yield subscriber.queue
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(runid)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[runid]
+
+
+run_event_bus = RunEventBus()
+
+
+def publish_run_event(runid: str | None, type: str, /, **data: Any) -> None:
+    """Publish on the global bus; never lets a progress event break a run."""
+    try:
+        run_event_bus.publish(runid, type, **data)
+    except Exception as exc:
+        print(f"[EVENTS] Could not publish {type} for {runid}: {exc}")
@@ -0,0 +1,79 @@
+"""
+Per-run status counters (automation_run_summaries).
+
+Every process log row written through ProcessLogWriter bumps its run's
+counters in the same transaction, so status endpoints read one row per run
+instead of grouping the raw logs. Buckets:
+
+    success         status starts with "success"
+    duplicate       status starts with "duplicate"
+    failure         status starts with "failure" or "error"
+    review_blocked  the review agent stopped the voucher ("... Review reason: ...")
+
+`processed` counts every row, including statuses that fit no bucket.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+SUMMARY_COUNTERS = ("processed", "success", "duplicate", "failure", "review_blocked")
+
+
+def status_bucket(status: str | None) -> str | None:
+    text = (status or "").strip().lower()
+    if "review reason" in text:
+        return "review_blocked"
+    for bucket in ("success", "duplicate", "failure"):
+        if text.startswith(bucket):
+            return bucket
+    if text.startswith("error"):
+        return "failure"
+    return None
+
+
+def summarize_rows(rows: Iterable[dict]) -> dict[str, dict[str, int]]:
+    """Counter deltas per runid for log rows (rows without a runid are skipped)."""
+    deltas: dict[str, dict[str, int]] = {}
+    for row in rows:
+        runid = row.get("runid")
+        if not runid or "status" not in row:
+            continue
+        delta = deltas.setdefault(runid, dict.fromkeys(SUMMARY_COUNTERS, 0))
+        delta["processed"] += 1
+        bucket = status_bucket(row["status"])
+        if bucket:
+            delta[bucket] += 1
+    return deltas
+
+
+def apply_run_summary(session, rows: Iterable[dict]) -> None:
+    """Add the rows' counters to their runs' summaries (caller commits)."""
+    from app import models
+
+    table = models.RunSummary
+    for runid, delta in summarize_rows(rows).items():
+        increments = {getattr(table, name): getattr(table, name) + value for name, value in delta.items() if value}
+        increments[table.updated_at] = func.now()
+
+        def _update() -> int:
+            return session.query(table).filter(table.runid == runid).update(increments, synchronize_session=False)
+
+        if _update():
+            continue
+        try:
+            with session.begin_nested():
+                session.add(table(runid=runid, **delta))
+        except IntegrityError:
+            # Created by another writer in the meantime
+            _update()
+
+
+def empty_summary() -> dict[str, int]:
+    return dict.fromkeys(SUMMARY_COUNTERS, 0)
+
+
+def summary_counts(summary) -> dict[str, int]:
+    return {name: getattr(summary, name) or 0 for name in SUMMARY_COUNTERS}
@@ -0,0 +1,391 @@
+"""
+LLM token / cost accounting.
+
+Every LangChain call made with `usage_handler` in its callbacks (and every
+openai-agents run passed to `record_agents_run`) produces one usage record
+attributed to the current runid / filename / stage from `usage_context`.
+
+Inside `track_usage(runid)` records are buffered and written to
+automation_llm_usage in one session when the block exits; the returned
+collector's summary() is what gets rolled up into BotRun.context. Calls made
+outside a tracked run are written immediately (best effort).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# USD per 1M tokens: (input, cached input, output). Prompt tokens already
+# include image tokens and cached tokens.
+MODEL_PRICES_PER_MILLION: dict[str, tuple[float, float, float]] = {
+    "gpt-5": (1.25, 0.125, 10.00),
+    "gpt-5-mini": (0.25, 0.025, 2.00),
+    "gpt-5-nano": (0.05, 0.005, 0.40),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+SUMMARY_FIELDS = (
+    "calls",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "image_tokens",
+    "total_tokens",
+    "latency_ms",
+    "cost_usd",
+)
+
+
+def _price_for(model: str | None) -> tuple[float, float, float]:
+    if not model:
+        return (0.0, 0.0, 0.0)
+    name = model.lower()
+    # Dated snapshots (gpt-5-mini-2025-08-07) price like their base model; longest prefix wins.
+    for known in sorted(MODEL_PRICES_PER_MILLION, key=len, reverse=True):
+        if name.startswith(known):
+            return MODEL_PRICES_PER_MILLION[known]
+    return (0.0, 0.0, 0.0)
+
+
+def estimate_cost(model: str | None, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    input_price, cached_price, output_price = _price_for(model)
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    cost = uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price
+    return round(cost / 1_000_000, 6)
+
+
+@dataclass
+class UsageRecord:
+    runid: Optional[str]
+    filename: Optional[str]
+    stage: Optional[str]
+    model: Optional[str]
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    image_tokens: int = 0
+    total_tokens: int = 0
+    latency_ms: int = 0
+    cost_usd: float = 0.0
+
+
+# ---------- ATTRIBUTION ----------
+
+_usage_attribution: ContextVar[dict[str, Optional[str]]] = ContextVar("llm_usage_attribution", default={})
+
+
+@contextmanager
+def usage_context(**attribution: Optional[str]) -> Iterator[None]:
+    """
+    Attribute LLM calls made inside this block, e.g.
+    usage_context(runid=runid, filename=name) around a file and
+    usage_context(stage="po_identifier") around a stage. Nested blocks inherit
+    the outer keys; None values leave the outer value in place.
+    """
+    merged = dict(_usage_attribution.get())
+    merged.update({key: value for key, value in attribution.items() if value is not None})
+    token = _usage_attribution.set(merged)
+    try:
+        yield
+    finally:
+        _usage_attribution.reset(token)
+
+
+def current_attribution() -> dict[str, Optional[str]]:
+    return dict(_usage_attribution.get())
+
+
+# ---------- COLLECTION ----------
+
+class UsageCollector:
+    """Thread-safe buffer of usage records for one run."""
+
+    def __init__(self, runid: Optional[str] = None):
+        self.runid = runid
+        self._lock = threading.Lock()
+        self.records: list[UsageRecord] = []
+
+    def add(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self) -> list[UsageRecord]:
+        with self._lock:
+            return list(self.records)
+
+    def summary(self) -> dict[str, Any]:
+        return summarize(self.snapshot())
+
+
+def _empty_totals() -> dict[str, Any]:
+    return {key: 0 for key in SUMMARY_FIELDS}
+
+
+def _accumulate(totals: dict[str, Any], record: UsageRecord) -> None:
+    totals["calls"] += 1
+    totals["prompt_tokens"] += record.prompt_tokens
+    totals["cached_tokens"] += record.cached_tokens
+    totals["completion_tokens"] += record.completion_tokens
+    totals["image_tokens"] += record.image_tokens
+    totals["total_tokens"] += record.total_tokens
+    totals["latency_ms"] += record.latency_ms
+    totals["cost_usd"] = round(totals["cost_usd"] + record.cost_usd, 6)
+
+
+def _with_hit_rate(totals: dict[str, Any]) -> dict[str, Any]:
+    prompt_tokens = totals["prompt_tokens"]
+    totals["cache_hit_rate"] = round(totals["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    return totals
+
+
+def summarize(records: list[UsageRecord]) -> dict[str, Any]:
+    """Roll records up by stage, by file and overall (with prompt cache hit rates)."""
+    by_stage: dict[str, dict[str, Any]] = {}
+    by_file: dict[str, dict[str, Any]] = {}
+    total = _empty_totals()
+    for record in records:
+        _accumulate(by_stage.setdefault(record.stage or "unknown", _empty_totals()), record)
+        if record.filename:
+            _accumulate(by_file.setdefault(record.filename, _empty_totals()), record)
+        _accumulate(total, record)
+    for totals in (*by_stage.values(), *by_file.values(), total):
+        _with_hit_rate(totals)
+    return {"by_stage": by_stage, "by_file": by_file, "total": total}
+
+
+_active_collector: ContextVar[UsageCollector | None] = ContextVar("llm_usage_collector", default=None)
+
+
+def persist_usage(records: list[UsageRecord]) -> int:
+    """Write usage records in one session. Returns the number written (0 on failure)."""
+    if not records:
+        return 0
+    from app import database, models
+
+    session = database.SessionLocal()
+    try:
+        session.add_all(models.LLMUsage(**asdict(record)) for record in records)
+        session.commit()
+        return len(records)
+    except Exception as exc:
+        session.rollback()
+        print(f"[USAGE] Failed to persist {len(records)} usage records: {exc}")
+        return 0
+    finally:
+        session.close()
+
+
+def record_usage(record: UsageRecord) -> None:
+    collector = _active_collector.get()
+    if collector is not None:
+        collector.add(record)
+    else:
+        persist_usage([record])
+
+
+@contextmanager
+def track_usage(runid: Optional[str] = None, *, persist: bool = True) -> Iterator[UsageCollector]:
+    """
+    Buffer usage records for the calls made inside this block (one run) and
+    write them to the DB on exit.
+    """
+    collector = UsageCollector(runid)
+    collector_token = _active_collector.set(collector)
+    attribution_token = _usage_attribution.set({**_usage_attribution.get(), "runid": runid}) if runid else None
+    try:
+        yield collector
+    finally:
+        if attribution_token is not None:
+            _usage_attribution.reset(attribution_token)
+        _active_collector.reset(collector_token)
+        if persist:
+            persist_usage(collector.snapshot())
+
+
+def _make_record(
+    model: Optional[str],
+    prompt_tokens: int,
+    completion_tokens: int,
+    *,
+    cached_tokens: int = 0,
+    image_tokens: int,
+    latency_ms: int,
+    **attribution,
+) -> UsageRecord:
+    context = current_attribution()
+    context.update({key: value for key, value in attribution.items() if value is not None})
+    return UsageRecord(
+        runid=context.get("runid"),
+        filename=context.get("filename"),
+        stage=context.get("stage"),
+        model=model,
+        prompt_tokens=prompt_tokens,
+        cached_tokens=cached_tokens,
+        completion_tokens=completion_tokens,
+        image_tokens=image_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        latency_ms=latency_ms,
+        cost_usd=estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+    )
+
+
+# ---------- LANGCHAIN ----------
+
+def _message_image_tokens(messages) -> int:
+    from app.bots.agents.multimodal import estimate_b64_image_tokens
+
+    tokens = 0
+    for message in messages:
+        content = getattr(message, "content", None)
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if isinstance(block, dict) and block.get("type") == "image_url":
+                url = (block.get("image_url") or {}).get("url", "")
+                tokens += estimate_b64_image_tokens(url)
+    return tokens
+
+
+def _token_usage(response) -> tuple[int, int, int, Optional[str]]:
+    """
+    Pull (prompt, cached, completion, model) from an LLMResult
+    (usage_metadata first, then the raw llm_output token_usage).
+    """
+    prompt_tokens = cached_tokens = completion_tokens = 0
+    model = None
+    for generations in response.generations or []:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None) if message is not None else None
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0) or 0
+                completion_tokens += usage.get("output_tokens", 0) or 0
+                cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+            metadata = getattr(message, "response_metadata", None) or {}
+            model = model or metadata.get("model_name") or metadata.get("model")
+    llm_output = response.llm_output or {}
+    if not prompt_tokens and not completion_tokens:
+        token_usage = llm_output.get("token_usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens", 0) or 0
+        completion_tokens = token_usage.get("completion_tokens", 0) or 0
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+    model = model or llm_output.get("model_name")
+    return prompt_tokens, cached_tokens, completion_tokens, model
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Records tokens and latency for every chat model call it is attached to."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[UUID, dict[str, Any]] = {}
+
+    def _start(self, run_id: UUID, serialized: dict[str, Any] | None, image_tokens: int, metadata: dict[str, Any] | None) -> None:
+        kwargs = (serialized or {}).get("kwargs") or {}
+        pending = {
+            "started": time.perf_counter(),
+            "model": kwargs.get("model_name") or kwargs.get("model") or (metadata or {}).get("ls_model_name"),
+            "image_tokens": image_tokens,
+            # Attribution is captured here, in the caller's context.
+            "attribution": current_attribution(),
+        }
+        with self._lock:
+            self._pending[run_id] = pending
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        image_tokens = sum(_message_image_tokens(batch) for batch in messages)
+        self._start(run_id, serialized, image_tokens, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, serialized, 0, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        prompt_tokens, cached_tokens, completion_tokens, model = _token_usage(response)
+        record = _make_record(
+            model or pending["model"],
+            prompt_tokens,
+            completion_tokens,
+            cached_tokens=cached_tokens,
+            image_tokens=pending["image_tokens"],
+            latency_ms=int((time.perf_counter() - pending["started"]) * 1000),
+            **pending["attribution"],
+        )
+        record_usage(record)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._pending.pop(run_id, None)
+
+
+usage_handler = UsageCallbackHandler()
+
+
+# ---------- OPENAI AGENTS ----------
+
+def record_agents_run(result, *, model: Optional[str], stage: Optional[str], started: float) -> None:
+    """Record usage for an openai-agents Runner result (one record per request)."""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    if usage is None:
+        return
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    entries = list(getattr(usage, "request_usage_entries", None) or []) or [usage]
+    # Latency is only known for the whole run; spread it over the requests.
+    share = latency_ms // len(entries)
+    for entry in entries:
+        details = getattr(entry, "input_tokens_details", None)
+        record_usage(
+            _make_record(
+                model,
+                entry.input_tokens,
+                entry.output_tokens,
+                cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+                image_tokens=0,
+                latency_ms=share,
+                stage=stage,
+            )
+        )
+
+
+def usage_summary_for_run(runid: str) -> dict[str, Any]:
+    """Summarize the usage rows already written for a run (for bots that don't buffer)."""
+    from app import database, models
+
+    session = database.SessionLocal()
+    try:
+        rows = session.query(models.LLMUsage).filter(models.LLMUsage.runid == runid).all()
+        records = [
+            UsageRecord(
+                runid=row.runid,
+                filename=row.filename,
+                stage=row.stage,
+                model=row.model,
+                prompt_tokens=row.prompt_tokens or 0,
+                cached_tokens=row.cached_tokens or 0,
+                completion_tokens=row.completion_tokens or 0,
+                image_tokens=row.image_tokens or 0,
+                total_tokens=row.total_tokens or 0,
+                latency_ms=row.latency_ms or 0,
+                cost_usd=row.cost_usd or 0.0,
+            )
+            for row in rows
+        ]
+        return summarize(records)
+    except Exception as exc:
+        print(f"[USAGE] Failed to summarize usage for {runid}: {exc}")
+        return summarize([])
+    finally:
+        session.close()
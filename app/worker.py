@@ -0,0 +1,164 @@
+"""
+Standalone bot worker: claims queued runs from automation_runs and executes them.
+
+    python -m app.worker                 # poll forever
+    python -m app.worker --once          # run at most one job, then exit
+    python -m app.worker --types voucher_entry,payline
+
+Run as many workers (on as many hosts) as there are browser sessions to spare;
+the queue hands each run to exactly one of them (see app.services.job_queue).
+While a job runs a heartbeat thread extends its lease every
+JOB_HEARTBEAT_SECONDS; if the lease is lost (the run was requeued elsewhere)
+the run's cancel token is set so the bot stops at the next file.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Callable, Optional
+
+from app.services.cancellation import cancellation_registry
+from app.services.job_queue import ClaimedJob, JobQueue, job_queue
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+
+
+# Bots are imported per job so the worker starts without loading Playwright/agents
+def _voucher_entry(job: ClaimedJob) -> Any:
+    from app.bots.voucher_entry import run_vendor_entry
+
+    return run_vendor_entry(**job.args, test_mode=job.test_mode, runid=job.runid)
+
+
+def _voucher_v2(job: ClaimedJob) -> Any:
+    from app.bots.voucher.pipeline import run_v2_voucher_dir
+
+    return run_v2_voucher_dir(job.args["directory"], page=None, test_mode=job.test_mode, runid=job.runid)
+
+
+def _direct_deposit(job: ClaimedJob) -> Any:
+    from app.bots.direct_deposit_entry import run_direct_deposit_entry
+
+    return run_direct_deposit_entry(**job.args, test_mode=job.test_mode, runid=job.runid)
+
+
+def _payline(job: ClaimedJob) -> Any:
+    from app.bots.payline_entry import run_payline_entry
+
+    return run_payline_entry(**job.args, test_mode=job.test_mode, runid=job.runid)
+
+
+JOB_HANDLERS: dict[str, Callable[[ClaimedJob], Any]] = {
+    "voucher_entry": _voucher_entry,
+    "voucher_v2": _voucher_v2,
+    "direct_deposit": _direct_deposit,
+    "payline": _payline,
+}
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Worker:
+    def __init__(
+        self,
+        *,
+        queue: JobQueue = job_queue,
+        worker_id: Optional[str] = None,
+        handlers: Optional[dict[str, Callable[[ClaimedJob], Any]]] = None,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+    ):
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.handlers = handlers if handlers is not None else JOB_HANDLERS
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _heartbeat(self, runid: str, done: threading.Event) -> None:
+        while not done.wait(self.heartbeat_seconds):
+            try:
+                if not self.queue.heartbeat(runid, self.worker_id):
+                    print(f"[WORKER] Lost the lease on {runid}; cancelling it here")
+                    cancellation_registry.cancel(runid)
+                    return
+            except Exception as exc:
+                print(f"[WORKER] Heartbeat for {runid} failed: {exc}")
+
+    def run_job(self, job: ClaimedJob) -> None:
+        handler = self.handlers.get(job.job_type)
+        if handler is None:
+            self.queue.finish(job.runid, self.worker_id, error=f"Unknown job type '{job.job_type}'")
+            return
+        print(f"[WORKER] {self.worker_id} running {job.job_type} {job.runid} (attempt {job.attempts})")
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job.runid, done), name="job-heartbeat", daemon=True)
+        beat.start()
+        error = None
+        try:
+            handler(job)
+        except Exception as exc:
+            print(f"[WORKER] Job {job.runid} failed: {exc}")
+            error = str(exc)
+        finally:
+            done.set()
+            beat.join()
+        self.queue.finish(job.runid, self.worker_id, error=error)
+
+    def run_once(self) -> bool:
+        """Requeue expired leases, then claim and run one job. Returns whether a job ran."""
+        self.queue.requeue_expired()
+        job = self.queue.claim(self.worker_id, job_types=list(self.handlers))
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def run_forever(self) -> None:
+        print(f"[WORKER] {self.worker_id} polling for {', '.join(self.handlers)} jobs")
+        while not self._stop.is_set():
+            try:
+                ran = self.run_once()
+            except Exception as exc:
+                print(f"[WORKER] Poll failed: {exc}")
+                ran = False
+            if not ran:
+                self._stop.wait(self.poll_seconds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="Run at most one job, then exit")
+    parser.add_argument("--types", help="Comma-separated job types to take (default: all)")
+    parser.add_argument("--poll-seconds", type=float, default=JOB_POLL_SECONDS)
+    args = parser.parse_args()
+
+    handlers = JOB_HANDLERS
+    if args.types:
+        wanted = {name.strip() for name in args.types.split(",") if name.strip()}
+        unknown = wanted - set(JOB_HANDLERS)
+        if unknown:
+            parser.error(f"Unknown job types: {', '.join(sorted(unknown))}")
+        handlers = {name: JOB_HANDLERS[name] for name in wanted}
+
+    worker = Worker(handlers=handlers, poll_seconds=args.poll_seconds)
+    if args.once:
+        worker.run_once()
+        return
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        print("[WORKER] Stopping")
+
+
+if __name__ == "__main__":
+    main()
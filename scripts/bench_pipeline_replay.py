@@ -0,0 +1,100 @@
+"""
+Benchmark pipeline orchestration offline by replaying recorded LLM responses.
+
+Record once against the live model (needs OPENAI_API_KEY, PS_DB_URL):
+
+    LLM_BACKEND=record python scripts/bench_pipeline_replay.py v2 path/to/corpus
+
+Then replay as often as needed, optionally with simulated model latency:
+
+    LLM_BACKEND=replay LLM_REPLAY_LATENCY_MS=800 \
+        python scripts/bench_pipeline_replay.py v2 path/to/corpus --repeat 3
+
+`v2` runs run_v2_voucher_dir on the corpus; `vendor` runs run_vendor_entry
+with the corpus as the vendor directory. --no-browser swaps the PeopleSoft
+Playwright step for a no-op so only extraction, PO lookup, mapping, review
+and logging are timed. Files are copied to a scratch directory per repeat so
+the corpus is never moved into Processed/Duplicates. The copy keeps the
+corpus folder's name (e.g. .../CDW), because the pipeline picks vendor
+prompts and the PO prefetch by folder name.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _scratch_copy(corpus: Path) -> Path:
+    """Copy of the corpus PDFs in <temp dir>/<corpus folder name>."""
+    scratch = Path(tempfile.mkdtemp(prefix="bench_corpus_")) / corpus.name
+    scratch.mkdir()
+    for path in corpus.glob("*.pdf"):
+        shutil.copy2(path, scratch / path.name)
+    return scratch
+
+
+def _run_v2(corpus: Path, no_browser: bool) -> int:
+    from app.bots.voucher import pipeline
+
+    if no_browser:
+        pipeline.execute_voucher_entry = lambda plan, **kwargs: {
+            "voucher_id": "Benchmark",
+            "duplicate": False,
+            "out_of_balance": False,
+            "alert": "",
+        }
+    results = pipeline.run_v2_voucher_dir(corpus, page=None, test_mode=True)
+    return len(results)
+
+
+def _run_vendor(corpus: Path, no_browser: bool) -> int:
+    from app.bots import voucher_entry
+    from app.schemas import VoucherEntryResult
+
+    voucher_entry.get_vendor_directory = lambda vendor_key, test_mode: corpus
+    if no_browser:
+        voucher_entry.voucher_playwright_bot = lambda invoice_data, **kwargs: VoucherEntryResult(
+            voucher_id="Benchmark",
+            duplicate=False,
+            out_of_balance=False,
+        )
+    runlog = voucher_entry.run_vendor_entry("benchmark", test_mode=True)
+    return getattr(runlog, "processed", 0) if runlog else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pipeline", choices=("v2", "vendor"))
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-browser", action="store_true")
+    args = parser.parse_args()
+
+    from app.services.llm_backend import backend_mode, cassette_dir, replay_latency
+
+    corpus = args.corpus.expanduser().resolve()
+    files = len(list(corpus.glob("*.pdf")))
+    print(
+        f"backend={backend_mode()} cassettes={cassette_dir()} "
+        f"replay_latency={replay_latency() * 1000:.0f}ms files={files}"
+    )
+    runner = _run_v2 if args.pipeline == "v2" else _run_vendor
+    for attempt in range(1, args.repeat + 1):
+        scratch = _scratch_copy(corpus)
+        try:
+            start = time.perf_counter()
+            processed = runner(scratch, args.no_browser)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(scratch.parent, ignore_errors=True)
+        per_file = elapsed / files if files else 0.0
+        print(f"[{attempt}/{args.repeat}] {args.pipeline}: {processed} processed in {elapsed:.2f}s ({per_file:.3f}s/file)")
+
+
+if __name__ == "__main__":
+    main()
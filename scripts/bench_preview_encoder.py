@@ -0,0 +1,79 @@
+"""
+Micro-benchmark: size-targeted preview encoder vs the old iterative shrink loop.
+
+    python scripts/bench_preview_encoder.py [--max-chars 200000] [--repeat 3]
+
+Uses a synthetic noisy "scan" (noise is the worst case for JPEG) at common
+page render sizes and reports encodes per call and wall time for each.
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+from app.bots.utils.ocr import encode_preview_b64
+
+
+def legacy_preview_b64(img, *, max_chars: int, stats: dict) -> str:
+    """The loop safe_preview_b64/_pil_preview_b64 used before: full encode + base64 per 0.8x step."""
+    working = img.convert("RGB")
+    quality = 60
+    width, height = working.size
+    while True:
+        buf = io.BytesIO()
+        working.save(buf, format="JPEG", quality=quality, optimize=True)
+        stats["encodes"] = stats.get("encodes", 0) + 1
+        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+        if len(b64) <= max_chars:
+            return b64
+        new_w = max(int(width * 0.8), 400)
+        new_h = max(int(height * 0.8), 400)
+        if (new_w, new_h) == (width, height) and quality <= 45:
+            return ""
+        working = working.resize((new_w, new_h), Image.LANCZOS)
+        width, height = new_w, new_h
+        if quality > 45:
+            quality -= 5
+
+
+def synthetic_scan(width: int, height: int) -> Image.Image:
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    page = Image.new("RGB", (width, height), "white")
+    return Image.blend(page, noise, 0.5)
+
+
+def run(encoder, img, max_chars: int, repeat: int) -> tuple[float, float, int]:
+    total_encodes = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        stats: dict = {}
+        b64 = encoder(img, max_chars=max_chars, stats=stats)
+        total_encodes += stats.get("encodes", 0)
+    elapsed = (time.perf_counter() - start) / repeat
+    return elapsed, total_encodes / repeat, len(b64)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-chars", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sizes = {"letter@140dpi": (1190, 1540), "letter@200dpi": (1700, 2200), "letter@300dpi": (2550, 3300)}
+    print(f"max_chars={args.max_chars}, repeat={args.repeat}")
+    print(f"{'image':<16}{'encoder':<10}{'encodes':>9}{'ms':>10}{'b64 chars':>12}")
+    for label, (w, h) in sizes.items():
+        img = synthetic_scan(w, h)
+        for name, encoder in (("legacy", legacy_preview_b64), ("targeted", encode_preview_b64)):
+            elapsed, encodes, chars = run(encoder, img, args.max_chars, args.repeat)
+            print(f"{label:<16}{name:<10}{encodes:>9.1f}{elapsed * 1000:>10.1f}{chars:>12}")
+
+
+if __name__ == "__main__":
+    main()
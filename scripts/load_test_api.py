@@ -0,0 +1,83 @@
+"""
+Load test the read endpoints the UI polls.
+
+Start the API first (e.g. `uvicorn app.main:app --workers 1`), then:
+
+    python scripts/load_test_api.py http://localhost:8000 --concurrency 50 --requests 2000
+
+Each path is hit `--requests` times by `--concurrency` concurrent clients;
+requests/second, p50/p95/max latency and errors are printed per path. Run it
+against two builds (e.g. before/after a change) with the same data to
+compare them.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PATHS = (
+    "/runids?limit=50",
+    "/bot-runs",
+    "/process-logs?limit=100",
+)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _hammer(client: httpx.AsyncClient, path: str, total: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def _worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        "errors": errors,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per path")
+    parser.add_argument("--path", action="append", dest="paths", help="path to test (repeatable)")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        for path in args.paths or DEFAULT_PATHS:
+            stats = await _hammer(client, path, args.requests, args.concurrency)
+            print(
+                f"{path:<30} {stats['rps']:8.1f} req/s  p50 {stats['p50_ms']:7.1f} ms  "
+                f"p95 {stats['p95_ms']:7.1f} ms  max {stats['max_ms']:7.1f} ms  errors {stats['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
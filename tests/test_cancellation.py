@@ -0,0 +1,62 @@
+import time
+
+from app.services import cancellation
+
+
+class _Registry(cancellation.CancellationRegistry):
+    """Registry whose DB read is replaced by a set of cancelled runids."""
+
+    def __init__(self, poll_seconds):
+        super().__init__(poll_seconds=poll_seconds)
+        self.flags: set[str] = set()
+        self.queries = 0
+
+    def sync(self, runids=None):
+        with self._lock:
+            pending = [r for r in (runids or list(self._tokens)) if r in self._tokens]
+        self.queries += 1
+        hits = self.flags & set(pending)
+        for runid in hits:
+            self.cancel(runid)
+        return hits
+
+
+def test_checks_are_in_memory():
+    registry = _Registry(poll_seconds=0)
+    token = registry.register("run-1")
+    queries = registry.queries
+    for _ in range(100):
+        assert not token.cancelled
+    assert registry.queries == queries
+
+
+def test_push_cancels_immediately():
+    registry = _Registry(poll_seconds=0)
+    token = registry.register("run-1")
+    assert registry.cancel("run-1")
+    assert token.cancelled
+    assert not registry.cancel("other-run")
+
+
+def test_poller_picks_up_db_flag_within_interval():
+    registry = _Registry(poll_seconds=0.05)
+    token = registry.register("run-1")
+    registry.register("run-2")
+    registry.flags.add("run-1")
+    assert token.wait(timeout=2)
+    assert not registry.get("run-2").cancelled
+    registry.unregister("run-1")
+    registry.unregister("run-2")
+    time.sleep(0.2)
+    assert registry._poller is None
+
+
+def test_tokens_are_refcounted():
+    registry = _Registry(poll_seconds=0)
+    first = registry.register("run-1")
+    second = registry.register("run-1")
+    assert first is second
+    registry.unregister("run-1")
+    assert registry.get("run-1") is first
+    registry.unregister("run-1")
+    assert registry.get("run-1") is None
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Cold `import app.main` must stay well under this (it was ~2s with the bots loaded eagerly)
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+# Only loaded when a bot actually runs
+HEAVY_MODULES = ("playwright", "langchain", "langchain_core", "langfuse", "fitz", "pytesseract", "openai", "PIL")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main, app.worker
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _cold_import() -> dict:
+    env = {key: value for key, value in os.environ.items() if key not in {"DATABASE_URL", "PS_DB_URL"}}
+    root = Path(__file__).resolve().parents[1]
+    # Best of three so a busy CI box doesn't fail the budget
+    runs = []
+    for _ in range(3):
+        out = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", _PROBE], cwd=root, env=env, capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def test_api_starts_without_bots_or_database():
+    result = _cold_import()
+    assert result["loaded"] == []
+    assert result["seconds"] < IMPORT_BUDGET_SECONDS, f"import app.main took {result['seconds']:.2f}s"
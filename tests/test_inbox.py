@@ -0,0 +1,118 @@
+import os
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models
+from app.services import inbox
+from app.services.inbox import InboxManifest, InboxWatcher
+
+
+@pytest.fixture
+def manifest(monkeypatch, tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'inbox.db'}")
+    models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    return InboxManifest()
+
+
+def _names(entries):
+    return [entry.path.name for entry in entries]
+
+
+def test_scan_returns_only_new_or_changed_files(manifest, tmp_path, monkeypatch):
+    folder = tmp_path / "Royal"
+    folder.mkdir()
+    (folder / "a.pdf").write_bytes(b"invoice a")
+    (folder / "b.pdf").write_bytes(b"invoice b")
+
+    first = manifest.scan(folder, environment="fscm_test")
+    assert _names(first) == ["a.pdf", "b.pdf"]
+    manifest.record(first[0], "success", voucher_id="00012345", runid="run-1")
+    manifest.record(first[1], "failure", voucher_id="Extraction Failed", runid="run-1")
+
+    hashed = []
+    real_sha256 = inbox.file_sha256
+
+    def _counting_sha256(path):
+        hashed.append(path.name)
+        return real_sha256(path)
+
+    monkeypatch.setattr(inbox, "file_sha256", _counting_sha256)
+    # Unchanged files are neither re-hashed nor returned; failures only on request
+    assert manifest.scan(folder, environment="fscm_test") == []
+    assert hashed == []
+    assert _names(manifest.scan(folder, environment="fscm_test", retry_failed=True)) == ["b.pdf"]
+
+    (folder / "b.pdf").write_bytes(b"invoice b, rescanned")
+    os.utime(folder / "b.pdf", (1, 1))
+    assert _names(manifest.scan(folder, environment="fscm_test")) == ["b.pdf"]
+    assert hashed == ["b.pdf"]
+
+
+
+def test_retryable_outcomes_are_rescanned_until_max_attempts(manifest, tmp_path, monkeypatch):
+    monkeypatch.setattr(inbox, "INBOX_MAX_ATTEMPTS", 2)
+    folder = tmp_path / "CDW"
+    folder.mkdir()
+    (folder / "a.pdf").write_bytes(b"invoice a")
+
+    [entry] = manifest.scan(folder, environment="fscm_test")
+    manifest.record(entry, "failure", voucher_id="Skipped - Entry in progress", retryable=True)
+    [entry] = manifest.scan(folder, environment="fscm_test")
+    manifest.record(entry, "failure", voucher_id="Error: ledger unavailable", retryable=True)
+    assert manifest.scan(folder, environment="fscm_test") == []
+
+def test_content_already_entered_elsewhere_is_skipped(manifest, tmp_path):
+    first, second = tmp_path / "CDW", tmp_path / "Attach"
+    first.mkdir()
+    second.mkdir()
+    (first / "inv.pdf").write_bytes(b"same invoice")
+    [entry] = manifest.scan(first, environment="fscm_prod")
+    manifest.record(entry, "success", voucher_id="00099999")
+
+    (second / "copy of inv.pdf").write_bytes(b"same invoice")
+    (second / "other.pdf").write_bytes(b"another invoice")
+    assert _names(manifest.scan(second, environment="fscm_prod")) == ["other.pdf"]
+
+    with database.SessionLocal() as db:
+        copy = db.query(models.InboxFile).filter(models.InboxFile.filename == "copy of inv.pdf").one()
+    assert copy.last_outcome == "already_entered" and copy.voucher_id == "00099999"
+
+
+def test_test_mode_vouchers_do_not_skip_prod_entry(manifest, tmp_path):
+    test_folder, prod_folder = tmp_path / "InvoiceProcessing" / "CDW", tmp_path / "Accounts Payable" / "CDW"
+    test_folder.mkdir(parents=True)
+    prod_folder.mkdir(parents=True)
+    (test_folder / "inv.pdf").write_bytes(b"same invoice")
+    [entry] = manifest.scan(test_folder, environment="fscm_test")
+    manifest.record(entry, "success", voucher_id="00000042")
+
+    (prod_folder / "inv.pdf").write_bytes(b"same invoice")
+    [prod_entry] = manifest.scan(prod_folder, environment="fscm_prod")
+    assert prod_entry.previous_outcome == "new" and prod_entry.environment == "fscm_prod"
+
+
+def test_watcher_dispatches_changed_folders_after_they_settle(tmp_path):
+    folder = tmp_path / "Grainger"
+    folder.mkdir()
+    ready = []
+    watcher = InboxWatcher({"grainger": folder}, ready.append, poll_seconds=0, settle_seconds=0)
+
+    # Every folder is checked once at start
+    watcher.poll()
+    assert watcher.dispatch_ready() == ["grainger"]
+    watcher.poll()
+    assert watcher.dispatch_ready() == []
+
+    (folder / "new.pdf").write_bytes(b"x")
+    (folder / "notes.txt").write_bytes(b"ignored")
+    watcher.poll()
+    assert watcher.dispatch_ready() == ["grainger"]
+    assert ready == ["grainger", "grainger"]
+
+    watcher.settle_seconds = 60
+    (folder / "second.pdf").write_bytes(b"y")
+    watcher.poll()
+    assert watcher.dispatch_ready() == []
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import invoice_extraction
+from app.services.invoice_extraction import ExtractionCache
+
+
+@pytest.fixture
+def fake_extract(monkeypatch, tmp_path):
+    calls = []
+    active = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def _extract(path, extra_instructions):
+        with lock:
+            calls.append(path.read_bytes())
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        if path.read_bytes() == b"broken":
+            raise RuntimeError("model refused")
+        return {"invoice_number": path.read_bytes().decode(), "extra": extra_instructions}
+
+    monkeypatch.setattr(invoice_extraction, "_extract_sync", _extract)
+    monkeypatch.setattr(invoice_extraction, "_llm_slot", nullcontext)
+    monkeypatch.setattr(invoice_extraction, "extraction_cache", ExtractionCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(invoice_extraction, "_pool", ThreadPoolExecutor(max_workers=2))
+    return calls, active
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_batch_streams_results_and_caches_by_content(fake_extract, tmp_path):
+    calls, active = fake_extract
+    for name, body in {"a.pdf": b"INV-1", "copy.pdf": b"INV-1", "b.pdf": b"INV-2", "c.pdf": b"INV-3", "bad.pdf": b"broken"}.items():
+        (tmp_path / name).write_bytes(body)
+    names = [str(tmp_path / n) for n in ("a.pdf", "copy.pdf", "b.pdf", "c.pdf", "bad.pdf", "missing.pdf")]
+
+    with TestClient(app) as client:
+        first = _lines(client.post("/extract_invoice/batch", json={"filenames": names}))
+        second = _lines(client.post("/extract_invoice/batch", json={"filenames": names[:4]}))
+
+    by_name = {row["filename"]: row for row in first}
+    assert by_name[names[5]]["status"] == "not_found"
+    assert by_name[names[4]]["status"] == "failed" and by_name[names[4]]["error"] == "model refused"
+    assert by_name[names[0]]["data"] == by_name[names[1]]["data"] == {"invoice_number": "INV-1", "extra": None}
+    # Identical files are extracted once, and never more than the pool size at a time
+    assert sorted(calls) == [b"INV-1", b"INV-2", b"INV-3", b"broken"]
+    assert active["max"] <= 2
+    assert [row["status"] for row in second] == ["cached"] * 4
+
+
+def test_upload_batch_and_single_endpoint(fake_extract, tmp_path):
+    calls, _ = fake_extract
+    (tmp_path / "one.pdf").write_bytes(b"INV-9")
+
+    with TestClient(app) as client:
+        uploaded = _lines(
+            client.post(
+                "/extract_invoice/batch/upload",
+                files=[("files", ("x.pdf", b"INV-9", "application/pdf")), ("files", ("y.pdf", b"INV-8", "application/pdf"))],
+            )
+        )
+        single = client.post("/extract_invoice", json={"filename": str(tmp_path / "one.pdf")})
+        missing = client.post("/extract_invoice", json={"filename": str(tmp_path / "nope.pdf")})
+
+    assert {row["filename"]: row["status"] for row in uploaded} == {"x.pdf": "extracted", "y.pdf": "extracted"}
+    assert single.json() == {"invoice_number": "INV-9", "extra": None}
+    assert missing.status_code == 404
+    assert len(calls) == 2
+
+
+def test_cache_memory_is_bounded_and_backed_by_disk(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_entries=2)
+    for n in range(3):
+        cache.set(f"k{n}", {"n": n})
+    cache.get("k1")
+    cache.set("k3", {"n": 3})
+
+    assert list(cache._memory) == ["k1", "k3"]
+    # Evicted entries are still answered from EXTRACT_CACHE_DIR
+    assert cache.get("k0") == {"n": 0}
+    assert ExtractionCache(None, max_entries=1).get("k0") is None
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models
+from app.services.invoice_ledger import InvoiceLedger, ledger_key
+
+
+@pytest.fixture
+def ledger(monkeypatch, tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'ledger.db'}")
+    models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    return InvoiceLedger(claim_ttl=600)
+
+
+def test_keys_are_normalized_per_environment():
+    key = ledger_key(" Royal Industrial ", "inv 001", 120.5, test_mode=False)
+    assert key == ledger_key("ROYAL-INDUSTRIAL", "INV001", "120.50", test_mode=False)
+    assert key.amount_cents == 12050
+    assert key != ledger_key("Royal Industrial", "INV001", 120.5, test_mode=True)
+    assert ledger_key("royal", "  ", 1.0, test_mode=False) is None
+
+
+def test_one_run_wins_and_entered_invoices_are_skipped(ledger):
+    key = ledger_key("royal", "INV-1", 120.5, test_mode=False)
+    other = ledger_key("royal", "INV-1", 99.0, test_mode=False)
+
+    first = ledger.claim(key, runid="run-a", filename="a.pdf")
+    racing = ledger.claim(key, runid="run-b", filename="copy of a.pdf")
+    assert first.acquired and not racing.acquired
+    assert racing.holder == "run-a" and racing.voucher_id is None
+    assert ledger.entered([key, other]) == {}
+
+    ledger.settle(first, "00012345")
+    assert ledger.entered([key, other]) == {key: "00012345"}
+    later = ledger.claim(key, runid="run-c")
+    assert not later.acquired and later.voucher_id == "00012345"
+
+
+def test_failed_entry_releases_and_stale_claims_are_taken_over(ledger):
+    key = ledger_key("cdw", "A-7", 10, test_mode=False)
+
+    claim = ledger.claim(key, runid="run-a")
+    ledger.settle(claim, "Invalid PO")
+    assert ledger.claim(key, runid="run-b").acquired
+
+    # run-b died mid-entry
+    with database.SessionLocal() as db:
+        row = db.query(models.EnteredInvoice).one()
+        row.claimed_at = datetime.now(timezone.utc) - timedelta(hours=2)
+        db.commit()
+    assert not ledger.claim(key, runid="run-c").acquired  # nothing to check PeopleSoft with
+    takeover = ledger.claim(key, runid="run-c", verify=lambda: None)
+    assert takeover.acquired
+    ledger.settle(ledger.claim(key, runid="run-b"), "00000001")
+    with database.SessionLocal() as db:
+        row = db.query(models.EnteredInvoice).one()
+    assert (row.runid, row.status) == ("run-c", "claimed")
+
+
+def test_requeued_run_checks_peoplesoft_before_resuming_its_claim(ledger):
+    key = ledger_key("0000012345", "INV-9", 50, test_mode=False)
+    assert ledger.claim(key, runid="run-a").acquired
+    # The worker died; the requeued run keeps its runid
+
+    def _unreachable():
+        raise ConnectionError("PeopleSoft down")
+
+    blocked = ledger.claim(key, runid="run-a", verify=_unreachable)
+    assert not blocked.acquired and blocked.voucher_id is None
+
+    saved = ledger.claim(key, runid="run-a", verify=lambda: "00100009")
+    assert not saved.acquired and saved.voucher_id == "00100009"
+    assert ledger.entered([key]) == {key: "00100009"}
+
+    other = ledger_key("0000012345", "INV-10", 50, test_mode=False)
+    ledger.claim(other, runid="run-a")
+    assert ledger.claim(other, runid="run-a", verify=lambda: None).acquired
+
+
+def test_lookup_fails_open_but_claims_fail_loudly(monkeypatch, tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    ledger = InvoiceLedger()
+    key = ledger_key("0000012345", "INV-1", 1, test_mode=False)
+
+    assert ledger.entered([key, None]) == {}
+    with pytest.raises(RuntimeError, match="Invoice ledger unavailable"):
+        ledger.claim(key, runid="run-a")
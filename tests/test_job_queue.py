@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models
+from app.services.job_queue import JobQueue
+from app.services.job_scheduler import JobLimits
+from app.worker import Worker
+
+
+@pytest.fixture
+def session_factory(monkeypatch, tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'queue.db'}")
+    models.Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(database, "SessionLocal", factory)
+    return factory
+
+
+def _run(factory, runid):
+    with factory() as db:
+        return db.query(models.BotRun).filter(models.BotRun.runid == runid).one()
+
+
+def test_claim_hands_each_job_to_one_worker(session_factory):
+    queue = JobQueue(lease_seconds=60)
+    runid = queue.enqueue("voucher_entry", {"vendor_key": "acme"}, identifier="acme", test_mode=True, bot_name="voucher_entry")
+
+    job = queue.claim("worker-a")
+    assert job.runid == runid
+    assert job.args == {"vendor_key": "acme"}
+    assert job.test_mode is True and job.attempts == 1
+    assert queue.claim("worker-b") is None
+
+    run = _run(session_factory, runid)
+    assert run.status == "running" and run.lease_owner == "worker-a"
+    assert queue.heartbeat(runid, "worker-a") is True
+    assert queue.heartbeat(runid, "worker-b") is False
+
+    queue.finish(runid, "worker-a")
+    run = _run(session_factory, runid)
+    assert run.status == "completed" and run.lease_owner is None
+
+
+def test_claim_filters_job_types_and_skips_cancelled(session_factory):
+    queue = JobQueue()
+    cancelled = queue.enqueue("payline", {}, identifier="payline", test_mode=True, bot_name="payline_entry")
+    with session_factory() as db:
+        db.query(models.BotRun).filter(models.BotRun.runid == cancelled).update({"cancel_requested": True})
+        db.commit()
+    wanted = queue.enqueue("voucher_v2", {"directory": "/tmp/x"}, identifier="dir", test_mode=False, bot_name="voucher_v2_pipeline")
+
+    assert queue.claim("w", job_types=["payline"]) is None
+    assert queue.claim("w", job_types=["voucher_v2"]).runid == wanted
+
+
+def test_expired_leases_are_requeued_then_failed(session_factory):
+    queue = JobQueue(max_attempts=2)
+    runid = queue.enqueue("payline", {}, identifier="payline", test_mode=True, bot_name="payline_entry")
+
+    def _expire():
+        with session_factory() as db:
+            db.query(models.BotRun).filter(models.BotRun.runid == runid).update(
+                {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+            )
+            db.commit()
+
+    queue.claim("dead-worker")
+    _expire()
+    assert queue.requeue_expired() == (1, 0)
+    assert _run(session_factory, runid).status == "queued"
+    assert queue.heartbeat(runid, "dead-worker") is False
+
+    assert queue.claim("second-worker").attempts == 2
+    _expire()
+    assert queue.requeue_expired() == (0, 1)
+    assert _run(session_factory, runid).status == "failed"
+    assert queue.claim("third-worker") is None
+
+
+
+def test_expired_leases_are_released_whatever_the_status(session_factory):
+    queue = JobQueue(limits=JobLimits(sessions={"hcm_test": 1}, llm_jobs=5))
+    done = queue.enqueue("payline", {}, identifier="done", test_mode=True, bot_name="payline_entry")
+    cancelling = queue.enqueue("payline", {}, identifier="cancel", test_mode=True, bot_name="payline_entry")
+    waiting = queue.enqueue("payline", {}, identifier="wait", test_mode=True, bot_name="payline_entry")
+
+    queue.claim("dead-worker")
+    with session_factory() as db:
+        # The bot saved its own status, then the worker died before finish()
+        db.query(models.BotRun).filter(models.BotRun.runid == done).update(
+            {"status": "completed", "lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.commit()
+    assert queue.claim("w") is None  # the dead worker's lease still fills the session
+    assert queue.requeue_expired() == (0, 0)
+    assert _run(session_factory, done).status == "completed"
+
+    assert queue.claim("w").runid == cancelling
+    with session_factory() as db:
+        db.query(models.BotRun).filter(models.BotRun.runid == cancelling).update(
+            {
+                "status": "cancel_requested",
+                "cancel_requested": True,
+                "lease_expires_at": datetime.utcnow() - timedelta(seconds=1),
+            }
+        )
+        db.commit()
+    assert queue.requeue_expired() == (0, 0)
+    assert _run(session_factory, cancelling).status == "cancelled"
+    assert _run(session_factory, cancelling).lease_owner is None
+    assert queue.claim("w").runid == waiting
+
+def test_worker_runs_handler_and_records_failures(session_factory):
+    queue = JobQueue()
+    calls = []
+
+    def _ok(job):
+        calls.append((job.runid, job.args))
+
+    def _boom(job):
+        raise RuntimeError("vendor directory missing")
+
+    worker = Worker(queue=queue, worker_id="w1", handlers={"ok": _ok, "boom": _boom}, heartbeat_seconds=0.01)
+    good = queue.enqueue("ok", {"n": 1}, identifier="good", test_mode=True, bot_name="test")
+    bad = queue.enqueue("boom", {}, identifier="bad", test_mode=True, bot_name="test")
+
+    assert worker.run_once() is True
+    assert worker.run_once() is True
+    assert worker.run_once() is False
+
+    assert calls == [(good, {"n": 1})]
+    assert _run(session_factory, good).status == "completed"
+    failed = _run(session_factory, bad)
+    assert failed.status == "failed" and failed.message == "vendor directory missing"
+
+
+def test_claim_respects_session_limits_and_priority(session_factory):
+    queue = JobQueue(limits=JobLimits(sessions={"fscm_prod": 1, "hcm_prod": 1}, llm_jobs=5))
+    first = queue.enqueue("voucher_entry", {}, identifier="a", test_mode=False, bot_name="voucher_entry")
+    second = queue.enqueue("voucher_v2", {}, identifier="b", test_mode=False, bot_name="voucher_v2_pipeline")
+    payline = queue.enqueue("payline", {}, identifier="p", test_mode=False, bot_name="payline_entry")
+    urgent = queue.enqueue("voucher_entry", {}, identifier="c", test_mode=False, bot_name="voucher_entry", priority=10)
+
+    assert queue.claim("w1").runid == urgent
+    # FSCM prod is full, so the HCM run goes next even though it is newer
+    assert queue.claim("w2").runid == payline
+    assert queue.claim("w3") is None
+
+    queue.finish(urgent, "w1")
+    assert queue.claim("w3").runid == first
+
+    with session_factory() as db:
+        stats = queue.stats(db)
+    assert stats["queued"]["voucher_v2"]["depth"] == 1
+    assert stats["sessions"]["fscm_prod"] == {"active": 1, "limit": 1}
+    assert stats["recent_waits"]["claimed"] == 3
+    assert queue.claim("w4") is None
+    queue.finish(first, "w3")
+    assert queue.claim("w4").runid == second
+
+
+
+def test_api_extractions_share_the_llm_limit(session_factory):
+    queue = JobQueue(limits=JobLimits(sessions={}, llm_jobs=2))
+    runid = queue.enqueue("voucher_v2", {}, identifier="a", test_mode=True, bot_name="voucher_v2_pipeline")
+    queue.enqueue("direct_deposit", {}, identifier="b", test_mode=False, bot_name="direct_deposit")
+    assert queue.claim("w1").runid == runid
+
+    with queue.llm_slot("api_extract", "api:host:1", wait_seconds=0):
+        # The running job and the extraction fill the limit
+        assert queue.claim("w2") is None
+        with pytest.raises(TimeoutError):
+            with queue.llm_slot("api_extract", "api:host:1", wait_seconds=0):
+                pass
+        with session_factory() as db:
+            assert queue.stats(db)["llm_jobs"] == {"active": 2, "limit": 2, "api_extractions": 1}
+    assert queue.claim("w2") is not None
+
+    # A slot left by a dead API process stops counting once its lease ran out
+    queue.finish(runid, "w1")
+    slot_id = queue.acquire_llm_slot("api_extract", "api:host:2")
+    with session_factory() as db:
+        db.query(models.LlmSlot).filter(models.LlmSlot.id == slot_id).update(
+            {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.commit()
+    assert queue.acquire_llm_slot("api_extract", "api:host:3") is not None
+    queue.requeue_expired()
+    with session_factory() as db:
+        assert db.query(models.LlmSlot).count() == 1
+
+def test_llm_limit_spans_environments():
+    limits = JobLimits(sessions={}, llm_jobs=2)
+    active = [("voucher_entry", True), ("direct_deposit", False)]
+    assert ("voucher_v2", False) in limits.blocked(active)
+    assert ("payline", False) not in limits.blocked(active)
+    assert limits.exceeded(active + [("voucher_v2", True)])
@@ -0,0 +1,96 @@
+import asyncio
+import shutil
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.bots.voucher.models import ValidatedPO
+from app.services import llm_backend
+
+PO = ValidatedPO(po_id="0000227878", vendor_id="V001", vendor_name="GRAINGER", confidence=0.9)
+
+
+@pytest.fixture
+def cassettes(monkeypatch, tmp_path):
+    monkeypatch.setenv("LLM_CASSETTE_DIR", str(tmp_path / "cassettes"))
+    return tmp_path
+
+
+def _messages(text="INVOICE 9715824737"):
+    return [SystemMessage(content="Identify the PO."), HumanMessage(content=[{"type": "text", "text": text}])]
+
+
+def test_record_then_replay_without_calling_model(monkeypatch, cassettes):
+    calls = []
+
+    def live():
+        calls.append(1)
+        return PO
+
+    monkeypatch.setenv("LLM_BACKEND", "record")
+    assert llm_backend.structured_call("po_identifier", _messages(), live, schema=ValidatedPO) == PO
+
+    monkeypatch.setenv("LLM_BACKEND", "replay")
+    replayed = llm_backend.structured_call("po_identifier", _messages(), live, schema=ValidatedPO)
+    assert replayed == PO
+    assert len(calls) == 1
+
+
+def test_replay_miss_raises(monkeypatch, cassettes):
+    monkeypatch.setenv("LLM_BACKEND", "record")
+    llm_backend.structured_call("po_identifier", _messages(), lambda: PO, schema=ValidatedPO)
+
+    monkeypatch.setenv("LLM_BACKEND", "replay")
+    with pytest.raises(llm_backend.CassetteMiss):
+        llm_backend.structured_call("po_identifier", _messages("INVOICE 1"), lambda: PO, schema=ValidatedPO)
+
+
+def test_agent_replay_keys_on_file_content_not_path(monkeypatch, cassettes):
+    original = cassettes / "a" / "invoice.pdf"
+    original.parent.mkdir()
+    original.write_bytes(b"%PDF-1.4 invoice")
+    moved = cassettes / "b" / "invoice.pdf"
+    moved.parent.mkdir()
+    shutil.copy(original, moved)
+
+    class DummyAgent:
+        def invoke(self, agent_input, config=None):
+            return {"structured_response": PO, "messages": ["..."]}
+
+    monkeypatch.setenv("LLM_BACKEND", "record")
+    recorded = llm_backend.invoke_agent(
+        "invoice_extract",
+        DummyAgent(),
+        {"messages": [{"role": "user", "content": str(original)}]},
+        schema=ValidatedPO,
+        prompt="Extract.",
+        files=[original],
+    )
+    assert recorded["messages"] == ["..."]
+
+    monkeypatch.setenv("LLM_BACKEND", "replay")
+    replayed = llm_backend.invoke_agent(
+        "invoice_extract",
+        None,
+        {"messages": [{"role": "user", "content": str(moved)}]},
+        schema=ValidatedPO,
+        prompt="Extract.",
+        files=[moved],
+    )
+    assert replayed["structured_response"] == PO
+
+
+def test_runner_replay_returns_final_output(monkeypatch, cassettes):
+    class Result:
+        final_output = PO
+
+    async def live():
+        return Result()
+
+    kwargs = dict(schema=ValidatedPO, prompt="Extract.", agent_input="payline.xlsx")
+    monkeypatch.setenv("LLM_BACKEND", "record")
+    asyncio.run(llm_backend.run_agent("payline", live, **kwargs))
+
+    monkeypatch.setenv("LLM_BACKEND", "replay")
+    replayed = asyncio.run(llm_backend.run_agent("payline", live, **kwargs))
+    assert replayed.final_output == PO
@@ -0,0 +1,99 @@
+import fitz
+
+from app.bots.agents import multimodal
+from app.bots.voucher.models import ValidatedPO
+
+
+def _native_text_pdf(path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "INVOICE 9715824737  PO KERNH-0000227878  TOTAL 155.80")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _blank_pdf(path):
+    doc = fitz.open()
+    doc.new_page()
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _has_image(blocks):
+    return any(block["type"] == "image_url" for block in blocks)
+
+
+def test_hybrid_native_text_sends_no_image(tmp_path):
+    pdf = _native_text_pdf(tmp_path / "native.pdf")
+    calls = []
+
+    def invoke(blocks):
+        calls.append(blocks)
+        return ValidatedPO(po_id="0000227878", vendor_id="V001", vendor_name="GRAINGER", confidence=0.9)
+
+    with multimodal.track_document_modes() as stats:
+        result = multimodal.run_document_stage("po_identifier", pdf, invoke, mode="hybrid")
+
+    assert result.po_id == "0000227878"
+    assert len(calls) == 1
+    assert not _has_image(calls[0])
+    assert "9715824737" in calls[0][0]["text"]
+    summary = stats.summary()["po_identifier"]
+    assert summary["text_only"] == 1
+    assert summary["image_tokens_saved"] > 0
+
+
+def test_hybrid_escalates_to_image_on_low_confidence(tmp_path):
+    pdf = _native_text_pdf(tmp_path / "native.pdf")
+    calls = []
+
+    def invoke(blocks):
+        calls.append(blocks)
+        confidence = 0.95 if _has_image(blocks) else 0.2
+        return ValidatedPO(po_id="0000227878", vendor_id="V001", vendor_name="GRAINGER", confidence=confidence)
+
+    with multimodal.track_document_modes() as stats:
+        result = multimodal.run_document_stage("po_identifier", pdf, invoke, mode="hybrid")
+
+    assert result.confidence == 0.95
+    assert len(calls) == 2
+    assert _has_image(calls[1])
+    summary = stats.summary()["po_identifier"]
+    assert summary["escalations"] == 1
+    assert summary["image"] == 1
+
+
+def test_hybrid_escalates_to_image_on_validation_error(tmp_path):
+    pdf = _native_text_pdf(tmp_path / "native.pdf")
+    calls = []
+
+    def invoke(blocks):
+        calls.append(blocks)
+        if not _has_image(blocks):
+            raise ValueError("schema validation failed")
+        return "ok"
+
+    result = multimodal.run_document_stage("line_mapper", pdf, invoke, mode="hybrid")
+    assert result == "ok"
+    assert len(calls) == 2
+
+
+def test_hybrid_scanned_document_sends_image(tmp_path):
+    pdf = _blank_pdf(tmp_path / "scan.pdf")
+    calls = []
+
+    def invoke(blocks):
+        calls.append(blocks)
+        return "ok"
+
+    multimodal.run_document_stage("line_mapper", pdf, invoke, mode="hybrid")
+    assert len(calls) == 1
+    assert _has_image(calls[0])
+
+
+def test_estimate_image_tokens_tiles():
+    # 1024x1024 scales to 768x768 -> 4 tiles
+    assert multimodal.estimate_image_tokens(1024, 1024) == 85 + 170 * 4
+    assert multimodal.estimate_image_tokens(0, 100) == 0
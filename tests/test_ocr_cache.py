@@ -0,0 +1,80 @@
+import os
+
+import fitz
+
+from app.bots.utils import ocr
+
+
+def _two_page_pdf(path):
+    doc = fitz.open()
+    for label in ("first", "second"):
+        page = doc.new_page()
+        page.draw_rect(fitz.Rect(50, 50, 200, 120 if label == "first" else 160), fill=(0, 0, 0))
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_ocr_pdf_pages_caches_by_content(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_ocr_page(pdf_path, page_index, dpi, lang, psm):
+        calls.append((page_index, dpi, lang, psm))
+        return f"page {page_index}"
+
+    monkeypatch.setattr(ocr, "_ocr_page", fake_ocr_page)
+    monkeypatch.setattr(ocr, "OCR_WORKERS", 1)
+    monkeypatch.setattr(ocr, "ocr_cache", ocr.OcrCache(str(tmp_path / "cache")))
+
+    pdf = _two_page_pdf(tmp_path / "scan.pdf")
+    with fitz.open(pdf) as doc:
+        assert ocr.ocr_pdf_pages(pdf, doc, range(2), dpi=300) == ["page 0", "page 1"]
+        assert ocr.ocr_pdf_pages(pdf, doc, range(2), dpi=300) == ["page 0", "page 1"]
+    assert len(calls) == 2
+
+    # Different OCR parameters are a different cache entry
+    with fitz.open(pdf) as doc:
+        ocr.ocr_pdf_pages(pdf, doc, [0], dpi=200)
+    assert len(calls) == 3
+
+
+def test_ocr_cache_survives_restart(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(ocr, "_ocr_page", lambda *args: calls.append(args) or "cached text")
+    monkeypatch.setattr(ocr, "OCR_WORKERS", 1)
+
+    pdf = _two_page_pdf(tmp_path / "scan.pdf")
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setattr(ocr, "ocr_cache", ocr.OcrCache(cache_dir))
+    with fitz.open(pdf) as doc:
+        ocr.ocr_pdf_pages(pdf, doc, [0])
+
+    # Fresh in-memory cache reading the same directory (a re-run of the file)
+    monkeypatch.setattr(ocr, "ocr_cache", ocr.OcrCache(cache_dir))
+    with fitz.open(pdf) as doc:
+        assert ocr.ocr_pdf_pages(pdf, doc, [0]) == ["cached text"]
+    assert len(calls) == 1
+
+
+def test_ocr_cache_memory_is_an_lru(tmp_path):
+    cache = ocr.OcrCache(str(tmp_path / "ocr"), max_entries=2)
+    for n in range(3):
+        cache.set(f"k{n}", f"page {n}")
+    cache.get("k1")
+    cache.set("k3", "page 3")
+
+    assert list(cache._memory) == ["k1", "k3"]
+    assert cache.get("k0") == "page 0"
+    assert list(cache._memory) == ["k3", "k0"]
+
+
+def test_ocr_cache_directory_is_pruned_to_its_cap(tmp_path):
+    directory = tmp_path / "ocr"
+    cache = ocr.OcrCache(str(directory), max_mb=0.001)  # ~1 KB
+    for n in range(4):
+        cache.set(f"k{n}", "x" * 400)
+        os.utime(directory / f"k{n}.txt", (n, n))
+    ocr.OcrCache(str(directory)).get("k0")  # a hit on disk counts as a use
+
+    assert cache.prune() == 2
+    assert sorted(path.stem for path in directory.glob("*.txt")) == ["k0", "k3"]
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy
+from sqlalchemy.dialects import mssql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.bots import payline_entry
+from app.bots.utils.sql import values_table
+from app.schemas import PaylineExcelItem
+
+PS_SCHEMA = """
+CREATE TABLE PS_PAY_EARNINGS (
+    PAYGROUP TEXT, PAGE_NUM INT, LINE_NUM INT, OFF_CYCLE TEXT, SEPCHK INT,
+    PAY_END_DT TEXT, ADDL_NBR INT, EMPLID TEXT, EMPL_RCD INT,
+    EARNS_BEGIN_DT TEXT, EARNS_END_DT TEXT, REG_EARNS REAL
+);
+CREATE TABLE PS_PAY_OTH_EARNS (
+    PAYGROUP TEXT, PAGE_NUM INT, LINE_NUM INT, OFF_CYCLE TEXT, SEPCHK INT,
+    PAY_END_DT TEXT, ADDL_NBR INT, ERNCD TEXT, OTH_EARNS REAL
+);
+"""
+
+
+def _ps_engine(entered):
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    statements = []
+    with engine.begin() as conn:
+        for statement in PS_SCHEMA.split(";"):
+            if statement.strip():
+                conn.exec_driver_sql(statement)
+        for line, (emplid, erncd, amount) in enumerate(entered):
+            conn.exec_driver_sql(
+                "INSERT INTO PS_PAY_EARNINGS VALUES ('RSA', 1, ?, 'N', 0, '2025-08-31', 1, ?, 0, '2025-08-01', '2025-08-31', 0)",
+                (line, emplid),
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO PS_PAY_OTH_EARNS VALUES ('RSA', 1, ?, 'N', 0, '2025-08-31', 1, ?, ?)",
+                (line, erncd, amount),
+            )
+    sqlalchemy.event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return engine, statements
+
+
+def _payline(id, emplid, erncd="RSA", amount=813.18):
+    return SimpleNamespace(
+        id=id, emplid=emplid, empl_rcd=0, earnings_begin_dt="2025-08-01",
+        earnings_end_dt="2025-08-31", ern_ded_code=erncd, amount=amount,
+    )
+
+
+def test_entered_paylines_found_in_chunked_queries():
+    engine, statements = _ps_engine([("100001", "RSA", 813.18), ("100004", "RSA", 50.0)])
+    candidates = [
+        _payline(1, "100001"),
+        _payline(2, "100002"),
+        _payline(3, "100001", amount=1.0),
+        _payline(4, "100004", amount=50.0),
+        _payline(5, "100004", erncd="OTH", amount=50.0),
+    ]
+
+    entered = payline_entry.find_entered_paylines(candidates, chunk_size=2, engine=engine)
+
+    assert entered == {1, 4}
+    assert len(statements) == 3
+    assert payline_entry.find_entered_paylines([], engine=engine) == set()
+
+
+def test_entered_paylines_sql_is_valid_for_sql_server():
+    rows = ["(:k0, :e0, :r0, :b0, :d0, :c0, :a0)", "(:k1, :e1, :r1, :b1, :d1, :c1, :a1)"]
+    candidates = values_table("mssql", "C", payline_entry.ENTERED_PAYLINES_COLUMNS, rows)
+    query = payline_entry.ENTERED_PAYLINES_SQL.format(candidates=candidates)
+    compiled = sqlalchemy.text(query).compile(dialect=mssql.dialect())
+
+    # SQL Server only takes VALUES as a derived table with a column list, never as a CTE
+    assert "WITH" not in str(compiled).upper()
+    assert f"FROM (VALUES {rows[0]}, {rows[1]}) AS C (KEY_ID, EMPLID, EMPL_RCD," in str(compiled)
+    assert len(compiled.params) == 14
+
+
+def test_mark_paylines_status_updates_in_one_statement():
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    models.PaylineExcelItem.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    for emplid in ("1", "2", "3"):
+        db.add(models.PaylineExcelItem(tab_name="T", emplid=emplid, empl_rcd=0, ern_ded_code="RSA", amount=1.0, status="new"))
+    db.commit()
+    ids = [row.id for row in db.query(models.PaylineExcelItem).filter(models.PaylineExcelItem.emplid != "2")]
+
+    assert payline_entry.mark_paylines_status(db, ids, "processed") == 2
+    statuses = {row.emplid: row.status for row in db.query(models.PaylineExcelItem)}
+    assert statuses == {"1": "processed", "2": "new", "3": "processed"}
+    db.close()
+
+
+def _item(emplid, tab="Sheet1", amount=813.18):
+    return PaylineExcelItem(
+        tab_name=tab, hr_requestor="HR", month_requested="August", site="Kern High",
+        emplid=emplid, empl_rcd=0, ern_ded_code="RSA", amount=amount,
+        earnings_begin_dt="2025-08-01", earnings_end_dt="2025-08-31",
+    )
+
+
+def test_insert_missing_paylines_skips_known_keys():
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    models.PaylineExcelItem.__table__.create(engine)
+    statements = []
+    sqlalchemy.event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    db = sessionmaker(bind=engine)()
+
+    assert payline_entry.insert_missing_paylines(db, [_item("1"), _item("2"), _item("1")]) == 2
+    assert len(statements) == 2  # key lookup + one bulk insert
+
+    items = [_item("1"), _item("2"), _item("2", amount=5.0), _item("3", tab="Sheet2")]
+    assert payline_entry.insert_missing_paylines(db, items) == 2
+    assert db.query(models.PaylineExcelItem).count() == 4
+    assert {row.status for row in db.query(models.PaylineExcelItem)} == {"new"}
+
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        db.add(models.PaylineExcelItem(**_item("1").model_dump()))
+        db.commit()
+    db.close()
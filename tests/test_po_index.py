@@ -0,0 +1,81 @@
+import time
+
+from app.bots.voucher.po_index import POHeaderIndex
+
+
+def _header(po_id, vendor="GRAINGER"):
+    return {"po_id": po_id, "vendor_id": "0000001", "vendor_name": vendor, "status": "D", "business_unit": "KERNH"}
+
+
+HEADERS = [_header("0000227878"), _header("0000227879"), _header("CPO54496-A", "VESTIS"), _header("0000112233")]
+
+
+class _Sources:
+    def __init__(self, headers=HEADERS, live=None):
+        self.headers = list(headers)
+        self.live = live or {}
+        self.loads = 0
+        self.live_calls = []
+
+    def load(self):
+        self.loads += 1
+        return list(self.headers)
+
+    def search(self, pattern):
+        self.live_calls.append(pattern)
+        return self.live.get(pattern, [])
+
+
+def _index(sources, **kwargs):
+    return POHeaderIndex(loader=sources.load, live_search=sources.search, **kwargs)
+
+
+def test_like_patterns_are_served_from_memory():
+    sources = _Sources()
+    index = _index(sources)
+
+    assert [row["po_id"] for row in index.search("%227878%")] == ["0000227878"]
+    assert [row["po_id"] for row in index.search("%22787_")] == ["0000227878", "0000227879"]
+    assert [row["po_id"] for row in index.search("cpo54496%")] == ["CPO54496-A"]
+    assert sources.loads == 1
+    assert sources.live_calls == []
+
+
+def test_miss_falls_back_to_live_sql_then_fuzzy():
+    new_po = _header("0000999001")
+    sources = _Sources(live={"%999001%": [new_po]})
+    index = _index(sources)
+
+    assert index.search("%999001%") == [new_po]
+
+    fuzzy = index.search("KERNH-0000227878")
+    assert fuzzy[0]["po_id"] == "0000227878"
+    assert fuzzy[0]["score"] >= 0.9
+    assert [row["po_id"] for row in index.search("CP054496-A")] == ["CPO54496-A"]  # O read as 0
+    assert index.search("%555555%") == []
+    assert sources.live_calls == ["%999001%", "KERNH-0000227878", "CP054496-A", "%555555%"]
+
+
+def test_stale_index_refreshes_in_background():
+    sources = _Sources()
+    index = _index(sources, ttl=0.05)
+    assert index.search("%227878%")
+    sources.headers.append(_header("0000445566"))
+    time.sleep(0.06)
+
+    index.search("%445566%")  # served from the stale index (live fallback) while reloading
+    deadline = time.monotonic() + 2
+    while sources.loads < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert [row["po_id"] for row in index.match("%445566%")] == ["0000445566"]
+
+
+def test_failed_load_uses_live_search():
+    sources = _Sources(live={"%227878%": [HEADERS[0]]})
+
+    def broken():
+        raise RuntimeError("PS down")
+
+    index = POHeaderIndex(loader=broken, live_search=sources.search)
+    assert index.search("%227878%") == [HEADERS[0]]
@@ -0,0 +1,84 @@
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.bots.voucher import po_sql
+from app.bots.voucher.vendor_detection import referenced_po_ids
+
+PS_SCHEMA = """
+CREATE TABLE PS_PO_LINE (BUSINESS_UNIT TEXT, PO_ID TEXT, LINE_NBR INT, DESCR254_MIXED TEXT);
+CREATE TABLE PS_PO_LINE_SHIP (BUSINESS_UNIT TEXT, PO_ID TEXT, LINE_NBR INT, SCHED_NBR INT);
+CREATE TABLE PS_PO_LINE_DISTRIB (
+    BUSINESS_UNIT TEXT, PO_ID TEXT, LINE_NBR INT, SCHED_NBR INT, DISTRIB_LINE_NUM INT,
+    MERCHANDISE_AMT REAL, ACCOUNT TEXT, FUND_CODE TEXT, PROGRAM_CODE TEXT
+);
+"""
+
+
+@pytest.fixture
+def ps(monkeypatch):
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        for statement in PS_SCHEMA.split(";"):
+            if statement.strip():
+                conn.exec_driver_sql(statement)
+        for po_id, lines in (("CPO54496-A", 3), ("0000227878", 2)):
+            for line in range(1, lines + 1):
+                conn.exec_driver_sql("INSERT INTO PS_PO_LINE VALUES ('KERNH', ?, ?, ?)", (po_id, line, f"LINE {line}"))
+                conn.exec_driver_sql("INSERT INTO PS_PO_LINE_SHIP VALUES ('KERNH', ?, ?, 1)", (po_id, line))
+                conn.exec_driver_sql(
+                    "INSERT INTO PS_PO_LINE_DISTRIB VALUES ('KERNH', ?, ?, 1, 1, 100.0, '4300', '0100', '000')",
+                    (po_id, line),
+                )
+    statements = []
+    sqlalchemy.event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    monkeypatch.setattr(po_sql, "SessionLocalPS", sessionmaker(bind=engine))
+    monkeypatch.setattr(po_sql, "po_lines_cache", po_sql.POLinesCache(ttl=60))
+    return statements
+
+
+def test_repeat_loads_are_served_from_cache(ps):
+    first = po_sql.load_po_lines("CPO54496-A")
+    assert [line.po_line for line in first] == [1, 2, 3]
+    first[0].amount = 0  # callers get copies
+
+    for _ in range(10):
+        again = po_sql.load_po_lines("CPO54496-A")
+    assert again[0].amount == 100.0
+    assert len(ps) == 1
+
+    po_sql.invalidate_po_lines("CPO54496-A")
+    po_sql.load_po_lines("CPO54496-A")
+    assert len(ps) == 2
+
+
+def test_batch_load_uses_one_query_and_fills_cache(ps):
+    lines = po_sql.load_po_lines_many(["CPO54496-A", "0000227878", "MISSING", "CPO54496-A"])
+
+    assert {po_id: len(po_lines) for po_id, po_lines in lines.items()} == {"CPO54496-A": 3, "0000227878": 2, "MISSING": 0}
+    assert len(ps) == 1
+    po_sql.load_po_lines("0000227878")
+    assert len(ps) == 1
+    po_sql.load_po_lines("MISSING")  # empty results aren't cached
+    assert len(ps) == 2
+
+
+def test_entries_expire_after_ttl(ps, monkeypatch):
+    monkeypatch.setattr(po_sql, "po_lines_cache", po_sql.POLinesCache(ttl=0))
+    po_sql.load_po_lines("CPO54496-A")
+    po_sql.load_po_lines("CPO54496-A")
+    assert len(ps) == 2
+
+
+def test_referenced_po_ids_reads_vendor_tables():
+    prompt = (
+        "Map accounts using the table below.\n\n"
+        "| account_id | po_on_invoice | po_to_use | po_line |\n"
+        "|---|---|---|---|\n"
+        "| 1 | KERN-CPO52155-3 | CPO54496-A | 17 |\n"
+        "| 2 | NO PO LISTED | CPO54496-A | 21 |\n"
+        "| 3 | NO PO LISTED | 0000227878 | 2 |\n"
+    )
+    assert referenced_po_ids({"extraction": prompt, "po_identifier": prompt}) == ["CPO54496-A", "0000227878"]
+    assert referenced_po_ids(None) == []
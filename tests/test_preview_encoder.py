@@ -0,0 +1,32 @@
+import base64
+import io
+
+from PIL import Image
+
+from app.bots.utils.ocr import encode_preview_b64
+
+
+def _noisy_page(width, height):
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    return Image.blend(Image.new("RGB", (width, height), "white"), noise, 0.5)
+
+
+def test_small_image_encodes_once():
+    stats = {}
+    b64 = encode_preview_b64(Image.new("RGB", (600, 800), "white"), max_chars=200_000, stats=stats)
+    assert b64
+    assert stats["encodes"] == 1
+
+
+def test_large_image_fits_budget_in_few_encodes():
+    stats = {}
+    b64 = encode_preview_b64(_noisy_page(2550, 3300), max_chars=200_000, stats=stats)
+    assert 0 < len(b64) <= 200_000
+    # the old 0.8x shrink loop needed 5 encodes for this page
+    assert stats["encodes"] <= 3
+    img = Image.open(io.BytesIO(base64.b64decode(b64)))
+    assert img.format == "JPEG"
+
+
+def test_unreachable_budget_returns_empty():
+    assert encode_preview_b64(_noisy_page(1200, 1600), max_chars=100) == ""
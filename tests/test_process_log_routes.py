@@ -0,0 +1,106 @@
+import json
+
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import database, models
+from app.main import app
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    db_path = tmp_path / "app.db"
+    engine = sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    models.Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        for n in range(1, 8):
+            db.add(models.BotProcessLog(runid="run-a" if n % 2 else "run-b", filename=f"{n}.pdf", status="success"))
+        db.add(models.RunSummary(runid="run-a", processed=4, success=3, failure=1))
+        db.add(models.RunSummary(runid="run-b", processed=3, success=2, duplicate=1))
+        db.add(models.BotRun(runid="run-a", bot_name="voucher_entry", status="completed"))
+        db.add(models.BotRun(runid="run-b", bot_name="payline_entry", status="running"))
+        db.commit()
+
+    def _get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # Read endpoints go through the real async session factory, on the same file
+    monkeypatch.setattr(database, "_async_engine", create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool))
+    monkeypatch.setattr(database, "_async_sessionmaker", None)
+    app.dependency_overrides[database.get_db] = _get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+    monkeypatch.setattr(database, "_async_sessionmaker", None)
+    engine.dispose()
+
+
+def test_process_logs_keyset_pages(client):
+    first = client.get("/process-logs", params={"limit": 3})
+    assert [row["id"] for row in first.json()] == [7, 6, 5]
+    cursor = first.headers["x-next-cursor"]
+
+    second = client.get("/process-logs", params={"limit": 3, "before_id": cursor})
+    assert [row["id"] for row in second.json()] == [4, 3, 2]
+    last = client.get("/process-logs", params={"limit": 3, "before_id": second.headers["x-next-cursor"]})
+    assert [row["id"] for row in last.json()] == [1]
+    assert "x-next-cursor" not in last.headers
+
+    run_b = client.get("/process-logs", params={"runid": "run-b"}).json()
+    assert [row["id"] for row in run_b] == [6, 4, 2]
+
+
+def test_process_logs_field_projection(client):
+    rows = client.get("/process-logs", params={"fields": "status", "limit": 2}).json()
+    assert rows == [{"id": 7, "status": "success"}, {"id": 6, "status": "success"}]
+    assert client.get("/process-logs", params={"fields": "secret"}).status_code == 400
+
+
+def test_process_logs_ndjson_export(client, monkeypatch):
+    from app.routes import process_log
+
+    monkeypatch.setattr(process_log, "EXPORT_CHUNK_SIZE", 2)
+    response = client.get("/process-logs/export", params={"runid": "run-a", "fields": "filename"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == [{"id": n, "filename": f"{n}.pdf"} for n in (7, 5, 3, 1)]
+
+
+def test_runids_come_from_runs_table(client):
+    assert client.get("/runids").json() == ["run-b", "run-a"]
+    assert client.get("/runids", params={"bot_name": "voucher_entry"}).json() == ["run-a"]
+
+
+def test_status_counts_read_run_summaries(client):
+    assert client.get("/runids/run-a/status_counts").json() == {
+        "processed": 4, "success": 3, "duplicate": 0, "failure": 1, "review_blocked": 0,
+    }
+    totals = client.get("/runids/status_counts", params={"runid": "run-"}).json()
+    assert (totals["processed"], totals["success"], totals["duplicate"]) == (7, 5, 1)
+    assert client.get("/runids/status_counts", params={"runid": "nope"}).status_code == 404
+
+
+def test_bot_run_reads(client):
+    runs = client.get("/bot-runs", params={"bot_name": "payline_entry"}).json()
+    assert [run["runid"] for run in runs] == ["run-b"]
+    assert client.get("/bot-runs/run-a").json()["status"] == "completed"
+    assert client.get("/bot-runs/missing").status_code == 404
+
+
+def test_async_url_derived_from_database_url(monkeypatch):
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    monkeypatch.setattr(database, "DATABASE_URL", "mssql+pyodbc://user:pw@host/db?driver=ODBC+Driver+17+for+SQL+Server")
+    assert database.async_database_url().startswith("mssql+aioodbc://user:pw@host/db?driver=")
+    monkeypatch.setattr(database, "DATABASE_URL", "sqlite:///app.db")
+    assert database.async_database_url() == "sqlite+aiosqlite:///app.db"
+    monkeypatch.setenv("ASYNC_DATABASE_URL", "sqlite+aiosqlite:///other.db")
+    assert database.async_database_url() == "sqlite+aiosqlite:///other.db"
+
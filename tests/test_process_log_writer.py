@@ -0,0 +1,141 @@
+import json
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.services import process_log_writer as plw
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(
+        engine,
+        tables=[
+            models.BotProcessLog.__table__,
+            models.DirectDepositProcessLog.__table__,
+            models.RunSummary.__table__,
+        ],
+    )
+    return sessionmaker(bind=engine)
+
+
+def _row(i):
+    return {"runid": "run-1", "filename": f"{i}.pdf", "voucher_id": str(i), "amount": 1.0, "invoice": str(i), "status": "success"}
+
+
+def _count(factory, model=models.BotProcessLog):
+    with factory() as session:
+        return session.query(model).count()
+
+
+def test_flushes_on_size(session_factory):
+    with plw.ProcessLogWriter(max_rows=3, max_interval=0, session_factory=session_factory) as writer:
+        writer.add(models.BotProcessLog, _row(1))
+        writer.add(models.BotProcessLog, _row(2))
+        assert _count(session_factory) == 0
+        writer.add(models.BotProcessLog, _row(3))
+        assert _count(session_factory) == 3
+        writer.add(models.BotProcessLog, _row(4))
+    assert _count(session_factory) == 4
+
+
+def test_flushes_on_time(session_factory):
+    writer = plw.ProcessLogWriter(max_rows=100, max_interval=0.05, session_factory=session_factory)
+    try:
+        writer.add(models.BotProcessLog, _row(1))
+        deadline = time.monotonic() + 2
+        while _count(session_factory) == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert _count(session_factory) == 1
+    finally:
+        writer.close()
+
+
+def test_flushes_when_run_raises(session_factory):
+    with pytest.raises(RuntimeError):
+        with plw.process_log_writer(max_rows=100, max_interval=0, session_factory=session_factory):
+            plw.write_process_log(models.BotProcessLog, _row(1))
+            plw.write_process_log(
+                models.DirectDepositProcessLog,
+                {"runid": "run-1", "emplid": "123456", "status": "failure", "success": False},
+            )
+            raise RuntimeError("cancelled mid-run")
+    assert _count(session_factory) == 1
+    assert _count(session_factory, models.DirectDepositProcessLog) == 1
+
+
+def test_failed_flush_keeps_rows(session_factory):
+    broken = sessionmaker(bind=create_engine("sqlite://"))  # no tables
+    writer = plw.ProcessLogWriter(max_rows=100, max_interval=0, session_factory=broken)
+    writer.add(models.BotProcessLog, _row(1))
+    assert writer.flush() == 0
+    assert writer.pending() == 1
+    writer._session_factory = session_factory
+    writer.close()
+    assert _count(session_factory) == 1
+
+
+def test_bad_row_does_not_block_the_others(session_factory, tmp_path):
+    writer = plw.ProcessLogWriter(
+        max_rows=100, max_interval=0, session_factory=session_factory, max_attempts=2, spool_dir=str(tmp_path)
+    )
+    # SQL Server rejects strings longer than the column; they are cut when added
+    writer.add(models.BotProcessLog, {**_row(1), "id": 1, "status": "failure Review reason: " + "x" * 400})
+    writer.add(models.BotProcessLog, {**_row(2), "id": 1})  # rejected by the DB
+    writer.add(models.BotProcessLog, _row(3))
+
+    assert writer.flush() == 2
+    assert writer.pending() == 1
+    writer.add(models.BotProcessLog, _row(4))
+    assert writer.flush() == 1
+    assert writer.pending() == 0
+    writer.close()
+
+    with session_factory() as session:
+        assert len(session.get(models.BotProcessLog, 1).status) == 255
+        assert session.query(models.RunSummary).one().processed == 3
+    [spooled] = [json.loads(line) for path in tmp_path.glob("*.jsonl") for line in path.read_text().splitlines()]
+    assert (spooled["model"], spooled["attempts"], spooled["row"]["filename"]) == ("BotProcessLog", 2, "2.pdf")
+
+
+def test_rows_unwritten_on_close_are_spooled(tmp_path):
+    broken = sessionmaker(bind=create_engine("sqlite://"))
+    writer = plw.ProcessLogWriter(max_rows=100, max_interval=0, session_factory=broken, spool_dir=str(tmp_path))
+    writer.add(models.BotProcessLog, _row(1))
+    writer.close()
+    [path] = tmp_path.glob("*.jsonl")
+    assert json.loads(path.read_text())["row"]["filename"] == "1.pdf"
+
+
+def test_flush_updates_run_summary(session_factory):
+    statuses = ["success", "duplicate", "failure", "failure Review reason: amount mismatch", "success"]
+    with plw.ProcessLogWriter(max_rows=2, max_interval=0, session_factory=session_factory) as writer:
+        for i, status in enumerate(statuses):
+            writer.add(models.BotProcessLog, {**_row(i), "status": status})
+        writer.add(models.DirectDepositProcessLog, {"runid": "run-2", "emplid": "1", "status": "error", "success": False})
+
+    with session_factory() as session:
+        summaries = {summary.runid: summary for summary in session.query(models.RunSummary)}
+    run_1 = summaries["run-1"]
+    assert (run_1.processed, run_1.success, run_1.duplicate, run_1.failure, run_1.review_blocked) == (5, 2, 1, 1, 1)
+    assert (summaries["run-2"].processed, summaries["run-2"].failure) == (1, 1)
+
+
+
+def test_rows_and_counters_are_published(session_factory, monkeypatch):
+    published = []
+    monkeypatch.setattr(plw, "publish_run_event", lambda runid, type, /, **data: published.append((runid, type, data)))
+    with plw.ProcessLogWriter(max_rows=10, max_interval=0, session_factory=session_factory) as writer:
+        writer.add(models.BotProcessLog, _row(1))
+        writer.add(models.DirectDepositProcessLog, {"runid": "run-1", "emplid": "1", "bank_account": "999", "status": "failure"})
+
+    results = [data for _, type, data in published if type == "result"]
+    assert [data["log"] for data in results] == ["BotProcessLog", "DirectDepositProcessLog"]
+    assert "bank_account" not in results[1]
+    counters = [(runid, data) for runid, type, data in published if type == "counters"]
+    assert counters == [("run-1", {"processed": 2, "success": 1, "duplicate": 0, "failure": 1, "review_blocked": 0})]
@@ -0,0 +1,36 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.bots.agents.prompt_layout import PromptLayout
+
+STATIC = "You are an AP invoice extraction agent."
+VESTIS = "| account_id | po_to_use |\n| 210000030 | CPO54496-A |"
+
+
+def test_static_prefix_then_vendor_block():
+    layout = PromptLayout(STATIC, VESTIS)
+    system = layout.system_prompt()
+    assert system.startswith(STATIC)
+    assert system.endswith(VESTIS)
+    assert PromptLayout(STATIC).system_prompt() == STATIC
+
+
+def test_document_content_comes_last():
+    blocks = [{"type": "text", "text": "INVOICE 9715824737"}]
+    messages = PromptLayout(STATIC, VESTIS).messages(blocks)
+    assert isinstance(messages[0], SystemMessage)
+    assert isinstance(messages[-1], HumanMessage)
+    assert messages[-1].content == blocks
+    assert "9715824737" not in messages[0].content
+
+
+def test_cache_key_is_stable_per_prefix():
+    vestis = PromptLayout(STATIC, VESTIS)
+    assert vestis.cache_key("extraction") == PromptLayout(STATIC, VESTIS).cache_key("extraction")
+    assert vestis.cache_key("extraction") != PromptLayout(STATIC).cache_key("extraction")
+    assert vestis.cache_key("extraction") != vestis.cache_key("po_identifier")
+
+
+def test_chat_model_sends_prompt_cache_key():
+    layout = PromptLayout(STATIC, VESTIS)
+    model = layout.chat_model("extraction", api_key="sk-test")
+    assert model.model_kwargs["prompt_cache_key"] == layout.cache_key("extraction")
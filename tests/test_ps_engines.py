@@ -0,0 +1,37 @@
+import pytest
+
+from app import database
+
+
+@pytest.fixture(autouse=True)
+def _fresh_registry():
+    database.dispose_ps_engines()
+    yield
+    database.dispose_ps_engines()
+
+
+def test_engines_are_created_lazily_and_shared(monkeypatch):
+    monkeypatch.setenv("PS_DB_URL", "sqlite://")
+    monkeypatch.setenv("PS_DB_URL_HCM", "sqlite://")
+    assert database._ps_engines == {}
+
+    fscm = database.get_ps_engine("fscm")
+    assert database.get_ps_engine("fscm") is fscm
+    assert database.get_ps_engine() is fscm
+    hcm = database.get_ps_engine("hcm")
+    assert hcm is not fscm
+    assert fscm.pool._pre_ping
+
+
+def test_sessions_bind_to_the_shared_engine(monkeypatch):
+    monkeypatch.setenv("PS_DB_URL", "sqlite://")
+    with database.SessionLocalPS() as session:
+        assert session.get_bind() is database.get_ps_engine("fscm")
+
+
+def test_missing_url_fails_on_first_use(monkeypatch):
+    monkeypatch.delenv("PS_DB_URL_HCM", raising=False)
+    with pytest.raises(RuntimeError, match="PS_DB_URL_HCM"):
+        database.get_ps_engine("hcm")
+    with pytest.raises(KeyError):
+        database.get_ps_engine("crm")
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import database, models
+from app.main import app
+from app.services import run_events
+from app.services.run_events import RunEventBus
+
+
+def test_bus_delivers_to_subscribers_across_threads():
+    bus = RunEventBus(history=3)
+
+    async def _listen():
+        with bus.subscribe("run-1") as queue:
+            thread = threading.Thread(target=lambda: [bus.publish("run-1", "result", n=n) for n in range(5)])
+            thread.start()
+            received = [await asyncio.wait_for(queue.get(), 1) for _ in range(5)]
+            thread.join()
+            return received
+
+    received = asyncio.run(_listen())
+    assert [event.data["n"] for event in received] == [0, 1, 2, 3, 4]
+    assert [event.data["n"] for event in bus.recent("run-1")] == [2, 3, 4]
+    assert bus.publish(None, "result") is None
+
+
+def _parse(stream_text):
+    events = []
+    for block in stream_text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"]), fields.get("id")))
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    db_path = tmp_path / "app.db"
+    engine = sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    models.Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(models.BotRun(runid="run-live", bot_name="voucher_v2_pipeline", status="running"))
+        db.add(models.BotRun(runid="run-done", bot_name="voucher_v2_pipeline", status="completed"))
+        db.add(models.BotProcessLog(runid="run-done", filename="a.pdf", voucher_id="123", status="success"))
+        db.add(models.RunSummary(runid="run-done", processed=1, success=1))
+        db.commit()
+    monkeypatch.setattr(database, "_async_engine", create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool))
+    monkeypatch.setattr(database, "_async_sessionmaker", None)
+    monkeypatch.setattr(run_events, "run_event_bus", RunEventBus())
+    from app.routes import bot_runs
+
+    monkeypatch.setattr(bot_runs, "run_event_bus", run_events.run_event_bus)
+    yield TestClient(app)
+    monkeypatch.setattr(database, "_async_sessionmaker", None)
+    engine.dispose()
+
+
+def test_finished_run_gets_db_snapshot(client):
+    response = client.get("/bot-runs/run-done/events")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    [(event, data, _)] = _parse(response.text)
+    assert event == "snapshot"
+    assert data["status"] == "completed"
+    assert data["counters"]["success"] == 1
+    assert [row["filename"] for row in data["results"]] == ["a.pdf"]
+    assert client.get("/bot-runs/missing/events").status_code == 404
+
+
+def test_live_events_stream_until_terminal_status(client):
+    bus = run_events.run_event_bus
+
+    def _bot():
+        time.sleep(0.3)
+        bus.publish("run-live", "stage", filename="a.pdf", stage="extraction")
+        bus.publish("run-other", "stage", filename="x.pdf", stage="extraction")
+        bus.publish("run-live", "result", filename="a.pdf", status="success")
+        bus.publish("run-live", "status", status="completed", message=None)
+
+    thread = threading.Thread(target=_bot)
+    thread.start()
+    response = client.get("/bot-runs/run-live/events")
+    thread.join()
+
+    events = _parse(response.text)
+    assert [event for event, _, _ in events] == ["snapshot", "stage", "result", "status"]
+    assert events[1][1]["stage"] == "extraction"
+    last_id = events[2][2]
+
+    # Reconnect after the result: only the missed events are replayed, from memory
+    resumed = _parse(client.get("/bot-runs/run-live/events", headers={"Last-Event-ID": last_id}).text)
+    assert [(event, data["status"]) for event, data, _ in resumed] == [("status", "completed")]
+
+
+def test_resumed_stream_polls_db_for_other_processes(client, monkeypatch, tmp_path):
+    from app.routes import bot_runs
+
+    monkeypatch.setattr(bot_runs, "EVENT_POLL_SECONDS", 0.05)
+    bus = run_events.run_event_bus
+    first = bus.publish("run-live", "stage", filename="a.pdf", stage="extraction")
+    bus.publish("run-live", "stage", filename="a.pdf", stage="entry")
+
+    def _worker():
+        # The run finishes in a worker process, so nothing reaches this bus
+        time.sleep(0.3)
+        engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+        with sessionmaker(bind=engine)() as db:
+            db.query(models.BotRun).filter(models.BotRun.runid == "run-live").update({"status": "completed"})
+            db.add(models.RunSummary(runid="run-live", processed=1, success=1))
+            db.commit()
+        engine.dispose()
+
+    thread = threading.Thread(target=_worker)
+    thread.start()
+    resumed = _parse(client.get("/bot-runs/run-live/events", headers={"Last-Event-ID": first.id}).text)
+    thread.join()
+
+    assert [event for event, _, _ in resumed] == ["stage", "counters", "status"]
+    assert resumed[1][1]["success"] == 1
+    assert resumed[2][1]["status"] == "completed"
@@ -0,0 +1,94 @@
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from app.services import usage
+
+
+def _llm_result(prompt_tokens, completion_tokens, model="gpt-5-mini-2025-08-07", cached_tokens=0):
+    message = AIMessage(
+        content="{}",
+        usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "input_token_details": {"cache_read": cached_tokens},
+        },
+        response_metadata={"model_name": model},
+    )
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+def _call(handler, prompt_tokens, completion_tokens, messages=None, cached_tokens=0):
+    run_id = uuid4()
+    handler.on_chat_model_start({"kwargs": {"model_name": "gpt-5-mini"}}, [messages or [HumanMessage(content="hi")]], run_id=run_id)
+    handler.on_llm_end(_llm_result(prompt_tokens, completion_tokens, cached_tokens=cached_tokens), run_id=run_id)
+
+
+def test_calls_are_attributed_and_rolled_up():
+    handler = usage.UsageCallbackHandler()
+    with usage.track_usage("run-1", persist=False) as collector:
+        with usage.usage_context(filename="a.pdf"):
+            with usage.usage_context(stage="extraction"):
+                _call(handler, 1000, 200)
+            with usage.usage_context(stage="po_identifier"):
+                _call(handler, 500, 100)
+        with usage.usage_context(filename="b.pdf", stage="extraction"):
+            _call(handler, 800, 100)
+
+    records = collector.snapshot()
+    assert [(r.runid, r.filename, r.stage) for r in records] == [
+        ("run-1", "a.pdf", "extraction"),
+        ("run-1", "a.pdf", "po_identifier"),
+        ("run-1", "b.pdf", "extraction"),
+    ]
+    summary = collector.summary()
+    assert summary["by_stage"]["extraction"]["prompt_tokens"] == 1800
+    assert summary["by_file"]["a.pdf"]["calls"] == 2
+    assert summary["total"]["total_tokens"] == 2700
+    # gpt-5-mini snapshot priced as gpt-5-mini: 2300 * 0.25 + 400 * 2.00 per 1M
+    assert summary["total"]["cost_usd"] == round((2300 * 0.25 + 400 * 2.00) / 1_000_000, 6)
+
+
+def test_image_blocks_are_counted(tmp_path):
+    import base64
+    import io
+
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (1024, 1024), "white").save(buf, format="JPEG")
+    b64 = base64.b64encode(buf.getvalue()).decode()
+    message = HumanMessage(
+        content=[
+            {"type": "text", "text": "invoice"},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
+        ]
+    )
+    handler = usage.UsageCallbackHandler()
+    with usage.track_usage(persist=False) as collector:
+        _call(handler, 900, 50, messages=[message])
+    assert collector.snapshot()[0].image_tokens == 85 + 170 * 4
+
+
+def test_failed_calls_are_not_recorded():
+    handler = usage.UsageCallbackHandler()
+    with usage.track_usage(persist=False) as collector:
+        run_id = uuid4()
+        handler.on_chat_model_start({}, [[HumanMessage(content="hi")]], run_id=run_id)
+        handler.on_llm_error(RuntimeError("boom"), run_id=run_id)
+    assert collector.snapshot() == []
+
+
+def test_cached_tokens_give_hit_rate_and_discount():
+    handler = usage.UsageCallbackHandler()
+    with usage.track_usage(persist=False) as collector:
+        with usage.usage_context(stage="extraction"):
+            _call(handler, 2000, 100)
+            _call(handler, 2000, 100, cached_tokens=1536)
+    extraction = collector.summary()["by_stage"]["extraction"]
+    assert extraction["cached_tokens"] == 1536
+    assert extraction["cache_hit_rate"] == round(1536 / 4000, 4)
+    records = collector.snapshot()
+    assert records[1].cost_usd < records[0].cost_usd
@@ -75,7 +75,7 @@ def test_run_extraction_monkeypatched(monkeypatch, tmp_path):
     monkeypatch.setattr(
         extraction_stage,
         "extract_to_schema",
-        lambda file_path, schema, prompt=None: sample_invoice,
+        lambda file_path, schema, prompt=None, **kwargs: sample_invoice,
     )
 
     # Create dummy file path
@@ -131,6 +131,17 @@ def test_generate_line_mapping_monkeypatched(monkeypatch):
     assert mapping.lines[0].amount == pytest.approx(75.1)
 
 
+class InvoiceLedgerStub:
+    def entered(self, keys):
+        return {}
+
+    def claim(self, key, **kwargs):
+        return None
+
+    def settle(self, claim, voucher_id):
+        pass
+
+
 def test_pipeline_run_v2_voucher(monkeypatch, tmp_path):
     # Patch pipeline components to isolate logic
     sample_invoice = _sample_invoice()
@@ -141,6 +152,8 @@ def test_pipeline_run_v2_voucher(monkeypatch, tmp_path):
     monkeypatch.setattr(pipeline, "detect_vendor", lambda fp, sp: ("GRAINGER", {"extraction": None, "po_identifier": None}))
     monkeypatch.setattr(pipeline, "run_extraction", lambda fp, extra_prompt=None: sample_invoice)
     monkeypatch.setattr(pipeline, "identify_po", lambda invoice, filepath, extra_prompt=None: validated_po)
+    monkeypatch.setattr(pipeline, "find_existing_voucher", lambda invoice, po: None)
+    monkeypatch.setattr(pipeline, "invoice_ledger", InvoiceLedgerStub())
     monkeypatch.setattr(pipeline, "load_po_lines", lambda po_id: po_lines)
     monkeypatch.setattr(pipeline, "generate_line_mapping", lambda invoice, lines, filepath, extra_prompt=None: line_map)
     monkeypatch.setattr(pipeline, "execute_voucher_entry", lambda page, plan: {"status": "ok", "plan": plan})
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import sqlalchemy
+from sqlalchemy.dialects import mssql
+from sqlalchemy.pool import StaticPool
+
+from app.bots.utils.sql import values_table
+from app.bots.voucher.preflight import (
+    DUPLICATE_VOUCHERS_COLUMNS,
+    DUPLICATE_VOUCHERS_SQL,
+    InvoiceKey,
+    check_purchase_orders,
+    find_duplicate_vouchers,
+    find_existing_voucher,
+    find_po_vendors,
+    split_purchase_order,
+)
+
+PS_SCHEMA = """
+CREATE TABLE PS_PO_HDR (BUSINESS_UNIT TEXT, PO_ID TEXT, VENDOR_ID TEXT, PO_STATUS TEXT);
+CREATE TABLE PS_PO_LINE (BUSINESS_UNIT TEXT, PO_ID TEXT, LINE_NBR INT, DESCR254_MIXED TEXT, CANCEL_STATUS TEXT);
+CREATE TABLE PS_VOUCHER (
+    BUSINESS_UNIT TEXT, VOUCHER_ID TEXT, VENDOR_ID TEXT, INVOICE_ID TEXT,
+    INVOICE_DT TEXT, GROSS_AMT REAL, ENTRY_STATUS TEXT
+);
+INSERT INTO PS_PO_HDR VALUES ('KERNH', '0001', '0000012345', 'D');
+INSERT INTO PS_PO_HDR VALUES ('KERNH', '0002', '0000067890', 'D');
+INSERT INTO PS_PO_HDR VALUES ('KERNH', '0003', '0000067890', 'C');
+INSERT INTO PS_PO_HDR VALUES ('OTHER', '0004', '0000067890', 'D');
+INSERT INTO PS_PO_LINE VALUES ('KERNH', '0001', 1, 'Rent fy26 portable 12', 'A');
+INSERT INTO PS_PO_LINE VALUES ('KERNH', '0002', 1, 'Rent FY25 portable 9', 'A');
+INSERT INTO PS_PO_LINE VALUES ('KERNH', '0002', 2, 'Rent FY26 portable 9', 'X');
+INSERT INTO PS_VOUCHER VALUES ('KERNH', '00100001', '0000012345', 'INV-1', '2025-08-01', 120.50, 'P');
+INSERT INTO PS_VOUCHER VALUES ('KERNH', '00100002', '0000012345', 'INV-2', '2025-07-01', 99.00, 'P');
+INSERT INTO PS_VOUCHER VALUES ('KERNH', '00100003', '0000067890', 'INV-3', '2025-08-05', 10.00, 'X');
+"""
+
+
+def _ps_engine():
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    statements = []
+    with engine.begin() as conn:
+        for statement in PS_SCHEMA.split(";"):
+            if statement.strip():
+                conn.exec_driver_sql(statement)
+    sqlalchemy.event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return engine, statements
+
+
+def test_duplicates_found_by_date_or_amount_in_chunked_queries():
+    engine, statements = _ps_engine()
+    invoices = [
+        # Vendor from the PO header, same date
+        InvoiceKey(invoice_id=" inv-1 ", invoice_date="08/01/2025", amount=1.0, po_id="KERNH-0001"),
+        # Different date, same amount
+        InvoiceKey(invoice_id="INV-2", invoice_date="2025-09-01", amount=99.0, vendor_id="0000012345"),
+        # Same number, nothing else matches
+        InvoiceKey(invoice_id="INV-2", invoice_date="2025-09-01", amount=5.0, po_id="KERNH-0001"),
+        # Deleted voucher
+        InvoiceKey(invoice_id="INV-3", invoice_date="2025-08-05", amount=10.0, po_id="KERNH-0002"),
+        # Another vendor's invoice number
+        InvoiceKey(invoice_id="INV-1", invoice_date="2025-08-01", amount=120.5, po_id="KERNH-0002"),
+        # Nothing to identify the vendor: not checked
+        InvoiceKey(invoice_id="INV-1", invoice_date="2025-08-01", amount=120.5),
+    ]
+
+    duplicates = find_duplicate_vouchers(invoices, chunk_size=2, engine=engine)
+
+    assert {index: dup.voucher_id for index, dup in duplicates.items()} == {0: "00100001", 1: "00100002"}
+    assert duplicates[0].describe() == "Duplicate of voucher KERNH/00100001"
+    assert len(statements) == 3
+
+
+def test_duplicate_vouchers_sql_is_valid_for_sql_server():
+    row = "(:k0, :v0, :p0, :i0, :d0, :a0)"
+    candidates = values_table("mssql", "C", DUPLICATE_VOUCHERS_COLUMNS, [row])
+    compiled = sqlalchemy.text(DUPLICATE_VOUCHERS_SQL.format(candidates=candidates)).compile(dialect=mssql.dialect())
+
+    # SQL Server only takes VALUES as a derived table with a column list, never as a CTE
+    assert "WITH" not in str(compiled).upper()
+    assert f"FROM (VALUES {row}) AS C (KEY_ID, VENDOR_ID, PO_ID, INVOICE_ID, INVOICE_DT, GROSS_AMT)" in str(compiled)
+    assert len(compiled.params) == 6
+
+
+def test_existing_voucher_for_pipeline_and_lookup_failures():
+    engine, _ = _ps_engine()
+    invoice = SimpleNamespace(invoice_number="INV-1", invoice_date="2025-08-01", total_amount=120.5)
+    po = SimpleNamespace(po_id="0001", vendor_id="0000012345")
+
+    assert find_existing_voucher(invoice, po, engine=engine).voucher_id == "00100001"
+
+    broken = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    assert find_existing_voucher(invoice, po, engine=broken) is None
+    assert find_duplicate_vouchers([InvoiceKey(invoice_id="")], engine=broken) == {}
+
+
+def test_purchase_order_problems_found_before_entry():
+    engine, statements = _ps_engine()
+    assert split_purchase_order(" KERNH_0005 ") == ("KERNH", "0005")
+    assert split_purchase_order("0001") == ("KERNH", "0001")
+
+    purchase_orders = ["KERNH-0001", "0002", "KERNH-0003", "KERNH-0004", "KERNH-9999", ""]
+    assert check_purchase_orders(purchase_orders, engine=engine) == {
+        2: "PO Completed",
+        3: "PO not in business unit KERNH",
+        4: "Invalid PO",
+        5: "No PO on invoice",
+    }
+    assert len(statements) == 1
+
+    # Class/Mobile: the rent line must be on an open PO line
+    problems = check_purchase_orders(purchase_orders[:2], rent_line="FY26", chunk_size=1, engine=engine)
+    assert problems == {1: "No FY26 Rent Line on PO"}
+    assert len(statements) == 5
+
+
+def test_po_vendors_resolved_per_business_unit():
+    engine, statements = _ps_engine()
+    vendors = find_po_vendors(["KERNH-0001", "0002", "KERNH-0004", "KERNH-9999", ""], engine=engine)
+    assert vendors == {0: "0000012345", 1: "0000067890"}
+    assert len(statements) == 1